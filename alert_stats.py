@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Incremental ChartInk alert aggregates
+Every accepted alert updates an in-memory per-scan, per-interval rollup
+(alert count, symbol frequency, trigger price stats). Deltas are flushed
+periodically to the chartink_alert_stats summary table, which merges them
+additively so several workers can flush independently. After each flush the
+totals are reloaded from that table, so every worker converges on the counts
+of all of them.
+"""
+
+import threading
+import time
+import logging
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Rollup:
+    """Running totals for one scan in one interval"""
+
+    __slots__ = ('alert_count', 'symbol_counts', 'price_count', 'price_sum', 'min_price', 'max_price')
+
+    def __init__(self):
+        self.alert_count = 0
+        self.symbol_counts = Counter()
+        self.price_count = 0
+        self.price_sum = 0.0
+        self.min_price = None
+        self.max_price = None
+
+    def add(self, stocks: List[str], prices: List[float]) -> None:
+        self.alert_count += 1
+        self.symbol_counts.update(stocks)
+        if prices:
+            self.price_count += len(prices)
+            self.price_sum += sum(prices)
+            low, high = min(prices), max(prices)
+            self.min_price = low if self.min_price is None else min(self.min_price, low)
+            self.max_price = high if self.max_price is None else max(self.max_price, high)
+
+    def merge(self, other: '_Rollup') -> None:
+        self.alert_count += other.alert_count
+        self.symbol_counts.update(other.symbol_counts)
+        self.price_count += other.price_count
+        self.price_sum += other.price_sum
+        for attr, pick in (('min_price', min), ('max_price', max)):
+            theirs = getattr(other, attr)
+            if theirs is not None:
+                mine = getattr(self, attr)
+                setattr(self, attr, theirs if mine is None else pick(mine, theirs))
+
+
+class AlertAggregator:
+    """
+    Per-scan rollups maintained at ingest. Reads are served from memory and
+    cached until the totals change, so /alerts/stats only touches the
+    database for the first read in a worker.
+    """
+
+    SNAPSHOT_CACHE_SIZE = 64  # distinct (scan_name, top) queries kept
+
+    def __init__(self, interval_minutes: int = 1440, retention_buckets: int = 7, tz: tzinfo = timezone.utc):
+        self.interval = timedelta(minutes=interval_minutes)
+        self.retention_buckets = retention_buckets
+        self.tz = tz
+        self._lock = threading.Lock()
+        self._totals: Dict[Tuple[str, datetime], _Rollup] = {}
+        self._pending: Dict[Tuple[str, datetime], _Rollup] = {}
+        self._version = 0
+        self._snapshot_cache: 'OrderedDict[tuple, Tuple[int, List[Dict]]]' = OrderedDict()
+        self._flusher = None
+        self.loaded_at: Optional[float] = None  # monotonic time of the last load()
+
+    def bucket_start(self, ts: datetime) -> datetime:
+        """Start of the interval containing ts, aligned to local midnight"""
+        local = ts.astimezone(self.tz)
+        midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        steps = (local - midnight) // self.interval
+        return midnight + steps * self.interval
+
+    def record(self, scan_name: str, stocks: List[str], prices: List[float], ts: Optional[datetime] = None) -> None:
+        key = (scan_name, self.bucket_start(ts or datetime.now(timezone.utc)))
+        with self._lock:
+            for rollups in (self._totals, self._pending):
+                rollup = rollups.get(key)
+                if rollup is None:
+                    rollup = rollups[key] = _Rollup()
+                rollup.add(stocks, prices)
+            self._version += 1
+
+    def snapshot(self, scan_name: Optional[str] = None, top: int = 10) -> List[Dict]:
+        """Rollups newest first, optionally for one scan. Cached per version."""
+        cache_key = (scan_name, top)
+        with self._lock:
+            cached = self._snapshot_cache.get(cache_key)
+            if cached and cached[0] == self._version:
+                self._snapshot_cache.move_to_end(cache_key)
+                return cached[1]
+
+            version = self._version
+            self._prune()
+            items = [
+                (key, rollup) for key, rollup in self._totals.items()
+                if scan_name is None or key[0] == scan_name
+            ]
+            stats = [self._describe(key, rollup, top) for key, rollup in items]
+
+        stats.sort(key=lambda s: (s['bucket_start'], s['alert_count']), reverse=True)
+        with self._lock:
+            self._snapshot_cache[cache_key] = (version, stats)
+            self._snapshot_cache.move_to_end(cache_key)
+            while len(self._snapshot_cache) > self.SNAPSHOT_CACHE_SIZE:
+                self._snapshot_cache.popitem(last=False)
+        return stats
+
+    @staticmethod
+    def _describe(key: Tuple[str, datetime], rollup: _Rollup, top: int) -> Dict:
+        scan_name, bucket = key
+        avg = round(rollup.price_sum / rollup.price_count, 2) if rollup.price_count else None
+        return {
+            'scan_name': scan_name,
+            'bucket_start': bucket.isoformat(),
+            'alert_count': rollup.alert_count,
+            'distinct_symbols': len(rollup.symbol_counts),
+            'top_symbols': rollup.symbol_counts.most_common(top),
+            'avg_trigger_price': avg,
+            'min_trigger_price': rollup.min_price,
+            'max_trigger_price': rollup.max_price,
+        }
+
+    def _prune(self) -> None:
+        cutoff = self.bucket_start(datetime.now(timezone.utc)) - self.interval * (self.retention_buckets - 1)
+        for key in [k for k in self._totals if k[1] < cutoff]:
+            del self._totals[key]
+
+    def drain_deltas(self) -> List[Dict]:
+        """Take everything recorded since the last flush as summary-table rows"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return [
+            {
+                'scan_name': scan_name,
+                'bucket_start': bucket.isoformat(),
+                'alert_count': rollup.alert_count,
+                'symbol_counts': dict(rollup.symbol_counts),
+                'price_count': rollup.price_count,
+                'price_sum': rollup.price_sum,
+                'min_trigger_price': rollup.min_price,
+                'max_trigger_price': rollup.max_price,
+            }
+            for (scan_name, bucket), rollup in pending.items()
+        ]
+
+    @staticmethod
+    def _from_row(row: Dict) -> Tuple[Tuple[str, datetime], _Rollup]:
+        rollup = _Rollup()
+        rollup.alert_count = int(row['alert_count'])
+        rollup.symbol_counts = Counter({k: int(v) for k, v in (row.get('symbol_counts') or {}).items()})
+        rollup.price_count = int(row.get('price_count') or 0)
+        rollup.price_sum = float(row.get('price_sum') or 0)
+        if row.get('min_trigger_price') is not None:
+            rollup.min_price = float(row['min_trigger_price'])
+        if row.get('max_trigger_price') is not None:
+            rollup.max_price = float(row['max_trigger_price'])
+        return (row['scan_name'], datetime.fromisoformat(row['bucket_start'])), rollup
+
+    def restore(self, rows: List[Dict]) -> None:
+        """Put deltas back after a failed flush so the next one retries them"""
+        with self._lock:
+            for row in rows:
+                key, rollup = self._from_row(row)
+                self._pending.setdefault(key, _Rollup()).merge(rollup)
+
+    def load(self, rows: List[Dict]) -> None:
+        """
+        Replace totals with summary-table rows plus the deltas not flushed yet.
+        The table holds what every worker has flushed, so this is both the
+        warm start and the periodic catch-up with other workers.
+        """
+        with self._lock:
+            totals = {}
+            for row in rows:
+                key, rollup = self._from_row(row)
+                totals.setdefault(key, _Rollup()).merge(rollup)
+            for key, rollup in self._pending.items():
+                totals.setdefault(key, _Rollup()).merge(rollup)
+            self._totals = totals
+            self._version += 1
+            self.loaded_at = time.monotonic()
+
+    def flush(self, flush_fn: Callable[[List[Dict]], None]) -> int:
+        deltas = self.drain_deltas()
+        if not deltas:
+            return 0
+        try:
+            flush_fn(deltas)
+        except Exception as e:
+            logger.error(f"Failed to flush {len(deltas)} alert stat rollups: {e}")
+            self.restore(deltas)
+            return 0
+        return len(deltas)
+
+    def start_flusher(self, flush_fn: Callable[[List[Dict]], None], interval_seconds: float,
+                      load_fn: Optional[Callable[[], List[Dict]]] = None) -> None:
+        """
+        Start the background flush loop once per process. Called lazily from
+        the ingest and read paths so it runs in each forked worker, not the
+        master. With load_fn, totals are reloaded after every flush.
+        """
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(
+                target=self._flush_loop, args=(flush_fn, interval_seconds, load_fn),
+                name='alert-stats-flusher', daemon=True
+            )
+        self._flusher.start()
+
+    def _reload(self, load_fn) -> None:
+        try:
+            self.load(load_fn())
+        except Exception as e:
+            logger.warning(f"Could not reload alert stats: {e}")
+
+    def _flush_loop(self, flush_fn, interval_seconds, load_fn) -> None:
+        if load_fn and self.loaded_at is None:
+            self._reload(load_fn)
+        while True:
+            time.sleep(interval_seconds)
+            self.flush(flush_fn)
+            if load_fn:
+                self._reload(load_fn)
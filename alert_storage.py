@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Storage backends for the webhook server
+STORAGE_BACKEND=supabase (default) goes through supabase-py / PostgREST.
+STORAGE_BACKEND=postgres talks to Postgres directly (DATABASE_URL) through a
+bounded connection pool with prepared statements, multi-row
+INSERT ... RETURNING id and COPY for batches.
+
+Both backends return rows in the same JSON-friendly shape (ISO timestamps,
+floats for numerics), so callers cannot tell them apart.
+"""
+
+import os
+import io
+import csv
+import json
+import threading
+import logging
+import weakref
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ALERT_COLUMNS = (
+    'scan_name', 'scan_url', 'alert_name', 'stocks', 'trigger_prices', 'total_stocks',
+    'avg_trigger_price', 'min_trigger_price', 'max_trigger_price',
+    'processing_status', 'source_platform',
+)
+
+
+class AlertStorage:
+    """Operations the webhook server needs from the database"""
+
+    def insert_alert(self, alert_data: Dict) -> Optional[Dict]:
+        """Insert one alert and return the stored row (None if nothing was stored)"""
+        raise NotImplementedError
+
+    def insert_alerts(self, alerts: List[Dict]) -> List[int]:
+        """Insert a batch of alerts in one round trip and return their ids in order"""
+        raise NotImplementedError
+
+    def recent_alerts(self, limit: int, since: Optional[str] = None, before: Optional[str] = None) -> List[Dict]:
+        """
+        Newest alerts first. since/before (ISO timestamps) bound created_at so
+        a partitioned table only scans the partitions in that window.
+        """
+        raise NotImplementedError
+
+    def discord_webhooks(self) -> List[Dict]:
+        """controls rows (strategy, discord_webhook_url) that have a webhook"""
+        raise NotImplementedError
+
+    def webhook_secrets(self) -> List[Dict]:
+        """controls rows (strategy, webhook_secret) that have an inbound webhook secret"""
+        raise NotImplementedError
+
+    def merge_alert_stats(self, deltas: List[Dict]) -> None:
+        raise NotImplementedError
+
+    def load_alert_stats(self, since: str) -> List[Dict]:
+        raise NotImplementedError
+
+    def claim_alerts(self, consumer: str, batch_size: int, lease_seconds: int, max_attempts: int = 5) -> List[Dict]:
+        """
+        Lease up to batch_size claimable alerts (new, or with an expired lease) to a consumer.
+        Expired leases of alerts already claimed max_attempts times are failed instead.
+        """
+        raise NotImplementedError
+
+    def ack_alerts(self, consumer: str, ids: List[int]) -> List[int]:
+        """Mark leased alerts processed. Returns the ids the consumer still held."""
+        raise NotImplementedError
+
+    def nack_alerts(self, consumer: str, ids: List[int], delay_seconds: int = 0, max_attempts: int = 5) -> List[int]:
+        """Release leased alerts for redelivery after delay_seconds (or fail them after max_attempts)"""
+        raise NotImplementedError
+
+    def delete_scan_alerts(self, scan_name: str) -> int:
+        """Delete every alert for a scan (test/benchmark cleanup)"""
+        raise NotImplementedError
+
+    def ping(self) -> None:
+        """Raise if the database is unreachable"""
+        raise NotImplementedError
+
+
+class SupabaseStorage(AlertStorage):
+    """PostgREST over HTTPS via supabase-py"""
+
+    def __init__(self, url: str, key: str, timeout_seconds: float = 5):
+        from supabase import create_client
+        from supabase.lib.client_options import ClientOptions
+        self.client = create_client(url, key, options=ClientOptions(postgrest_client_timeout=timeout_seconds))
+
+    def insert_alert(self, alert_data: Dict) -> Optional[Dict]:
+        result = self.client.table('chartink_alerts').insert(alert_data).execute()
+        return result.data[0] if result.data else None
+
+    def insert_alerts(self, alerts: List[Dict]) -> List[int]:
+        if not alerts:
+            return []
+        result = self.client.table('chartink_alerts').insert(alerts).execute()
+        return [row['id'] for row in result.data]
+
+    def recent_alerts(self, limit: int, since: Optional[str] = None, before: Optional[str] = None) -> List[Dict]:
+        query = self.client.table('chartink_alerts').select('*')
+        if since:
+            query = query.gte('created_at', since)
+        if before:
+            query = query.lt('created_at', before)
+        result = query.order('created_at', desc=True)\
+            .limit(limit)\
+            .execute()
+        return result.data
+
+    def discord_webhooks(self) -> List[Dict]:
+        result = self.client.table('controls')\
+            .select('strategy, discord_webhook_url')\
+            .not_.is_('discord_webhook_url', 'null')\
+            .execute()
+        return result.data
+
+    def webhook_secrets(self) -> List[Dict]:
+        result = self.client.table('controls')\
+            .select('strategy, webhook_secret')\
+            .not_.is_('webhook_secret', 'null')\
+            .execute()
+        return result.data
+
+    def merge_alert_stats(self, deltas: List[Dict]) -> None:
+        self.client.rpc('merge_chartink_alert_stats', {'deltas': deltas}).execute()
+
+    def load_alert_stats(self, since: str) -> List[Dict]:
+        result = self.client.table('chartink_alert_stats')\
+            .select('*')\
+            .gte('bucket_start', since)\
+            .execute()
+        return result.data
+
+    def claim_alerts(self, consumer: str, batch_size: int, lease_seconds: int, max_attempts: int = 5) -> List[Dict]:
+        result = self.client.rpc('claim_chartink_alerts', {
+            'p_consumer': consumer, 'p_batch_size': batch_size, 'p_lease_seconds': lease_seconds,
+            'p_max_attempts': max_attempts,
+        }).execute()
+        return result.data
+
+    def _rpc_scalars(self, function: str, params: Dict) -> list:
+        """
+        Call a function returning SETOF <scalar>. PostgREST answers with a bare
+        JSON array ([1, 2]), which supabase-py 1.x rejects (it only accepts
+        rows of objects), so this posts through its HTTP session directly.
+        """
+        from postgrest.exceptions import APIError
+        response = self.client.postgrest.session.post(f"/rpc/{function}", json=params)
+        if response.status_code >= 400:
+            try:
+                error = response.json()
+            except ValueError:
+                error = {'message': response.text[:200], 'code': str(response.status_code)}
+            raise APIError(error)
+        return response.json() or []
+
+    def ack_alerts(self, consumer: str, ids: List[int]) -> List[int]:
+        return self._rpc_scalars('ack_chartink_alerts', {'p_consumer': consumer, 'p_ids': ids})
+
+    def nack_alerts(self, consumer: str, ids: List[int], delay_seconds: int = 0, max_attempts: int = 5) -> List[int]:
+        return self._rpc_scalars('nack_chartink_alerts', {
+            'p_consumer': consumer, 'p_ids': ids,
+            'p_delay_seconds': delay_seconds, 'p_max_attempts': max_attempts,
+        })
+
+    def delete_scan_alerts(self, scan_name: str) -> int:
+        result = self.client.table('chartink_alerts').delete().eq('scan_name', scan_name).execute()
+        return len(result.data)
+
+    def ping(self) -> None:
+        self.client.table('chartink_alerts').select('id').limit(1).execute()
+
+
+def _json_value(value):
+    """Match PostgREST's JSON output for values psycopg2 returns natively"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, list):
+        return [_json_value(v) for v in value]
+    return value
+
+
+def _json_row(row) -> Dict:
+    return {key: _json_value(value) for key, value in row.items()}
+
+
+def _pg_array(values: list) -> str:
+    """Postgres array literal for COPY, e.g. {"A","B"}"""
+    items = []
+    for value in values:
+        text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        items.append(f'"{text}"')
+    return '{' + ','.join(items) + '}'
+
+
+class PostgresStorage(AlertStorage):
+    """
+    Direct Postgres access. At most max_connections queries run at once;
+    further callers block for a free connection instead of failing.
+    """
+
+    PREPARED_STATEMENTS = {
+        'chartink_insert_alert': (
+            "PREPARE chartink_insert_alert "
+            "(text, text, text, text[], numeric[], integer, numeric, numeric, numeric, text, text) AS "
+            f"INSERT INTO chartink_alerts ({', '.join(ALERT_COLUMNS)}) "
+            "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11) RETURNING *"
+        ),
+        'chartink_recent_alerts': (
+            "PREPARE chartink_recent_alerts (integer, timestamptz, timestamptz) AS "
+            "SELECT * FROM chartink_alerts WHERE created_at >= $2 AND created_at < $3 "
+            "ORDER BY created_at DESC LIMIT $1"
+        ),
+        'controls_discord_webhooks': (
+            "PREPARE controls_discord_webhooks AS "
+            "SELECT strategy, discord_webhook_url FROM controls WHERE discord_webhook_url IS NOT NULL"
+        ),
+    }
+
+    def __init__(self, dsn: str, min_connections: int = 1, max_connections: int = 8,
+                 statement_timeout_ms: int = 5000, connect_timeout_seconds: int = 5):
+        import psycopg2.extras
+        import psycopg2.pool
+        self._extras = psycopg2.extras
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            min_connections, max_connections, dsn,
+            options=f"-c statement_timeout={statement_timeout_ms}",
+            connect_timeout=connect_timeout_seconds,
+        )
+        # The stock pool closes a returned connection once minconn are idle,
+        # so only min_connections would stay warm (and prepared). minconn is
+        # only read there after the initial connections are opened.
+        self._pool.minconn = max_connections
+        self._slots = threading.BoundedSemaphore(max_connections)
+        # Connections with statements prepared. Weak, so a closed connection
+        # drops out and a new one at the same address is prepared again.
+        self._prepared = weakref.WeakSet()
+        self._prepared_lock = threading.Lock()
+
+    @contextmanager
+    def _cursor(self):
+        self._slots.acquire()
+        conn = self._pool.getconn()
+        try:
+            if conn not in self._prepared:
+                with conn.cursor() as cur:
+                    for statement in self.PREPARED_STATEMENTS.values():
+                        cur.execute(statement)
+                conn.commit()
+                with self._prepared_lock:
+                    self._prepared.add(conn)
+            with conn.cursor(cursor_factory=self._extras.RealDictCursor) as cur:
+                yield cur
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            if conn.closed:
+                with self._prepared_lock:
+                    self._prepared.discard(conn)
+            self._pool.putconn(conn, close=bool(conn.closed))
+            self._slots.release()
+
+    @staticmethod
+    def _values(alert_data: Dict) -> tuple:
+        return tuple(alert_data.get(column) for column in ALERT_COLUMNS)
+
+    def insert_alert(self, alert_data: Dict) -> Optional[Dict]:
+        with self._cursor() as cur:
+            cur.execute(
+                f"EXECUTE chartink_insert_alert ({', '.join(['%s'] * len(ALERT_COLUMNS))})",
+                self._values(alert_data),
+            )
+            row = cur.fetchone()
+        return _json_row(row) if row else None
+
+    def insert_alerts(self, alerts: List[Dict]) -> List[int]:
+        if not alerts:
+            return []
+        with self._cursor() as cur:
+            rows = self._extras.execute_values(
+                cur,
+                f"INSERT INTO chartink_alerts ({', '.join(ALERT_COLUMNS)}) VALUES %s RETURNING id",
+                [self._values(alert) for alert in alerts],
+                page_size=len(alerts),
+                fetch=True,
+            )
+        return [row['id'] for row in rows]
+
+    def copy_alerts(self, alerts: List[Dict]) -> int:
+        """Bulk load through COPY (fastest, but does not return ids)"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for alert in alerts:
+            writer.writerow([
+                _pg_array(value) if isinstance(value, list) else ('' if value is None else value)
+                for value in self._values(alert)
+            ])
+        buffer.seek(0)
+        with self._cursor() as cur:
+            cur.copy_expert(
+                f"COPY chartink_alerts ({', '.join(ALERT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+            return cur.rowcount
+
+    def recent_alerts(self, limit: int, since: Optional[str] = None, before: Optional[str] = None) -> List[Dict]:
+        with self._cursor() as cur:
+            cur.execute("EXECUTE chartink_recent_alerts (%s, %s, %s)",
+                        (limit, since or '-infinity', before or 'infinity'))
+            return [_json_row(row) for row in cur.fetchall()]
+
+    def discord_webhooks(self) -> List[Dict]:
+        with self._cursor() as cur:
+            cur.execute("EXECUTE controls_discord_webhooks")
+            return [dict(row) for row in cur.fetchall()]
+
+    def webhook_secrets(self) -> List[Dict]:
+        # Not prepared: the column is optional (see create_table.sql)
+        with self._cursor() as cur:
+            cur.execute("SELECT strategy, webhook_secret FROM controls WHERE webhook_secret IS NOT NULL")
+            return [dict(row) for row in cur.fetchall()]
+
+    def merge_alert_stats(self, deltas: List[Dict]) -> None:
+        with self._cursor() as cur:
+            cur.execute("SELECT merge_chartink_alert_stats(%s::jsonb)", (json.dumps(deltas),))
+
+    def load_alert_stats(self, since: str) -> List[Dict]:
+        with self._cursor() as cur:
+            cur.execute("SELECT * FROM chartink_alert_stats WHERE bucket_start >= %s", (since,))
+            return [_json_row(row) for row in cur.fetchall()]
+
+    def claim_alerts(self, consumer: str, batch_size: int, lease_seconds: int, max_attempts: int = 5) -> List[Dict]:
+        with self._cursor() as cur:
+            cur.execute("SELECT * FROM claim_chartink_alerts(%s, %s, %s, %s)",
+                        (consumer, batch_size, lease_seconds, max_attempts))
+            return [_json_row(row) for row in cur.fetchall()]
+
+    def ack_alerts(self, consumer: str, ids: List[int]) -> List[int]:
+        with self._cursor() as cur:
+            cur.execute("SELECT ack_chartink_alerts AS id FROM ack_chartink_alerts(%s, %s::bigint[])", (consumer, ids))
+            return [row['id'] for row in cur.fetchall()]
+
+    def nack_alerts(self, consumer: str, ids: List[int], delay_seconds: int = 0, max_attempts: int = 5) -> List[int]:
+        with self._cursor() as cur:
+            cur.execute(
+                "SELECT nack_chartink_alerts AS id FROM nack_chartink_alerts(%s, %s::bigint[], %s, %s)",
+                (consumer, ids, delay_seconds, max_attempts),
+            )
+            return [row['id'] for row in cur.fetchall()]
+
+    def delete_scan_alerts(self, scan_name: str) -> int:
+        with self._cursor() as cur:
+            cur.execute("DELETE FROM chartink_alerts WHERE scan_name = %s", (scan_name,))
+            return cur.rowcount
+
+    def ping(self) -> None:
+        with self._cursor() as cur:
+            cur.execute("SELECT 1")
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+
+def create_storage() -> AlertStorage:
+    """Build the backend selected by STORAGE_BACKEND"""
+    backend = os.getenv('STORAGE_BACKEND', 'supabase').lower()
+    if backend == 'postgres':
+        dsn = os.getenv('DATABASE_URL')
+        if not dsn:
+            raise ValueError("Missing DATABASE_URL for STORAGE_BACKEND=postgres")
+        logger.info("Using direct Postgres storage backend")
+        return PostgresStorage(
+            dsn,
+            min_connections=int(os.getenv('PG_POOL_MIN', 1)),
+            max_connections=int(os.getenv('PG_POOL_MAX', 8)),
+            statement_timeout_ms=int(os.getenv('PG_STATEMENT_TIMEOUT_MS', 5000)),
+            connect_timeout_seconds=int(os.getenv('PG_CONNECT_TIMEOUT_SECONDS', 5)),
+        )
+    if backend != 'supabase':
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+    url = os.getenv('SUPABASE_URL')
+    key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    if not url or not key:
+        raise ValueError("Missing Supabase configuration in environment variables")
+    return SupabaseStorage(url, key, timeout_seconds=float(os.getenv('SUPABASE_TIMEOUT_SECONDS', 5)))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark static vs adaptive concurrency under a replayed burst
+Replays an arrival schedule (by default a synthetic market-open burst)
+against a simulated I/O dependency that behaves like Supabase/Discord under
+load: calls slow down once more than --capacity are in flight and are
+refused (429) beyond --reject-above. Each arrival is one handler doing one
+dependency call, run through:
+
+  static-N     a fixed pool of N threads (2 workers x 4 threads = 8 today)
+  adaptive     a pool of --max-threads whose concurrency is an AIMDLimit
+               (concurrency.py), as the webhook server uses it
+
+and reports goodput, refused calls and end-to-end latency (arrival to
+completion, so time queued for a thread counts).
+
+Usage:
+    python3 bench_concurrency.py
+    python3 bench_concurrency.py --burst 3000 --burst-seconds 2 --capacity 24
+    python3 bench_concurrency.py --arrivals arrivals.txt   # one unix timestamp per line
+"""
+
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, List
+
+from concurrency import AIMDLimit, AdaptiveExecutor
+
+
+class SimulatedDependency:
+    """Processor-sharing service: latency scales with in-flight calls above capacity"""
+
+    def __init__(self, base_latency: float, capacity: int, reject_above: int, seed: int = 7):
+        self.base_latency = base_latency
+        self.capacity = capacity
+        self.reject_above = reject_above
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def call(self) -> bool:
+        """True if served, False if refused"""
+        with self._lock:
+            self.in_flight += 1
+            load = self.in_flight
+            jitter = self._random.uniform(0.8, 1.2)
+        try:
+            if load > self.reject_above:
+                time.sleep(self.base_latency * 0.1)
+                return False
+            time.sleep(self.base_latency * max(1.0, load / self.capacity) * jitter)
+            return True
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def burst_schedule(burst: int, burst_seconds: float, tail: int, tail_seconds: float) -> List[float]:
+    """Offsets (seconds) of each arrival: a dense burst followed by a quieter tail"""
+    offsets = [i * burst_seconds / burst for i in range(burst)]
+    offsets += [burst_seconds + i * tail_seconds / max(tail, 1) for i in range(tail)]
+    return offsets
+
+
+def load_schedule(path: str) -> List[float]:
+    with open(path) as f:
+        stamps = sorted(float(line) for line in f if line.strip())
+    return [stamp - stamps[0] for stamp in stamps]
+
+
+def replay(label: str, schedule: List[float], dependency: SimulatedDependency,
+           submit: Callable, shutdown: Callable) -> None:
+    """submit(handler, arrived) for each arrival at its offset, then report"""
+    latencies, refused = [], 0
+    lock = threading.Lock()
+
+    def handler(arrived: float) -> bool:
+        nonlocal refused
+        ok = dependency.call()
+        with lock:
+            latencies.append(time.perf_counter() - arrived)
+            refused += not ok
+        return ok
+
+    start = time.perf_counter()
+    futures = []
+    for offset in schedule:
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        futures.append(submit(handler, time.perf_counter()))
+    wait(futures)
+    elapsed = time.perf_counter() - start
+    shutdown()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    served = len(latencies) - refused
+    print(f"{label:<12} {served / elapsed:>8.0f} ok/s   refused {refused:>5}   "
+          f"p50 {p50:>8.1f} ms   p99 {p99:>8.1f} ms   ({elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Static vs adaptive concurrency under a burst')
+    parser.add_argument('--burst', type=int, default=2000, help='Arrivals in the burst')
+    parser.add_argument('--burst-seconds', type=float, default=2.0)
+    parser.add_argument('--tail', type=int, default=400, help='Arrivals after the burst')
+    parser.add_argument('--tail-seconds', type=float, default=4.0)
+    parser.add_argument('--arrivals', help='File of arrival timestamps to replay instead')
+    parser.add_argument('--latency-ms', type=float, default=50, help='Dependency latency when not loaded')
+    parser.add_argument('--capacity', type=int, default=32, help='Calls the dependency serves without slowing')
+    parser.add_argument('--reject-above', type=int, default=48, help='In-flight calls beyond which it answers 429')
+    parser.add_argument('--static', type=int, nargs='+', default=[8, 64], help='Fixed pool sizes to compare')
+    parser.add_argument('--max-threads', type=int, default=64)
+    parser.add_argument('--window', type=float, default=0.25, help='Controller window in seconds')
+    args = parser.parse_args()
+
+    schedule = load_schedule(args.arrivals) if args.arrivals else burst_schedule(
+        args.burst, args.burst_seconds, args.tail, args.tail_seconds)
+    print(f"{len(schedule)} arrivals over {schedule[-1]:.1f}s; dependency {args.latency_ms:.0f}ms, "
+          f"capacity {args.capacity}, 429 above {args.reject_above}")
+
+    def dependency():
+        return SimulatedDependency(args.latency_ms / 1000, args.capacity, args.reject_above)
+
+    for size in args.static:
+        pool = ThreadPoolExecutor(max_workers=size)
+        replay(f'static-{size}', schedule, dependency(), pool.submit, pool.shutdown)
+
+    limit = AIMDLimit('bench', 8, 2, args.max_threads, window_seconds=args.window)
+    executor = AdaptiveExecutor(limit)
+    # A refused call is the overload signal, as a Discord 429 is for deliveries
+    replay('adaptive', schedule, dependency(),
+           lambda fn, arrived: executor.submit(fn, arrived, overloaded_if=lambda ok: not ok),
+           executor.shutdown)
+    print(f"adaptive limit ended at {limit.limit} (decisions {dict(limit.decisions)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark alert inserts through the storage backends
+Writes synthetic alerts under a throwaway scan name, reports throughput and
+per-call latency, then deletes them again.
+
+Usage:
+    DATABASE_URL=postgresql://postgres@localhost/chartink python3 bench_storage.py --backend postgres
+    python3 bench_storage.py --backend supabase --rows 500 --threads 4
+"""
+
+import os
+import time
+import uuid
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+from dotenv import load_dotenv
+
+from alert_storage import PostgresStorage, create_storage
+
+# Load environment variables
+load_dotenv()
+
+
+def make_alerts(scan_name: str, count: int, stocks_per_alert: int) -> List[Dict]:
+    alerts = []
+    for i in range(count):
+        prices = [round(100 + i + j * 0.5, 2) for j in range(stocks_per_alert)]
+        alerts.append({
+            'scan_name': scan_name,
+            'scan_url': 'bench',
+            'alert_name': f'Bench alert {i}',
+            'stocks': [f'SYM{j}' for j in range(stocks_per_alert)],
+            'trigger_prices': prices,
+            'total_stocks': stocks_per_alert,
+            'avg_trigger_price': round(sum(prices) / len(prices), 2),
+            'min_trigger_price': min(prices),
+            'max_trigger_price': max(prices),
+            'processing_status': 'new',
+            'source_platform': 'Benchmark',
+        })
+    return alerts
+
+
+def run(label: str, calls: List[Callable[[], object]], rows: int, threads: int) -> None:
+    latencies = []
+
+    def timed(call):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(timed, calls))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{label:<14} {rows / elapsed:>10.0f} rows/s   p50 {p50:>8.2f} ms   p99 {p99:>8.2f} ms   ({len(calls)} calls)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark chartink_alerts inserts')
+    parser.add_argument('--backend', choices=['supabase', 'postgres'], default=os.getenv('STORAGE_BACKEND', 'supabase'))
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--stocks', type=int, default=5, help='Stocks per alert')
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    os.environ['STORAGE_BACKEND'] = args.backend
+    storage = create_storage()
+    scan_name = f'__bench_{uuid.uuid4().hex[:8]}'
+    alerts = make_alerts(scan_name, args.rows, args.stocks)
+    batches = [alerts[i:i + args.batch] for i in range(0, len(alerts), args.batch)]
+
+    print(f"Backend: {args.backend}, {args.rows} alerts x {args.stocks} stocks, {args.threads} threads")
+    try:
+        run('single insert', [lambda a=a: storage.insert_alert(a) for a in alerts], args.rows, args.threads)
+        run(f'batch x{args.batch}', [lambda b=b: storage.insert_alerts(b) for b in batches], args.rows, args.threads)
+        if isinstance(storage, PostgresStorage):
+            run(f'copy x{args.batch}', [lambda b=b: storage.copy_alerts(b) for b in batches], args.rows, args.threads)
+        run('recent(100)', [lambda: storage.recent_alerts(100) for _ in range(200)], 200, args.threads)
+    finally:
+        deleted = storage.delete_scan_alerts(scan_name)
+        print(f"Cleaned up {deleted} benchmark rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Client for the webhook server's alert work-claim API
+Lets a trading bot lease new ChartInk alerts, process them and ack/nack,
+long-polling the server instead of polling chartink_alerts directly.
+
+    from claim_client import AlertClaimClient
+
+    client = AlertClaimClient("https://starfish-app-khm7p.ondigitalocean.app", consumer="long-agent-1",
+                              token=os.environ["CLAIM_API_TOKEN"])  # one of the server's CLAIM_API_TOKENS
+    client.consume(handle_alert)  # handle_alert(alert) raising means nack
+"""
+
+import time
+import logging
+from typing import Callable, Dict, List, Optional
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class AlertClaimClient:
+    """Thin wrapper over POST /alerts/claim, /alerts/ack and /alerts/nack"""
+
+    def __init__(self, base_url: str, consumer: str, session: Optional[requests.Session] = None,
+                 token: Optional[str] = None):
+        self.base_url = base_url.rstrip('/')
+        self.consumer = consumer
+        self.session = session or requests.Session()
+        self.headers = {'Authorization': f"Bearer {token}"} if token else {}
+
+    def _post(self, path: str, body: Dict, timeout: float) -> Dict:
+        resp = self.session.post(f"{self.base_url}{path}", json={'consumer': self.consumer, **body},
+                                 headers=self.headers, timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def claim(self, batch_size: int = 10, lease_seconds: int = 60, wait_seconds: float = 20) -> List[Dict]:
+        """Lease up to batch_size alerts, waiting up to wait_seconds for new ones"""
+        body = {'batch_size': batch_size, 'lease_seconds': lease_seconds, 'wait_seconds': wait_seconds}
+        return self._post('/alerts/claim', body, timeout=wait_seconds + 10)['alerts']
+
+    def ack(self, ids: List[int]) -> List[int]:
+        return self._post('/alerts/ack', {'ids': ids}, timeout=10)['acked']
+
+    def nack(self, ids: List[int], delay_seconds: int = 0) -> List[int]:
+        return self._post('/alerts/nack', {'ids': ids, 'delay_seconds': delay_seconds}, timeout=10)['nacked']
+
+    def consume(self, handler: Callable[[Dict], None], batch_size: int = 10, lease_seconds: int = 60,
+                wait_seconds: float = 20, retry_delay_seconds: int = 30) -> None:
+        """Claim/handle/ack forever. Alerts whose handler raises are nacked for a delayed retry."""
+        while True:
+            try:
+                alerts = self.claim(batch_size, lease_seconds, wait_seconds)
+            except requests.RequestException as e:
+                logger.warning(f"Claim failed: {e}")
+                time.sleep(1)
+                continue
+
+            done, failed = [], []
+            for alert in alerts:
+                try:
+                    handler(alert)
+                    done.append(alert['id'])
+                except Exception as e:
+                    logger.error(f"Handler failed for alert {alert.get('id')}: {e}")
+                    failed.append(alert['id'])
+            try:
+                if done:
+                    self.ack(done)
+                if failed:
+                    self.nack(failed, retry_delay_seconds)
+            except requests.RequestException as e:
+                logger.warning(f"Ack/nack failed, leases will expire and redeliver: {e}")
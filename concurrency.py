@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Adaptive concurrency limits for I/O-bound work
+Nearly all of a webhook's time is spent waiting on Supabase and Discord, so
+the useful number of threads depends on how fast those are right now, not
+on the instance size. AIMDLimit re-decides a concurrency limit once per
+window from what the work itself reports:
+
+- latency well above the baseline (lowest recent latency), or work that
+  reported overload (timeouts, 429s, 5xx): multiplicative decrease
+- otherwise, if work queued for a slot: additive increase, or straight to
+  the Little's-law estimate (arrival rate x latency) if that is higher
+- otherwise: hold
+
+AdaptiveGate applies a limit to callers on their own threads (e.g. request
+handlers); AdaptiveExecutor is a thread pool sized to the upper bound whose
+tasks pass through a gate, so only `limit` of them run at once.
+"""
+
+import math
+import time
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_for
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INCREASE = 'increase'
+DECREASE = 'decrease'
+HOLD = 'hold'
+
+
+class AIMDLimit:
+    """A concurrency limit in [minimum, maximum], adjusted from latency and queueing samples"""
+
+    def __init__(self, name: str, initial: int, minimum: int, maximum: int, window_seconds: float = 1.0,
+                 backoff: float = 0.75, latency_tolerance: float = 2.0, queue_threshold: float = 0.005,
+                 on_adjust: Optional[Callable[['AIMDLimit', str, str], None]] = None):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.window_seconds = window_seconds
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.queue_threshold = queue_threshold
+        self.on_adjust = on_adjust
+        self.decisions: Counter = Counter()
+        self.baseline: Optional[float] = None
+        self.last = {'latency': None, 'queue_delay': None, 'little_estimate': None, 'reason': None}
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._arrivals = 0
+        self._latencies: List[float] = []
+        self._queue_delays: List[float] = []
+        self._overloads = 0
+
+    def arrived(self) -> None:
+        with self._lock:
+            self._arrivals += 1
+
+    def record(self, latency: float, queue_delay: float, overloaded: bool = False) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            self._queue_delays.append(queue_delay)
+            self._overloads += overloaded
+            now = time.monotonic()
+            if now - self._window_start < self.window_seconds:
+                return
+            elapsed = now - self._window_start
+            latencies, queue_delays, overloads, arrivals = (
+                self._latencies, self._queue_delays, self._overloads, self._arrivals)
+            self._latencies, self._queue_delays, self._overloads, self._arrivals = [], [], 0, 0
+            self._window_start = now
+            decision, reason = self._adjust(latencies, queue_delays, overloads, arrivals / elapsed)
+            self.last['reason'] = reason
+            self.decisions[decision] += 1
+        if decision != HOLD and self.on_adjust:
+            self.on_adjust(self, decision, reason)
+
+    def _adjust(self, latencies: List[float], queue_delays: List[float], overloads: int,
+                arrival_rate: float):
+        latencies.sort()
+        latency = latencies[len(latencies) // 2]
+        queue_delay = sum(queue_delays) / len(queue_delays)
+        little = arrival_rate * latency  # work in flight needed to keep up
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline += (latency - self.baseline) * 0.05  # let it follow a lasting slowdown
+        self.last = {'latency': latency, 'queue_delay': queue_delay, 'little_estimate': little, 'reason': None}
+
+        if overloads:
+            reason = f"{overloads} overloaded calls"
+        elif latency > self.latency_tolerance * self.baseline and latency > self.queue_threshold:
+            reason = f"latency {latency * 1000:.0f}ms vs baseline {self.baseline * 1000:.0f}ms"
+        else:
+            reason = None
+        if reason:
+            new_limit = max(self.minimum, int(self.limit * self.backoff))
+            decision = DECREASE
+        elif queue_delay > self.queue_threshold and self.limit < self.maximum:
+            new_limit = min(self.maximum, max(self.limit + 1, math.ceil(little)))
+            decision = INCREASE
+            reason = f"queue delay {queue_delay * 1000:.1f}ms, Little's estimate {little:.1f}"
+        else:
+            return HOLD, 'steady'
+        if new_limit == self.limit:
+            return HOLD, reason
+        self.limit = new_limit
+        return decision, reason
+
+    def snapshot(self) -> Dict:
+        return {
+            'limit': self.limit,
+            'min': self.minimum,
+            'max': self.maximum,
+            'baseline_seconds': self.baseline,
+            **self.last,
+            'decisions': dict(self.decisions),
+        }
+
+
+class Permit:
+    """One admitted unit of work. Set overloaded before releasing if it hit backpressure."""
+
+    __slots__ = ('started', 'queue_delay', 'overloaded')
+
+    def __init__(self, queue_delay: float):
+        self.started = time.monotonic()
+        self.queue_delay = queue_delay
+        self.overloaded = False
+
+
+class AdaptiveGate:
+    """Semaphore whose size is an AIMDLimit"""
+
+    def __init__(self, limit: AIMDLimit):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None, queued_since: Optional[float] = None) -> Optional[Permit]:
+        """Wait for a slot. Returns None on timeout."""
+        queued_since = queued_since or time.monotonic()
+        self.limit.arrived()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self.in_flight >= self.limit.limit:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+                self.in_flight += 1
+            finally:
+                self.waiting -= 1
+        return Permit(time.monotonic() - queued_since)
+
+    def release(self, permit: Permit) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()  # the limit may have grown by more than one
+        self.limit.record(time.monotonic() - permit.started, permit.queue_delay, permit.overloaded)
+
+    def run(self, fn: Callable, *args, overloaded_if: Optional[Callable[[object], bool]] = None,
+            queued_since: Optional[float] = None, **kwargs):
+        """fn(*args, **kwargs) inside a slot; overloaded_if(result) flags backpressure"""
+        permit = self.acquire(queued_since=queued_since)
+        try:
+            result = fn(*args, **kwargs)
+            if overloaded_if is not None:
+                permit.overloaded = bool(overloaded_if(result))
+            return result
+        except Exception:
+            permit.overloaded = True
+            raise
+        finally:
+            self.release(permit)
+
+
+class AdaptiveExecutor:
+    """Thread pool sized to the limit's maximum; at most limit.limit tasks run at once"""
+
+    def __init__(self, limit: AIMDLimit, thread_name_prefix: str = ''):
+        self.limit = limit
+        self.gate = AdaptiveGate(limit)
+        self._pool = ThreadPoolExecutor(max_workers=limit.maximum, thread_name_prefix=thread_name_prefix)
+        self._pending: Dict[Future, Tuple[Callable, tuple, dict]] = {}
+        self._pending_lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args, overloaded_if: Optional[Callable[[object], bool]] = None,
+               **kwargs) -> Future:
+        # Queue delay counts from submission, so time spent behind other tasks counts too
+        future = self._pool.submit(self.gate.run, fn, *args, overloaded_if=overloaded_if,
+                                   queued_since=time.monotonic(), **kwargs)
+        with self._pending_lock:
+            self._pending[future] = (fn, args, kwargs)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future: Future) -> None:
+        with self._pending_lock:
+            self._pending.pop(future, None)
+
+    def pending(self) -> int:
+        """Submitted tasks that have not finished"""
+        with self._pending_lock:
+            return len(self._pending)
+
+    def call(self, fn: Callable, *args, overloaded_if: Optional[Callable[[object], bool]] = None, **kwargs):
+        """Run on the calling thread, but inside the same limit"""
+        return self.gate.run(fn, *args, overloaded_if=overloaded_if, **kwargs)
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None) -> List[Tuple[Callable, tuple, dict]]:
+        """
+        Stop taking tasks. With a timeout, wait at most that long for the
+        submitted ones, then cancel those that have not started and return
+        them as (fn, args, kwargs) so the caller can park them elsewhere;
+        their futures raise CancelledError. Tasks already running finish in
+        the background.
+        """
+        if timeout is None:
+            self._pool.shutdown(wait=wait)
+            return []
+        with self._pending_lock:
+            futures = list(self._pending)
+        wait_for(futures, timeout=timeout)
+        with self._pending_lock:
+            pending = dict(self._pending)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        return [task for future, task in pending.items() if future.cancelled()]
@@ -37,3 +37,314 @@ CREATE TRIGGER update_chartink_alerts_updated_at
 
 -- Add RLS (Row Level Security) if needed
 -- ALTER TABLE chartink_alerts ENABLE ROW LEVEL SECURITY;
+
+-- ChartInk alert rollups, maintained incrementally by the webhook server
+-- (alert_stats.py). Each worker flushes deltas through
+-- merge_chartink_alert_stats(), which adds them to the existing row.
+CREATE TABLE IF NOT EXISTS chartink_alert_stats (
+    scan_name TEXT NOT NULL,
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+    alert_count INTEGER NOT NULL DEFAULT 0,
+    symbol_counts JSONB NOT NULL DEFAULT '{}',
+    price_count INTEGER NOT NULL DEFAULT 0,
+    price_sum NUMERIC NOT NULL DEFAULT 0,
+    min_trigger_price NUMERIC,
+    max_trigger_price NUMERIC,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (scan_name, bucket_start)
+);
+
+CREATE OR REPLACE FUNCTION merge_chartink_alert_stats(deltas JSONB)
+RETURNS VOID AS $$
+DECLARE
+    d JSONB;
+BEGIN
+    FOR d IN SELECT * FROM jsonb_array_elements(deltas) LOOP
+        INSERT INTO chartink_alert_stats AS s (
+            scan_name, bucket_start, alert_count, symbol_counts,
+            price_count, price_sum, min_trigger_price, max_trigger_price
+        ) VALUES (
+            d->>'scan_name',
+            (d->>'bucket_start')::TIMESTAMPTZ,
+            (d->>'alert_count')::INTEGER,
+            COALESCE(d->'symbol_counts', '{}'::JSONB),
+            (d->>'price_count')::INTEGER,
+            (d->>'price_sum')::NUMERIC,
+            (d->>'min_trigger_price')::NUMERIC,
+            (d->>'max_trigger_price')::NUMERIC
+        )
+        ON CONFLICT (scan_name, bucket_start) DO UPDATE SET
+            alert_count = s.alert_count + EXCLUDED.alert_count,
+            symbol_counts = COALESCE((
+                SELECT jsonb_object_agg(key, total)
+                FROM (
+                    SELECT key, SUM(value::INTEGER) AS total
+                    FROM (
+                        SELECT * FROM jsonb_each_text(s.symbol_counts)
+                        UNION ALL
+                        SELECT * FROM jsonb_each_text(EXCLUDED.symbol_counts)
+                    ) merged
+                    GROUP BY key
+                ) totals
+            ), '{}'::JSONB),
+            price_count = s.price_count + EXCLUDED.price_count,
+            price_sum = s.price_sum + EXCLUDED.price_sum,
+            min_trigger_price = LEAST(s.min_trigger_price, EXCLUDED.min_trigger_price),
+            max_trigger_price = GREATEST(s.max_trigger_price, EXCLUDED.max_trigger_price),
+            updated_at = NOW();
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Work claims for downstream consumers (POST /alerts/claim, /alerts/ack,
+-- /alerts/nack). Alerts are inserted with processing_status = 'new'; a
+-- consumer leases a batch ('claimed' until lease_expires_at), then acks
+-- ('processed') or nacks it. Expired leases become claimable again, until
+-- the alert has been claimed p_max_attempts times; then it is 'failed'.
+ALTER TABLE chartink_alerts ADD COLUMN IF NOT EXISTS processing_status TEXT NOT NULL DEFAULT 'new';
+ALTER TABLE chartink_alerts ADD COLUMN IF NOT EXISTS source_platform TEXT;
+ALTER TABLE chartink_alerts ADD COLUMN IF NOT EXISTS claimed_by TEXT;
+ALTER TABLE chartink_alerts ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE chartink_alerts ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+
+-- Only unfinished work is indexed, so the index stays small however large
+-- the history grows.
+CREATE INDEX IF NOT EXISTS idx_chartink_alerts_claimable ON chartink_alerts(id)
+    WHERE processing_status IN ('new', 'claimed');
+
+-- (before p_max_attempts was added, the function took three arguments)
+DROP FUNCTION IF EXISTS claim_chartink_alerts(TEXT, INTEGER, INTEGER);
+CREATE OR REPLACE FUNCTION claim_chartink_alerts(
+    p_consumer TEXT, p_batch_size INTEGER, p_lease_seconds INTEGER, p_max_attempts INTEGER DEFAULT 5
+)
+RETURNS SETOF chartink_alerts AS $$
+    -- A lease that expired on the last allowed attempt fails instead of
+    -- being redelivered, like a nack at p_max_attempts
+    UPDATE chartink_alerts
+    SET processing_status = 'failed', claimed_by = NULL, lease_expires_at = NULL
+    WHERE processing_status = 'claimed' AND lease_expires_at < NOW() AND attempts >= p_max_attempts;
+
+    UPDATE chartink_alerts a
+    SET processing_status = 'claimed',
+        claimed_by = p_consumer,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        attempts = a.attempts + 1
+    WHERE a.id IN (
+        SELECT id FROM chartink_alerts
+        WHERE processing_status IN ('new', 'claimed')
+          AND (processing_status = 'new' OR lease_expires_at < NOW())
+          AND attempts < p_max_attempts
+        ORDER BY id
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING a.*;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION ack_chartink_alerts(p_consumer TEXT, p_ids BIGINT[])
+RETURNS SETOF BIGINT AS $$
+    UPDATE chartink_alerts
+    SET processing_status = 'processed', lease_expires_at = NULL
+    WHERE id = ANY(p_ids) AND processing_status = 'claimed' AND claimed_by = p_consumer
+    RETURNING id;
+$$ LANGUAGE sql;
+
+-- A delayed nack keeps the row 'claimed' with a lease that expires after the
+-- delay, which is exactly when it becomes claimable again.
+CREATE OR REPLACE FUNCTION nack_chartink_alerts(
+    p_consumer TEXT, p_ids BIGINT[], p_delay_seconds INTEGER DEFAULT 0, p_max_attempts INTEGER DEFAULT 5
+)
+RETURNS SETOF BIGINT AS $$
+    UPDATE chartink_alerts
+    SET processing_status = CASE
+            WHEN attempts >= p_max_attempts THEN 'failed'
+            WHEN p_delay_seconds > 0 THEN 'claimed'
+            ELSE 'new'
+        END,
+        claimed_by = NULL,
+        lease_expires_at = CASE
+            WHEN attempts < p_max_attempts AND p_delay_seconds > 0 THEN NOW() + make_interval(secs => p_delay_seconds)
+            ELSE NULL
+        END
+    WHERE id = ANY(p_ids) AND processing_status = 'claimed' AND claimed_by = p_consumer
+    RETURNING id;
+$$ LANGUAGE sql;
+
+-- ============================================
+-- Time partitioning and retention
+-- ============================================
+-- Converts chartink_alerts into a table range-partitioned on created_at
+-- (monthly by default, or daily). Inserts land in the current partition,
+-- /alerts/recent only scans the newest ones, and old months are detached
+-- and archived by partition_maintenance.py instead of being deleted row by
+-- row. Run this section once; the existing rows are copied over and the old
+-- table is kept as chartink_alerts_legacy until you drop it.
+--
+-- Partitions are monthly unless the section is run after
+--   SET chartink.partition_interval = 'day';
+-- The interval can't change afterwards (day and month ranges would overlap),
+-- so run partition_maintenance.py with the matching --interval.
+--
+-- The rarely used total_stocks index is not recreated, so each insert now
+-- maintains the created_at and scan_name indexes of one small partition
+-- (plus the partial claimable index).
+
+-- Create one partition covering the period that contains p_day. Rows that
+-- already landed in the default partition for that period (e.g. when
+-- maintenance fell behind) would make CREATE ... PARTITION OF fail, so they
+-- are moved into the new table before it is attached. Inserts into the
+-- default partition wait for the move; the rest of the table stays writable.
+CREATE OR REPLACE FUNCTION create_chartink_alerts_partition(p_day DATE, p_interval TEXT DEFAULT 'month')
+RETURNS TEXT AS $$
+DECLARE
+    v_start DATE;
+    v_end DATE;
+    v_name TEXT;
+BEGIN
+    IF p_interval = 'day' THEN
+        v_start := p_day;
+        v_end := p_day + 1;
+        v_name := 'chartink_alerts_p' || to_char(v_start, 'YYYYMMDD');
+    ELSIF p_interval = 'month' THEN
+        v_start := date_trunc('month', p_day)::DATE;
+        v_end := (v_start + INTERVAL '1 month')::DATE;
+        v_name := 'chartink_alerts_p' || to_char(v_start, 'YYYYMM');
+    ELSE
+        RAISE EXCEPTION 'Unknown partition interval: %', p_interval;
+    END IF;
+
+    IF to_regclass(v_name) IS NOT NULL THEN
+        RETURN v_name;
+    END IF;
+
+    IF to_regclass('chartink_alerts_default') IS NOT NULL THEN
+        LOCK TABLE chartink_alerts_default IN EXCLUSIVE MODE;
+    END IF;
+    IF to_regclass('chartink_alerts_default') IS NULL OR NOT EXISTS (
+        SELECT 1 FROM chartink_alerts_default
+        WHERE created_at >= v_start::TIMESTAMPTZ AND created_at < v_end::TIMESTAMPTZ
+    ) THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF chartink_alerts FOR VALUES FROM (%L) TO (%L)',
+            v_name, v_start::TIMESTAMPTZ, v_end::TIMESTAMPTZ
+        );
+        RETURN v_name;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE chartink_alerts INCLUDING DEFAULTS)', v_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM chartink_alerts_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        v_start::TIMESTAMPTZ, v_end::TIMESTAMPTZ, v_name
+    );
+    -- Attaching builds the parent's indexes and clones its trigger
+    EXECUTE format(
+        'ALTER TABLE chartink_alerts ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        v_name, v_start::TIMESTAMPTZ, v_end::TIMESTAMPTZ
+    );
+    RETURN v_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Make sure the current period and p_ahead future periods exist
+CREATE OR REPLACE FUNCTION ensure_chartink_alerts_partitions(p_ahead INTEGER DEFAULT 2, p_interval TEXT DEFAULT 'month')
+RETURNS SETOF TEXT AS $$
+DECLARE
+    i INTEGER;
+    v_step INTERVAL := CASE WHEN p_interval = 'day' THEN INTERVAL '1 day' ELSE INTERVAL '1 month' END;
+BEGIN
+    FOR i IN 0..p_ahead LOOP
+        RETURN NEXT create_chartink_alerts_partition((CURRENT_DATE + v_step * i)::DATE, p_interval);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    v_day DATE;
+    v_interval TEXT := COALESCE(NULLIF(current_setting('chartink.partition_interval', true), ''), 'month');
+    v_step INTERVAL := CASE WHEN v_interval = 'day' THEN INTERVAL '1 day' ELSE INTERVAL '1 month' END;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'chartink_alerts'::regclass) THEN
+        RETURN;  -- already partitioned
+    END IF;
+
+    ALTER TABLE chartink_alerts RENAME TO chartink_alerts_legacy;
+    DROP TRIGGER IF EXISTS update_chartink_alerts_updated_at ON chartink_alerts_legacy;
+
+    CREATE TABLE chartink_alerts (LIKE chartink_alerts_legacy INCLUDING DEFAULTS)
+        PARTITION BY RANGE (created_at);
+    ALTER TABLE chartink_alerts ALTER COLUMN created_at SET NOT NULL;
+    -- The partition key has to be part of the primary key
+    ALTER TABLE chartink_alerts ADD PRIMARY KEY (id, created_at);
+    -- Keep the id sequence when the legacy table is dropped
+    ALTER SEQUENCE chartink_alerts_id_seq OWNED BY chartink_alerts.id;
+
+    CREATE TABLE chartink_alerts_default PARTITION OF chartink_alerts DEFAULT;
+
+    v_day := COALESCE((SELECT MIN(created_at)::DATE FROM chartink_alerts_legacy), CURRENT_DATE);
+    WHILE v_day <= CURRENT_DATE LOOP
+        PERFORM create_chartink_alerts_partition(v_day, v_interval);
+        v_day := (v_day + v_step)::DATE;
+    END LOOP;
+    PERFORM ensure_chartink_alerts_partitions(2, v_interval);
+
+    INSERT INTO chartink_alerts SELECT * FROM chartink_alerts_legacy;
+END $$;
+
+-- Defined on the parent, so every partition gets them
+CREATE INDEX IF NOT EXISTS idx_chartink_alerts_part_created_at ON chartink_alerts(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_chartink_alerts_part_scan_name ON chartink_alerts(scan_name, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_chartink_alerts_part_claimable ON chartink_alerts(id)
+    WHERE processing_status IN ('new', 'claimed');
+
+DROP TRIGGER IF EXISTS update_chartink_alerts_updated_at ON chartink_alerts;
+CREATE TRIGGER update_chartink_alerts_updated_at
+    BEFORE UPDATE ON chartink_alerts
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- claim_chartink_alerts returned the old table's row type; bind it to the
+-- partitioned table
+DROP FUNCTION IF EXISTS claim_chartink_alerts(TEXT, INTEGER, INTEGER);
+DROP FUNCTION IF EXISTS claim_chartink_alerts(TEXT, INTEGER, INTEGER, INTEGER);
+CREATE FUNCTION claim_chartink_alerts(
+    p_consumer TEXT, p_batch_size INTEGER, p_lease_seconds INTEGER, p_max_attempts INTEGER DEFAULT 5
+)
+RETURNS SETOF chartink_alerts AS $$
+    -- A lease that expired on the last allowed attempt fails instead of
+    -- being redelivered, like a nack at p_max_attempts
+    UPDATE chartink_alerts
+    SET processing_status = 'failed', claimed_by = NULL, lease_expires_at = NULL
+    WHERE processing_status = 'claimed' AND lease_expires_at < NOW() AND attempts >= p_max_attempts;
+
+    UPDATE chartink_alerts a
+    SET processing_status = 'claimed',
+        claimed_by = p_consumer,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        attempts = a.attempts + 1
+    WHERE a.id IN (
+        SELECT id FROM chartink_alerts
+        WHERE processing_status IN ('new', 'claimed')
+          AND (processing_status = 'new' OR lease_expires_at < NOW())
+          AND attempts < p_max_attempts
+        ORDER BY id
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING a.*;
+$$ LANGUAGE sql;
+
+-- Once the copy is verified:
+-- DROP TABLE chartink_alerts_legacy;
+
+-- ============================================
+-- Inbound webhook secrets
+-- ============================================
+-- Per-source secrets checked before a webhook body is parsed (see
+-- webhook_auth.py). One controls row per source, strategy = 'CHARTINK',
+-- 'TRADINGVIEW' or 'NOTION'; list several comma-separated secrets while
+-- rotating. Workers reload them every AUTH_KEYS_REFRESH_SECONDS.
+ALTER TABLE controls ADD COLUMN IF NOT EXISTS webhook_secret TEXT;
+
+-- INSERT INTO controls (strategy, webhook_secret) VALUES ('CHARTINK', '<long random token>');
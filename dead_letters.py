@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Dead-letter store for webhook requests that could not be processed
+Every failed ChartInk, TradingView or Notion request is kept with its raw
+body, path, headers, error and attempt count so it can be inspected and
+replayed through the same route once the cause is fixed.
+
+Layout (in DEAD_LETTER_DIR):
+    entries.jsonl  append-only, one JSON document per line
+    entries.idx    fixed-width index, one record per entry (id = position + 1)
+                   with the data offset, timestamp, route, status and attempts
+Listing and filtering by route/status/time only read the index. A replay
+that fails again appends a new version of the entry (with the new error)
+and repoints its index record; the data file is never rewritten.
+
+    python3 dead_letters.py list --route /webhook/tradingview --since 2026-10-19T09:15
+    python3 dead_letters.py show 42
+    python3 dead_letters.py replay --since 2026-10-19T09:15 --until 2026-10-19T09:45 \
+        --target http://localhost:8082 --rate 5 --workers 4
+
+Replays go through the server (HTTP, or app.test_client for the admin
+endpoint) with an X-Dead-Letter-Replay header, and the server marks the
+entry replayed or failed from the response. The server only honours that
+header alongside a valid X-Admin-Token, so the CLI needs ADMIN_TOKEN set.
+Webhook secrets (the ?token= query parameter and a TradingView "passphrase"
+in the body) are never stored; replays don't need them.
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import struct
+import argparse
+import threading
+import tempfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from webhook_auth import redact_passphrase
+
+logger = logging.getLogger(__name__)
+
+INDEX_RECORD = struct.Struct('<QIdBHH32s')  # offset, length, created_at, status, status_code, attempts, route
+REPLAY_HEADER = 'X-Dead-Letter-Replay'
+ADMIN_HEADER = 'X-Admin-Token'
+
+PENDING, REPLAYED, FAILED, DISCARDED = 0, 1, 2, 3
+STATUS_NAMES = {PENDING: 'pending', REPLAYED: 'replayed', FAILED: 'failed', DISCARDED: 'discarded'}
+STATUS_CODES = {name: code for code, name in STATUS_NAMES.items()}
+
+# Headers never worth keeping for a replay
+_SKIP_HEADERS = {'host', 'content-length', 'cookie', 'authorization', 'connection',
+                 REPLAY_HEADER.lower(), ADMIN_HEADER.lower()}
+# Query parameters carrying webhook secrets
+_SECRET_PARAMS = {'token'}
+
+
+def _scrub(document: Dict) -> Dict:
+    """Drop webhook secrets from a stored path and body"""
+    path = document.get('path', '')
+    if '?' in path:
+        base, query = path.split('?', 1)
+        params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k not in _SECRET_PARAMS]
+        path = f"{base}?{urlencode(params)}" if params else base
+    return {**document, 'path': path, 'body': redact_passphrase(document.get('body', ''))}
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds from an ISO timestamp (local time if no offset) or epoch string"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class DeadLetterStore:
+    """Append-only dead-letter file plus index, safe across worker processes"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.data_path = os.path.join(directory, 'entries.jsonl')
+        self.index_path = os.path.join(directory, 'entries.idx')
+        self._lock_path = os.path.join(directory, '.lock')
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock, open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        try:
+            return os.path.getsize(self.index_path) // INDEX_RECORD.size
+        except FileNotFoundError:
+            return 0
+
+    def _append_data(self, document: Dict) -> Tuple[int, int]:
+        line = (json.dumps(document, default=str) + '\n').encode()
+        with open(self.data_path, 'ab') as f:
+            offset = f.tell()
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        return offset, len(line)
+
+    def record(self, route: str, path: str, body: str, error: str, status_code: int = 0,
+               headers: Optional[Dict[str, str]] = None, attempts: int = 1) -> int:
+        """Store a failed request. Returns its id."""
+        created_at = time.time()
+        document = _scrub({
+            'route': route,
+            'path': path,
+            'headers': {k: v for k, v in (headers or {}).items() if k.lower() not in _SKIP_HEADERS},
+            'body': body,
+            'error': error,
+            'created_at': created_at,
+        })
+        with self._locked():
+            entry_id = len(self) + 1
+            offset, length = self._append_data({'id': entry_id, **document})
+            with open(self.index_path, 'ab') as f:
+                f.write(INDEX_RECORD.pack(offset, length, created_at, PENDING, status_code, attempts,
+                                          route.encode()[:32]))
+        return entry_id
+
+    def _read_index(self) -> List[Tuple]:
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        usable = len(data) - len(data) % INDEX_RECORD.size
+        return list(INDEX_RECORD.iter_unpack(data[:usable]))
+
+    def _read_document(self, offset: int, length: int) -> Dict:
+        with open(self.data_path, 'rb') as f:
+            f.seek(offset)
+            return _scrub(json.loads(f.read(length)))  # entries written before secrets were dropped
+
+    @staticmethod
+    def _summary(entry_id: int, record: Tuple) -> Dict:
+        _, _, created_at, status, status_code, attempts, route = record
+        return {
+            'id': entry_id,
+            'route': route.rstrip(b'\0').decode(),
+            'created_at': datetime.fromtimestamp(created_at).isoformat(timespec='seconds'),
+            'status': STATUS_NAMES.get(status, str(status)),
+            'status_code': status_code,
+            'attempts': attempts,
+        }
+
+    def get(self, entry_id: int) -> Optional[Dict]:
+        """Full entry (index fields plus stored body, headers and error)"""
+        if entry_id < 1:
+            return None
+        try:
+            with open(self.index_path, 'rb') as f:
+                f.seek((entry_id - 1) * INDEX_RECORD.size)
+                raw = f.read(INDEX_RECORD.size)
+        except FileNotFoundError:
+            return None
+        if len(raw) < INDEX_RECORD.size:
+            return None
+        record = INDEX_RECORD.unpack(raw)
+        document = self._read_document(record[0], record[1])
+        return {**document, **self._summary(entry_id, record)}
+
+    def list(self, route: Optional[str] = None, status: Optional[str] = None,
+             since: Optional[float] = None, until: Optional[float] = None,
+             error_contains: Optional[str] = None, ids: Optional[Iterable[int]] = None,
+             limit: Optional[int] = None, with_payload: bool = False) -> List[Dict]:
+        """Entries matching every given filter, oldest first. status may be comma-separated."""
+        wanted_ids = set(ids) if ids else None
+        statuses = {STATUS_CODES[name.strip()] for name in status.split(',')} if status else None
+        route_key = route.encode()[:32] if route else None
+        results = []
+        for position, record in enumerate(self._read_index()):
+            entry_id = position + 1
+            if wanted_ids is not None and entry_id not in wanted_ids:
+                continue
+            if route_key and record[6].rstrip(b'\0') != route_key:
+                continue
+            if statuses is not None and record[3] not in statuses:
+                continue
+            if since is not None and record[2] < since:
+                continue
+            if until is not None and record[2] >= until:
+                continue
+            if error_contains or with_payload:
+                entry = {**self._read_document(record[0], record[1]), **self._summary(entry_id, record)}
+                if error_contains and error_contains.lower() not in str(entry.get('error', '')).lower():
+                    continue
+                if not with_payload:
+                    entry = {**self._summary(entry_id, record), 'error': entry.get('error')}
+            else:
+                entry = self._summary(entry_id, record)
+            results.append(entry)
+            if limit and len(results) >= limit:
+                break
+        return results
+
+    def mark(self, entry_id: int, status: int, status_code: int = 0, error: Optional[str] = None) -> None:
+        """Record the outcome of a replay attempt"""
+        with self._locked():
+            with open(self.index_path, 'r+b') as f:
+                f.seek((entry_id - 1) * INDEX_RECORD.size)
+                raw = f.read(INDEX_RECORD.size)
+                if len(raw) < INDEX_RECORD.size:
+                    return
+                offset, length, created_at, _, _, attempts, route = INDEX_RECORD.unpack(raw)
+                if error is not None:
+                    document = self._read_document(offset, length)
+                    document['error'] = error
+                    document['replayed_at'] = time.time()
+                    offset, length = self._append_data(document)
+                if status != DISCARDED:
+                    attempts += 1
+                f.seek((entry_id - 1) * INDEX_RECORD.size)
+                f.write(INDEX_RECORD.pack(offset, length, created_at, status, status_code, attempts, route))
+
+
+def replay_entries(store: DeadLetterStore, entries: List[Dict],
+                   send: Callable[[Dict], Tuple[int, str]],
+                   rate_per_second: float = 5, workers: int = 4) -> Dict:
+    """
+    Replay entries (as returned by list(..., with_payload=True)) through
+    send(entry) -> (http_status, response_text), at most rate_per_second
+    requests started per second across workers threads. The server marks
+    each entry from the replay header; this only tallies the outcomes.
+    """
+    interval = 1.0 / rate_per_second if rate_per_second > 0 else 0
+    schedule_lock = threading.Lock()
+    next_start = [time.monotonic()]
+
+    def run(entry: Dict) -> Tuple[int, int, str]:
+        with schedule_lock:
+            start_at = next_start[0]
+            next_start[0] = max(start_at, time.monotonic()) + interval
+        delay = start_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            status_code, text = send(entry)
+        except Exception as e:
+            status_code, text = 0, str(e)
+            store.mark(entry['id'], FAILED, 0, f"replay failed: {e}")
+        return entry['id'], status_code, text
+
+    summary = {'attempted': 0, 'succeeded': 0, 'failed': 0, 'failures': []}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='dead-letter-replay') as pool:
+        for entry_id, status_code, text in pool.map(run, entries):
+            summary['attempted'] += 1
+            if 200 <= status_code < 300:
+                summary['succeeded'] += 1
+            else:
+                summary['failed'] += 1
+                summary['failures'].append({'id': entry_id, 'status_code': status_code, 'response': text[:200]})
+    return summary
+
+
+def create_dead_letter_store() -> DeadLetterStore:
+    return DeadLetterStore(os.getenv('DEAD_LETTER_DIR', os.path.join(tempfile.gettempdir(), 'dead_letters')))
+
+
+def _http_sender(target: str, timeout: float) -> Callable[[Dict], Tuple[int, str]]:
+    import requests
+    session = requests.Session()
+    admin_token = os.getenv('ADMIN_TOKEN', '')
+
+    def send(entry: Dict) -> Tuple[int, str]:
+        headers = {**entry.get('headers', {}), REPLAY_HEADER: str(entry['id']), ADMIN_HEADER: admin_token}
+        resp = session.post(target.rstrip('/') + entry['path'], data=entry['body'].encode(),
+                            headers=headers, timeout=timeout)
+        return resp.status_code, resp.text
+
+    return send
+
+
+def _add_filters(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--route', help='e.g. /webhook/chartink')
+    parser.add_argument('--status', help=f"Comma-separated, any of {', '.join(STATUS_CODES)}")
+    parser.add_argument('--since', help='ISO timestamp or epoch seconds (inclusive)')
+    parser.add_argument('--until', help='ISO timestamp or epoch seconds (exclusive)')
+    parser.add_argument('--error', help='Substring of the recorded error')
+    parser.add_argument('--ids', type=int, nargs='+', help='Only these entry ids')
+    parser.add_argument('--limit', type=int, help='Stop after this many entries')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and replay dead-lettered webhook requests')
+    parser.add_argument('--dir', default=None, help='Dead-letter directory (default: DEAD_LETTER_DIR)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    list_cmd = sub.add_parser('list', help='List entries')
+    _add_filters(list_cmd)
+    list_cmd.add_argument('--json', action='store_true', help='Print full entries as JSON lines')
+    show = sub.add_parser('show', help='Show one entry with its payload')
+    show.add_argument('id', type=int)
+    replay = sub.add_parser('replay', help='Replay matching entries through a running server')
+    _add_filters(replay)
+    replay.add_argument('--target', default=f"http://localhost:{os.getenv('PORT', 8082)}")
+    replay.add_argument('--rate', type=float, default=5, help='Requests started per second')
+    replay.add_argument('--workers', type=int, default=4)
+    replay.add_argument('--timeout', type=float, default=15)
+    replay.add_argument('--dry-run', action='store_true', help='Only print what would be replayed')
+    discard = sub.add_parser('discard', help='Mark entries as not worth replaying')
+    discard.add_argument('ids', type=int, nargs='+')
+    args = parser.parse_args()
+
+    store = DeadLetterStore(args.dir) if args.dir else create_dead_letter_store()
+
+    if args.command == 'show':
+        entry = store.get(args.id)
+        if not entry:
+            print(f"❌ No entry {args.id}")
+            sys.exit(1)
+        print(json.dumps(entry, indent=2, default=str))
+        return
+
+    if args.command == 'discard':
+        for entry_id in args.ids:
+            store.mark(entry_id, DISCARDED)
+        print(f"✅ Discarded {len(args.ids)} entries")
+        return
+
+    status = args.status or ('pending,failed' if args.command == 'replay' and not args.ids else None)
+    entries = store.list(args.route, status, _parse_time(args.since), _parse_time(args.until),
+                         args.error, args.ids, args.limit, with_payload=True)
+
+    if args.command == 'list':
+        for entry in entries:
+            if args.json:
+                print(json.dumps(entry, default=str))
+            else:
+                print(f"{entry['id']:>6}  {entry['created_at']}  {entry['status']:<9} "
+                      f"{entry['status_code'] or '-':>3}  x{entry['attempts']}  {entry['route']}  "
+                      f"{str(entry.get('error') or '')[:80]}")
+        print(f"{len(entries)} entries")
+        return
+
+    if not os.getenv('ADMIN_TOKEN'):
+        print("⚠️  ADMIN_TOKEN is not set: the server will treat replays as new requests")
+    print(f"Replaying {len(entries)} entries to {args.target} at {args.rate}/s with {args.workers} workers")
+    if args.dry_run or not entries:
+        return
+    summary = replay_entries(store, entries, _http_sender(args.target, args.timeout), args.rate, args.workers)
+    print(f"✅ {summary['succeeded']} replayed, ❌ {summary['failed']} failed")
+    for failure in summary['failures'][:20]:
+        print(f"  {failure['id']}: {failure['status_code']} {failure['response']}")
+    if summary['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Export chartink_alerts history to columnar files for backtesting
+Streams the table in keyset pages (id > last_id), explodes stocks /
+trigger_prices into one row per symbol and writes date-partitioned
+Parquet (or Arrow IPC) files:
+
+    <out>/date=2025-01-02/part-<first_id>-<last_id>.parquet
+
+Part files are renamed into place once complete, and a full export
+supersedes the parts already in each date it writes.
+
+Load a year with: pandas.read_parquet('<out>') or pyarrow.dataset.
+
+Usage:
+    python3 export_alerts.py --out exports/alerts                 # full export
+    python3 export_alerts.py --out exports/alerts --incremental   # only new complete days
+    python3 export_alerts.py --out exports/alerts --format arrow --since 2025-01-01
+
+Requires pyarrow (pip install pyarrow); it is not needed by the server.
+"""
+
+import os
+import sys
+import json
+import argparse
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional
+from zoneinfo import ZoneInfo
+from supabase import create_client, Client
+from dotenv import load_dotenv
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+
+# Load environment variables
+load_dotenv()
+
+STATE_FILE = '_export_state.json'
+COLUMNS = 'id, created_at, scan_name, scan_url, alert_name, stocks, trigger_prices, total_stocks, source_platform'
+
+
+def iter_alert_pages(supabase: Client, after_id: int, page_size: int, since: Optional[str]) -> Iterator[List[Dict]]:
+    """Yield pages of alerts ordered by id using keyset pagination"""
+    last_id = after_id
+    while True:
+        query = supabase.table('chartink_alerts').select(COLUMNS).gt('id', last_id)
+        if since:
+            query = query.gte('created_at', since)
+        page = query.order('id').limit(page_size).execute().data
+        if not page:
+            return
+        yield page
+        last_id = page[-1]['id']
+        if len(page) < page_size:
+            return
+
+
+class PartitionWriter:
+    """
+    Buffers exploded rows as columns per trading date and writes part files.
+    With replace, the first file written to a date partition supersedes the
+    part files an earlier run left there.
+    """
+
+    def __init__(self, out_dir: str, fmt: str, replace: bool = False):
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.replace = replace
+        self._written: Dict[str, set] = {}  # partition dir -> part files written by this run
+        self.buffers: Dict[date, Dict[str, list]] = {}
+        self.schema = pa.schema([
+            ('alert_id', pa.int64()),
+            ('created_at', pa.timestamp('us', tz='UTC')),
+            ('scan_name', pa.dictionary(pa.int32(), pa.string())),
+            ('scan_url', pa.dictionary(pa.int32(), pa.string())),
+            ('alert_name', pa.dictionary(pa.int32(), pa.string())),
+            ('source_platform', pa.dictionary(pa.int32(), pa.string())),
+            ('position', pa.int16()),
+            ('symbol', pa.dictionary(pa.int32(), pa.string())),
+            ('trigger_price', pa.float64()),
+            ('total_stocks', pa.int32()),
+        ])
+        self.files_written = 0
+        self.rows_written = 0
+
+    def add(self, alert: Dict, created_at: datetime, trading_date: date) -> None:
+        columns = self.buffers.get(trading_date)
+        if columns is None:
+            columns = self.buffers[trading_date] = {name: [] for name in self.schema.names}
+        prices = alert.get('trigger_prices') or []
+        for position, symbol in enumerate(alert.get('stocks') or []):
+            columns['alert_id'].append(alert['id'])
+            columns['created_at'].append(created_at)
+            columns['scan_name'].append(alert['scan_name'])
+            columns['scan_url'].append(alert['scan_url'])
+            columns['alert_name'].append(alert['alert_name'])
+            columns['source_platform'].append(alert.get('source_platform'))
+            columns['position'].append(position)
+            columns['symbol'].append(symbol)
+            columns['trigger_price'].append(float(prices[position]) if position < len(prices) else None)
+            columns['total_stocks'].append(alert['total_stocks'])
+
+    def flush(self, keep: Optional[date] = None) -> None:
+        """Write every buffered date except keep (the date still being read)"""
+        for trading_date in sorted(d for d in self.buffers if d != keep):
+            self._write(trading_date, self.buffers.pop(trading_date))
+
+    def _write(self, trading_date: date, columns: Dict[str, list]) -> None:
+        if not columns['alert_id']:
+            return
+        table = pa.table(columns, schema=self.schema)
+        partition = os.path.join(self.out_dir, f"date={trading_date.isoformat()}")
+        os.makedirs(partition, exist_ok=True)
+        name = f"part-{columns['alert_id'][0]}-{columns['alert_id'][-1]}.{self.fmt}"
+        # Dataset readers skip dot files, so a half-written part is never read
+        tmp_path = os.path.join(partition, f".{name}.tmp")
+        try:
+            if self.fmt == 'parquet':
+                pq.write_table(table, tmp_path, compression='zstd')
+            else:
+                with ipc.new_file(tmp_path, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, os.path.join(partition, name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        written = self._written.setdefault(partition, set())
+        written.add(name)
+        if self.replace:
+            for stale in os.listdir(partition):
+                if stale.startswith('part-') and stale not in written:
+                    os.remove(os.path.join(partition, stale))
+        self.files_written += 1
+        self.rows_written += table.num_rows
+
+
+def load_state(out_dir: str) -> Dict:
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {'last_id': 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(out_dir: str, state: Dict) -> None:
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def export_alerts(supabase: Client, out_dir: str, fmt: str = 'parquet', incremental: bool = False,
+                  since: Optional[str] = None, page_size: int = 1000, tz: str = 'Asia/Kolkata') -> Dict:
+    """
+    Export alerts to date partitions. In incremental mode the export resumes
+    after the last exported id and stops before the current (incomplete)
+    trading day, so every partition it writes is a whole day. A full export
+    replaces the existing files of each day it writes.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    market_tz = ZoneInfo(tz)
+    state = load_state(out_dir) if incremental else {'last_id': 0}
+    today = datetime.now(market_tz).date()
+    writer = PartitionWriter(out_dir, fmt, replace=not incremental)
+    if since and len(since) == 10:
+        # A bare date starts at midnight market time, so replaced days are whole days
+        since = datetime.combine(date.fromisoformat(since), datetime.min.time(), market_tz).isoformat()
+    last_id = state['last_id']
+    current_date = None
+
+    for page in iter_alert_pages(supabase, last_id, page_size, since):
+        for alert in page:
+            created_at = datetime.fromisoformat(alert['created_at'])
+            trading_date = created_at.astimezone(market_tz).date()
+            if incremental and trading_date >= today:
+                break
+            writer.add(alert, created_at, trading_date)
+            last_id = alert['id']
+            current_date = trading_date
+        else:
+            writer.flush(keep=current_date)
+            continue
+        break  # reached today's rows
+
+    writer.flush()
+    state.update({'last_id': last_id, 'exported_at': datetime.now(market_tz).isoformat()})
+    save_state(out_dir, state)
+    return {'files': writer.files_written, 'rows': writer.rows_written, 'last_id': last_id}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export chartink_alerts to partitioned Parquet/Arrow files')
+    parser.add_argument('--out', default='exports/chartink_alerts', help='Output directory')
+    parser.add_argument('--format', choices=['parquet', 'arrow'], default='parquet')
+    parser.add_argument('--incremental', action='store_true', help='Resume after the last export, complete days only')
+    parser.add_argument('--since', help='Only alerts created on/after this ISO date (midnight in --timezone)')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--timezone', default=os.getenv('MARKET_TIMEZONE', 'Asia/Kolkata'),
+                        help='Timezone used to assign trading dates')
+    args = parser.parse_args()
+
+    if pa is None:
+        print("❌ pyarrow is required for exports: pip install pyarrow")
+        sys.exit(1)
+
+    supabase: Client = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
+    summary = export_alerts(supabase, args.out, args.format, args.incremental, args.since, args.page_size, args.timezone)
+    print(f"✅ Exported {summary['rows']} rows into {summary['files']} files (last id {summary['last_id']})")
+
+
+if __name__ == "__main__":
+    main()
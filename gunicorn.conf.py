@@ -0,0 +1,52 @@
+"""
+gunicorn settings for the webhook server (Procfile / app.yaml run
+`gunicorn --config gunicorn.conf.py webhook_server:app`)
+
+Shutdown: on SIGTERM each worker starts draining (see lifecycle.py and
+"Graceful Shutdown and Resume" in webhook_server.py), gunicorn finishes the
+in-flight requests, then worker_exit runs the drain steps. The master kills
+workers graceful_timeout seconds after the signal, so keep
+SHUTDOWN_DRAIN_SECONDS below it.
+"""
+
+import os
+import sys
+import signal
+
+
+def _available_cpus() -> float:
+    """CPUs this container may use: the cgroup quota if set, else the usable cores"""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+# Ceiling per worker; REQUEST_CONCURRENCY_* adapt below it. About 8 threads per
+# CPU across all workers, so a 1 vCPU instance (basic-xxs) keeps 4 per worker.
+threads = int(os.getenv('GUNICORN_THREADS') or min(16, max(4, int(8 * _available_cpus()) // workers)))
+os.environ.setdefault('GUNICORN_THREADS', str(threads))  # the app sizes REQUEST_CONCURRENCY_MAX from it
+worker_class = 'gthread'
+worker_tmp_dir = '/dev/shm'
+timeout = 30
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', 30))
+accesslog = '-'
+
+
+def post_worker_init(worker):
+    # gunicorn's own SIGTERM handler only stops the accept loop; begin
+    # draining first so long polls and background loops wind down too
+    sys.modules['webhook_server'].lifecycle.install_signal_handler(signal.SIGTERM)
+
+
+def worker_exit(server, worker):
+    app_module = sys.modules.get('webhook_server')
+    if app_module is not None:  # not if the app failed to import
+        result = app_module.lifecycle.drain()
+        server.log.info(f"Worker {worker.pid} drained: {result}")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+HTTP caching helpers for polled read-only endpoints
+- etag_for() / etag_matches(): weak ETags built from a data version (so a
+  conditional request can be answered without touching the database) or
+  from the response body
+- MicroCache: keeps rendered responses for a second or so, and makes
+  concurrent misses for the same key wait for a single computation
+- negotiate_encoding(): gzip, or brotli when the optional brotli package is
+  installed, for bodies worth compressing
+"""
+
+import gzip
+import time
+import hashlib
+import threading
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def etag_for(*parts) -> str:
+    """Weak ETag over the given parts (version strings, request key or body bytes)"""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b'\0')
+    return f'W/"{digest.hexdigest()[:20]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison against an If-None-Match header (a list of tags, or *)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def negotiate_encoding(accept_encoding: Optional[str], size: int, min_bytes: int) -> Optional[str]:
+    """'br', 'gzip' or None for a body of `size` bytes"""
+    if size < min_bytes or not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.lower().split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+class CachedResponse:
+    """A rendered response body plus its compressed variants (built once each)"""
+
+    __slots__ = ('status', 'body', 'content_type', 'etag', 'headers', '_encoded', '_lock')
+
+    def __init__(self, status: int, body: bytes, content_type: str, etag: Optional[str],
+                 headers: Optional[Dict[str, str]] = None):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.etag = etag
+        self.headers = headers or {}
+        self._encoded: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.body
+        with self._lock:
+            data = self._encoded.get(encoding)
+            if data is None:
+                if encoding == 'br':
+                    data = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                else:
+                    data = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+                self._encoded[encoding] = data
+            return data
+
+
+class MicroCache:
+    """
+    Short-TTL cache with single flight: while one thread computes a key,
+    other threads asking for the same key wait for its result instead of
+    running the same query.
+    """
+
+    def __init__(self, ttl_seconds: float = 1.0, max_entries: int = 256, wait_seconds: float = 10.0):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self.wait_seconds = wait_seconds
+        self._entries: Dict[Hashable, Tuple[float, object]] = {}
+        self._inflight: Dict[Hashable, list] = {}  # key -> [Event, result]
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object],
+                       cacheable: Callable[[object], bool] = lambda value: True) -> Tuple[object, str]:
+        """(value, outcome) with outcome 'hit', 'shared' (waited for another thread) or 'miss'"""
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    return entry[1], 'hit'
+                flight = self._inflight.get(key)
+                if flight is None:
+                    flight = self._inflight[key] = [threading.Event(), None]
+                    break
+            # Someone else is computing this key
+            if flight[0].wait(self.wait_seconds) and flight[1] is not None:
+                return flight[1], 'shared'
+            # Their computation raised (or is still running): look again
+
+        try:
+            value = compute()
+            flight[1] = value
+        finally:
+            with self._lock:
+                if flight[1] is not None and self.ttl > 0 and cacheable(flight[1]):
+                    self._store(key, flight[1], time.monotonic() + self.ttl)
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight[0].set()
+        return value, 'miss'
+
+    def _store(self, key: Hashable, value, expires: float) -> None:
+        if len(self._entries) >= self.max_entries:
+            now = time.monotonic()
+            for stale in [k for k, (exp, _) in self._entries.items() if exp <= now]:
+                del self._entries[stale]
+            while len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+        self._entries[key] = (expires, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
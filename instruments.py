@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Instrument master index for symbol validation and normalization
+The master (symbol -> exchange, token, ISIN) is compiled once into a sorted
+fixed-width binary file and memory-mapped read-only, so every gunicorn
+worker on the machine shares the same pages through the OS page cache.
+Lookups binary-search the mapping (O(log n)) with a small per-process cache
+of hits in front.
+
+Build the index from a CSV with symbol,exchange,token,isin columns:
+    python3 instruments.py build instruments.csv instruments.idx [--prefer NSE]
+
+Look symbols up:
+    python3 instruments.py lookup instruments.idx RELIANCE TCS.NS NSE:INFY
+"""
+
+import os
+import re
+import csv
+import mmap
+import struct
+import sys
+import argparse
+import logging
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'INSTIDX1'
+HEADER = struct.Struct('<8sII')  # magic, record count, record size
+RECORD = struct.Struct('<32s8sq12s')  # symbol, exchange, token, isin
+SYMBOL_WIDTH = 32
+
+Instrument = namedtuple('Instrument', ['symbol', 'exchange', 'token', 'isin'])
+
+# Variants seen in alert feeds: exchange prefixes and series/exchange suffixes
+_PREFIX = re.compile(r'^(NSE|BSE|NFO|MCX)[:_]')
+_SUFFIX = re.compile(r'(\.NS|\.BO|-EQ|-BE|-BZ)$')
+
+
+def normalize_symbol(symbol: str) -> str:
+    """RELIANCE, reliance, NSE:RELIANCE, RELIANCE.NS and RELIANCE-EQ all become RELIANCE"""
+    symbol = symbol.strip().upper()
+    symbol = _PREFIX.sub('', symbol)
+    return _SUFFIX.sub('', symbol)
+
+
+class InstrumentMaster:
+    """Read-only, memory-mapped, sorted instrument index"""
+
+    def __init__(self, path: str, cache_size: int = 50000):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, record_size = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError(f"{path} is not an instrument index")
+        self._cache: Dict[str, Optional[Instrument]] = {}
+        self._cache_size = cache_size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _symbol_at(self, i: int) -> bytes:
+        offset = HEADER.size + i * RECORD.size
+        return self._mm[offset:offset + SYMBOL_WIDTH]
+
+    def _record_at(self, i: int) -> Instrument:
+        symbol, exchange, token, isin = RECORD.unpack_from(self._mm, HEADER.size + i * RECORD.size)
+        return Instrument(
+            symbol.rstrip(b'\0').decode(), exchange.rstrip(b'\0').decode(),
+            token, isin.rstrip(b'\0').decode(),
+        )
+
+    def _search(self, symbol: str) -> Optional[Instrument]:
+        encoded = symbol.encode()
+        if len(encoded) > SYMBOL_WIDTH:
+            return None
+        key = encoded.ljust(SYMBOL_WIDTH, b'\0')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._symbol_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._symbol_at(lo) == key:
+            return self._record_at(lo)
+        return None
+
+    def lookup(self, symbol: str) -> Optional[Instrument]:
+        """Find an instrument by exact or normalized symbol"""
+        if symbol in self._cache:
+            return self._cache[symbol]
+        instrument = self._search(normalize_symbol(symbol))
+        if len(self._cache) >= self._cache_size:
+            self._cache.clear()
+        self._cache[symbol] = instrument
+        return instrument
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+def build_index(csv_path: str, out_path: str, prefer: Optional[str] = None) -> int:
+    """Compile a CSV master into a sorted index. Returns the record count."""
+    records: Dict[bytes, tuple] = {}
+    with open(csv_path, newline='') as f:
+        for row in csv.DictReader(f):
+            symbol = normalize_symbol(row.get('symbol') or '')
+            if not symbol or len(symbol.encode()) > SYMBOL_WIDTH:
+                continue
+            exchange = (row.get('exchange') or '').strip().upper()
+            key = symbol.encode()
+            if key in records and not (prefer and exchange == prefer and records[key][1] != prefer):
+                continue  # keep the first listing unless this one is on the preferred exchange
+            try:
+                token = int(row.get('token') or 0)
+            except ValueError:
+                token = 0
+            records[key] = (key, exchange, token, (row.get('isin') or '').strip().upper())
+
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(records), RECORD.size))
+        for key in sorted(records):
+            symbol, exchange, token, isin = records[key]
+            f.write(RECORD.pack(symbol, exchange.encode()[:8], token, isin.encode()[:12]))
+    os.replace(tmp_path, out_path)  # atomic, so running workers keep their old mapping
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Instrument master index')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='Compile a CSV master into an index')
+    build.add_argument('csv_path')
+    build.add_argument('out_path')
+    build.add_argument('--prefer', help='Exchange to keep when a symbol is listed twice (e.g. NSE)')
+    lookup = sub.add_parser('lookup', help='Look symbols up in an index')
+    lookup.add_argument('index_path')
+    lookup.add_argument('symbols', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        count = build_index(args.csv_path, args.out_path, args.prefer and args.prefer.upper())
+        print(f"✅ Wrote {count} instruments to {args.out_path}")
+    else:
+        master = InstrumentMaster(args.index_path)
+        for symbol in args.symbols:
+            instrument = master.lookup(symbol)
+            print(f"{symbol}: {instrument if instrument else '❌ unknown'}")
+        if any(master.lookup(s) is None for s in args.symbols):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
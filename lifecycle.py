@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Worker lifecycle: drain on shutdown, resume on boot
+Subsystems register drain steps in the order they must run (e.g. flush
+digests before persisting the Discord queue they feed). On SIGTERM the
+worker first begins draining (a flag only, safe inside a signal handler:
+/health turns 503, long polls return, background loops stop taking new
+work). Once gunicorn has finished the in-flight requests, drain() runs the
+steps against one shared deadline, so a slow step eats into the time of the
+next ones rather than into the deploy.
+
+gunicorn.conf.py wires this up; outside gunicorn it runs at interpreter exit.
+"""
+
+import time
+import signal
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Step outcomes
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'  # deadline passed before the step could start
+
+
+class Lifecycle:
+    def __init__(self, drain_seconds: float = 25):
+        self.drain_seconds = drain_seconds
+        self._draining = threading.Event()
+        self._drain_started: Optional[float] = None
+        self._steps: List[Tuple[int, str, Callable[[float], object]]] = []
+        self._lock = threading.Lock()
+        self.result: Optional[Dict[str, str]] = None
+
+    @property
+    def draining(self) -> bool:
+        return self._draining.is_set()
+
+    def on_drain(self, name: str, step: Callable[[float], object], order: int = 50) -> None:
+        """step(deadline) with deadline a time.monotonic() value; lower order runs first"""
+        self._steps.append((order, name, step))
+        self._steps.sort(key=lambda item: item[0])
+
+    def begin_drain(self) -> None:
+        """Stop taking new work. Only sets flags, so it can run in a signal handler."""
+        if self._drain_started is None:
+            self._drain_started = time.monotonic()
+        self._draining.set()
+
+    def wait_for_drain(self, timeout: float) -> bool:
+        """Sleep up to timeout; True as soon as draining began (for background loops)"""
+        return self._draining.wait(timeout)
+
+    def deadline(self) -> float:
+        return (self._drain_started or time.monotonic()) + self.drain_seconds
+
+    def drain(self) -> Dict[str, str]:
+        """Run every drain step once (later calls return the first result)"""
+        with self._lock:
+            if self.result is not None:
+                return self.result
+            self.begin_drain()
+            deadline = self.deadline()
+            result = {}
+            for _, name, step in self._steps:
+                if time.monotonic() >= deadline:
+                    result[name] = SKIPPED
+                    logger.error(f"Drain deadline passed, skipping {name}")
+                    continue
+                started = time.monotonic()
+                try:
+                    outcome = step(deadline)
+                    result[name] = DONE
+                    logger.info(f"Drained {name} in {time.monotonic() - started:.2f}s: {outcome}")
+                except Exception as e:
+                    result[name] = FAILED
+                    logger.error(f"Drain step {name} failed: {e}")
+            self.result = result
+            return result
+
+    def install_signal_handler(self, signum: int = signal.SIGTERM) -> None:
+        """Begin draining on signum, then call the handler that was installed before"""
+        previous = signal.getsignal(signum)
+
+        def handler(sig, frame):
+            self.begin_drain()
+            if callable(previous):
+                previous(sig, frame)
+            elif previous == signal.SIG_DFL:
+                raise SystemExit(128 + sig)
+
+        signal.signal(signum, handler)
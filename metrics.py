@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Minimal in-process metrics registry
+Counters and gauges with labels, rendered in the Prometheus text format at
+/metrics. Values are per worker process; scrape each worker or aggregate
+in Prometheus.
+"""
+
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ''
+    inner = ','.join(f'{k}="{v}"' for k, v in key)
+    return '{' + inner + '}'
+
+
+class Metrics:
+    """Thread-safe counters and gauges, plus gauges computed at scrape time"""
+
+    def __init__(self, prefix: str = 'webhook_'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]] = []
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]) -> None:
+        """collector() yields (gauge_name, labels, value) each time metrics are read"""
+        self._collectors.append(collector)
+
+    def _collect(self) -> Tuple[Dict, Dict]:
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                gauges.setdefault(name, {})[_label_key(labels)] = value
+        return counters, gauges
+
+    def render(self) -> str:
+        counters, gauges = self._collect()
+        lines = []
+        for kind, families in (('counter', counters), ('gauge', gauges)):
+            for name in sorted(families):
+                full_name = self.prefix + name
+                if name in self._help:
+                    lines.append(f"# HELP {full_name} {self._help[name]}")
+                lines.append(f"# TYPE {full_name} {kind}")
+                for key, value in sorted(families[name].items()):
+                    lines.append(f"{full_name}{_format_labels(key)} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+    def value(self, name: str, labels: Optional[Dict[str, str]] = None) -> float:
+        """Current value of one series (0 if never recorded)"""
+        counters, gauges = self._collect()
+        key = _label_key(labels)
+        return counters.get(name, {}).get(key, gauges.get(name, {}).get(key, 0))
+
+
+metrics = Metrics()
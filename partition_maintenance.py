@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Partition maintenance for the time-partitioned chartink_alerts table
+(see "Time partitioning and retention" in create_table.sql)
+
+Each run:
+  1. pre-creates the current and the next --ahead partitions, moving any
+     rows for those periods out of the default partition
+  2. finds partitions that ended more than --retention periods ago
+  3. detaches each one, archives it to <archive-dir>/<partition>.csv.gz with
+     COPY, checks the archived row count, then drops it (or keeps the
+     detached table with --keep-detached)
+
+--interval has to match the table: it was fixed when the migration ran
+(chartink.partition_interval, monthly by default), and day ranges would
+overlap existing monthly partitions. A mismatch is refused before anything
+is created.
+
+Run it daily from cron or a scheduled job. Run export_alerts.py first if
+the history should also go to Parquet.
+
+Usage:
+    python3 partition_maintenance.py                          # monthly, keep 6 months
+    python3 partition_maintenance.py --interval day --retention 90 --ahead 7
+    python3 partition_maintenance.py --dry-run
+
+Needs DATABASE_URL (direct Postgres connection string, e.g. Supabase's
+"Connection string" setting) and psycopg2.
+"""
+
+import os
+import csv
+import sys
+import gzip
+import argparse
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+PARENT_TABLE = 'chartink_alerts'
+
+PARTITIONS_SQL = """
+    SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = %s::regclass
+    ORDER BY c.relname
+"""
+
+# A plain DETACH (CONCURRENTLY is refused while the default partition
+# exists) briefly locks the parent. Give up rather than queue behind a long
+# query with every insert queued behind us; the next run retries.
+DETACH_LOCK_TIMEOUT = '5s'
+
+# Partitions left detached by an interrupted run
+DETACHED_SQL = """
+    SELECT relname FROM pg_class
+    WHERE relname LIKE 'chartink\\_alerts\\_p%' AND relkind = 'r' AND NOT relispartition
+    ORDER BY relname
+"""
+
+
+def _parse_bound(bound: str) -> Tuple[datetime, datetime]:
+    """(start, end) from "FOR VALUES FROM ('2026-01-01 00:00:00+00') TO ('2026-02-01 00:00:00+00')" """
+    start = bound.split("FROM ('", 1)[1].split("'", 1)[0]
+    end = bound.split("TO ('", 1)[1].split("'", 1)[0]
+    return _parse_timestamp(start), _parse_timestamp(end)
+
+
+def _parse_timestamp(value: str) -> datetime:
+    # Postgres prints offsets as +00 or +05:30
+    if len(value) > 3 and value[-3] in '+-':
+        value += ':00'
+    return datetime.fromisoformat(value)
+
+
+def list_partitions(cur) -> List[Dict]:
+    cur.execute(PARTITIONS_SQL, (PARENT_TABLE,))
+    partitions = []
+    for name, bound in cur.fetchall():
+        if bound == 'DEFAULT':
+            partitions.append({'name': name, 'default': True})
+            continue
+        start, end = _parse_bound(bound)
+        partitions.append({'name': name, 'start': start, 'end': end, 'default': False})
+    return partitions
+
+
+def table_interval(partitions: List[Dict]) -> Optional[str]:
+    """'day' or 'month' from the existing ranges, None if there are none yet"""
+    for partition in partitions:
+        if not partition['default']:
+            return 'day' if partition['end'] - partition['start'] <= timedelta(days=1) else 'month'
+    return None
+
+
+def retention_cutoff(today: date, interval: str, retention: int) -> datetime:
+    """Partitions ending on or before this instant are expired"""
+    if interval == 'day':
+        cutoff = today - timedelta(days=retention)
+    else:
+        month = today.year * 12 + today.month - 1 - retention
+        cutoff = date(month // 12, month % 12 + 1, 1)
+    return datetime(cutoff.year, cutoff.month, cutoff.day, tzinfo=timezone.utc)
+
+
+def archive_partition(conn, name: str, archive_dir: str) -> Tuple[str, int]:
+    """COPY a (detached) partition into a gzip CSV. Returns (path, rows written)."""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    tmp_path = path + '.tmp'
+    with conn.cursor() as cur, gzip.open(tmp_path, 'wb', compresslevel=6) as out:
+        cur.copy_expert(f'COPY (SELECT * FROM "{name}" ORDER BY id) TO STDOUT WITH (FORMAT csv, HEADER)', out)
+    with gzip.open(tmp_path, 'rt', newline='') as f:
+        rows = sum(1 for _ in csv.reader(f)) - 1  # header
+    os.replace(tmp_path, path)
+    return path, max(rows, 0)
+
+
+def run_maintenance(dsn: str, interval: str = 'month', ahead: int = 2, retention: int = 6,
+                    archive_dir: str = 'archives', keep_detached: bool = False,
+                    dry_run: bool = False) -> Dict:
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True  # every statement is its own short transaction
+    summary = {'created': [], 'archived': [], 'default_rows': 0, 'default_range': None}
+    try:
+        with conn.cursor() as cur:
+            existing = table_interval(list_partitions(cur))
+            if existing and existing != interval:
+                raise ValueError(f"{PARENT_TABLE} is partitioned by {existing}, not {interval}")
+            if not dry_run:
+                cur.execute("SELECT * FROM ensure_chartink_alerts_partitions(%s, %s)", (ahead, interval))
+                summary['created'] = [row[0] for row in cur.fetchall()]
+
+            cutoff = retention_cutoff(date.today(), interval, retention)
+            expired = []
+            for partition in list_partitions(cur):
+                if partition['default']:
+                    cur.execute(f'SELECT COUNT(*), MIN(created_at), MAX(created_at) FROM "{partition["name"]}"')
+                    count, first, last = cur.fetchone()
+                    summary['default_rows'] = count
+                    summary['default_range'] = (first, last) if count else None
+                elif partition['end'] <= cutoff:
+                    expired.append(partition)
+            cur.execute(DETACHED_SQL)
+            for (name,) in cur.fetchall():
+                if not os.path.exists(os.path.join(archive_dir, f"{name}.csv.gz")):
+                    expired.append({'name': name, 'detached': True})
+
+        for partition in expired:
+            name = partition['name']
+            if dry_run:
+                summary['archived'].append({'partition': name, 'path': None, 'rows': None})
+                continue
+            if not partition.get('detached'):
+                with conn.cursor() as cur:
+                    cur.execute(f"SET lock_timeout = '{DETACH_LOCK_TIMEOUT}'")
+                    cur.execute(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION "{name}"')
+                    cur.execute("RESET lock_timeout")
+            path, archived_rows = archive_partition(conn, name, archive_dir)
+            with conn.cursor() as cur:
+                cur.execute(f'SELECT COUNT(*) FROM "{name}"')
+                table_rows = cur.fetchone()[0]
+                if archived_rows != table_rows:
+                    raise RuntimeError(f"{name}: archived {archived_rows} rows but table has {table_rows}")
+                if not keep_detached:
+                    cur.execute(f'DROP TABLE "{name}"')
+            summary['archived'].append({'partition': name, 'path': path, 'rows': archived_rows})
+    finally:
+        conn.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create, detach and archive chartink_alerts partitions')
+    parser.add_argument('--interval', choices=['month', 'day'], default=os.getenv('PARTITION_INTERVAL', 'month'))
+    parser.add_argument('--ahead', type=int, default=int(os.getenv('PARTITION_AHEAD', 2)),
+                        help='Future partitions to pre-create')
+    parser.add_argument('--retention', type=int, default=int(os.getenv('PARTITION_RETENTION', 6)),
+                        help='Periods (months or days) to keep in the database')
+    parser.add_argument('--archive-dir', default=os.getenv('ARCHIVE_DIR', 'archives'))
+    parser.add_argument('--keep-detached', action='store_true', help='Keep detached tables instead of dropping them')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+    args = parser.parse_args()
+
+    dsn = os.getenv('DATABASE_URL')
+    if not dsn:
+        print("❌ DATABASE_URL is required")
+        sys.exit(1)
+
+    try:
+        summary = run_maintenance(dsn, args.interval, args.ahead, args.retention, args.archive_dir,
+                                  args.keep_detached, args.dry_run)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if summary['created']:
+        print(f"✅ Partitions ensured: {', '.join(summary['created'])}")
+    for item in summary['archived']:
+        if args.dry_run:
+            print(f"Would archive {item['partition']}")
+        else:
+            print(f"📦 Archived {item['partition']}: {item['rows']} rows -> {item['path']}")
+    if summary['default_rows']:
+        first, last = summary['default_range']
+        print(f"⚠️  {summary['default_rows']} rows in the default partition ({first:%Y-%m-%d} to {last:%Y-%m-%d}). "
+              f"Creating their partitions moves them: run with a larger --ahead, or for past periods "
+              f"SELECT create_chartink_alerts_partition('<day>', '{args.interval}') for each one")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Last-traded-price snapshot for enriching ChartInk alerts
+ChartInk's symbol-only format carries no prices. This keeps an in-memory
+symbol -> last price table so those alerts can be filled and get price
+metrics without any per-request network lookup.
+
+Symbols are interned once and map to a row index; prices and update times
+live in compact array('d') columns. Reads take no lock.
+
+The source is a CSV file of SYMBOL,PRICE[,EPOCH_SECONDS] lines. It is loaded
+at startup and then tailed: a feed process can keep appending ticks and
+only the new lines are applied. If the file is replaced or truncated it is
+reloaded from the start.
+"""
+
+import os
+import sys
+import time
+import threading
+import logging
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PriceSnapshot:
+    """Array-backed symbol -> last price table"""
+
+    def __init__(self, max_age_seconds: float = 0):
+        self.max_age_seconds = max_age_seconds
+        self._index: Dict[str, int] = {}
+        self._symbols: List[str] = []
+        self._prices = array('d')
+        self._updated_at = array('d')
+        self._lock = threading.Lock()
+        self._path = None
+        self._offset = 0
+        self._inode = None
+        self._refresher = None
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    @staticmethod
+    def normalize(symbol: str) -> str:
+        return symbol.strip().upper()
+
+    def update(self, symbol: str, price: float, updated_at: Optional[float] = None) -> None:
+        self.update_many([(symbol, price, updated_at)])
+
+    def update_many(self, rows: Iterable[Tuple[str, float, Optional[float]]]) -> int:
+        now = time.time()
+        count = 0
+        with self._lock:
+            for symbol, price, updated_at in rows:
+                symbol = self.normalize(symbol)
+                row = self._index.get(symbol)
+                if row is None:
+                    self._symbols.append(sys.intern(symbol))
+                    self._prices.append(price)
+                    self._updated_at.append(updated_at or now)
+                    # Publish the index entry last so lock-free readers never
+                    # see a row that has not been appended yet
+                    self._index[self._symbols[-1]] = len(self._symbols) - 1
+                else:
+                    self._prices[row] = price
+                    self._updated_at[row] = updated_at or now
+                count += 1
+        return count
+
+    def get(self, symbol: str) -> Optional[float]:
+        row = self._index.get(self.normalize(symbol))
+        if row is None:
+            return None
+        if self.max_age_seconds and time.time() - self._updated_at[row] > self.max_age_seconds:
+            return None
+        return self._prices[row]
+
+    def lookup(self, symbols: List[str]) -> List[Optional[float]]:
+        return [self.get(symbol) for symbol in symbols]
+
+    @staticmethod
+    def _parse_lines(lines: Iterable[str]) -> List[Tuple[str, float, Optional[float]]]:
+        rows = []
+        for line in lines:
+            parts = line.strip().split(',')
+            if len(parts) < 2 or not parts[0]:
+                continue
+            try:
+                price = float(parts[1])
+                updated_at = float(parts[2]) if len(parts) > 2 and parts[2] else None
+            except ValueError:
+                continue  # header or malformed line
+            rows.append((parts[0], price, updated_at))
+        return rows
+
+    def load_file(self, path: str) -> int:
+        """Apply the whole file and remember where it ends"""
+        self._path = path
+        self._offset = 0
+        self._inode = None
+        return self.refresh()
+
+    def refresh(self) -> int:
+        """Apply lines appended since the last read. Returns rows applied."""
+        if not self._path:
+            return 0
+        try:
+            stat = os.stat(self._path)
+        except OSError as e:
+            logger.warning(f"Price snapshot file unavailable: {e}")
+            return 0
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            self._offset = 0  # replaced or truncated
+            self._inode = stat.st_ino
+        if stat.st_size == self._offset:
+            return 0
+
+        with open(self._path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # Leave a partially written last line for the next refresh
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        return self.update_many(self._parse_lines(data[:end].decode('utf-8', 'replace').splitlines()))
+
+    def start_refresh(self, interval_seconds: float) -> None:
+        """Tail the source file in the background, once per process"""
+        if self._refresher is not None or not self._path:
+            return
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, args=(interval_seconds,), name='price-snapshot', daemon=True
+            )
+        self._refresher.start()
+
+    def _refresh_loop(self, interval_seconds: float) -> None:
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                applied = self.refresh()
+                if applied:
+                    logger.debug(f"Price snapshot refreshed: {applied} rows, {len(self)} symbols")
+            except Exception as e:
+                logger.error(f"Price snapshot refresh failed: {e}")
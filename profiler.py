@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+In-process profilers for production workers
+- SamplingProfiler: samples the stacks of every thread in this process via
+  sys._current_frames() every few milliseconds for N seconds, and returns
+  collapsed stacks (flamegraph.pl / speedscope import) or speedscope JSON.
+  Nothing is instrumented, so overhead is one stack walk per sample.
+- RequestProfiler: runs cProfile around the next N requests to an armed
+  route and keeps the pstats report of each.
+"""
+
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+# Leaf functions of threads that are blocked, not using CPU
+IDLE_FUNCTIONS = {
+    'wait', 'sleep', 'select', 'poll', 'epoll', 'accept', 'recv', 'recv_into', 'readinto',
+    'get', '_wait_for_tstate_lock', 'acquire', 'read', 'wait_for', 'flock',
+}
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Wall-clock stack sampler over all threads. One run at a time per process."""
+
+    _running = threading.Lock()
+
+    def __init__(self, interval_seconds: float = 0.005, include_idle: bool = False):
+        self.interval = interval_seconds
+        self.include_idle = include_idle
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.duration = 0.0
+
+    def run(self, seconds: float) -> 'SamplingProfiler':
+        """Sample for `seconds`. Raises RuntimeError if another run is in progress."""
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("A profile is already running in this worker")
+        try:
+            own_thread = threading.get_ident()
+            names = {}
+            start = time.monotonic()
+            deadline = start + seconds
+            while time.monotonic() < deadline:
+                for thread in threading.enumerate():
+                    names[thread.ident] = thread.name
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    if not self.include_idle and frame.f_code.co_name in IDLE_FUNCTIONS:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    stack.append(names.get(thread_id, str(thread_id)))
+                    self.samples[';'.join(reversed(stack))] += 1
+                self.sample_count += 1
+                time.sleep(self.interval)
+            self.duration = time.monotonic() - start
+        finally:
+            self._running.release()
+        return self
+
+    def collapsed(self) -> str:
+        """Brendan Gregg collapsed format: 'thread;outer;...;leaf count' per line"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def speedscope(self, name: str = 'webhook worker') -> Dict:
+        """speedscope file format, one sampled profile with thread names as root frames"""
+        frame_index: Dict[str, int] = {}
+        frames: List[Dict] = []
+        samples: List[List[int]] = []
+        weights: List[int] = []
+        for stack, count in self.samples.items():
+            indexes = []
+            for label in stack.split(';'):
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    frames.append({'name': label})
+                indexes.append(frame_index[label])
+            samples.append(indexes)
+            weights.append(count)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'none',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+            'name': name,
+            'exporter': 'profiler.py',
+        }
+
+
+class RequestProfiler:
+    """Opt-in cProfile for the next few requests to chosen routes"""
+
+    def __init__(self, keep: int = 20):
+        self._armed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._active = threading.Lock()  # cProfile can only run one profile at a time
+        self.results = deque(maxlen=keep)
+
+    def arm(self, route: str, count: int = 1) -> None:
+        with self._lock:
+            self._armed[route] = count
+
+    def armed(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._armed)
+
+    def start(self, route: str) -> Optional[cProfile.Profile]:
+        """Profiler for this request if its route is armed (and none is running)"""
+        if route not in self._armed:
+            return None
+        if not self._active.acquire(blocking=False):
+            return None
+        with self._lock:
+            remaining = self._armed.get(route, 0)
+            if remaining <= 0:
+                self._active.release()
+                return None
+            if remaining == 1:
+                del self._armed[route]
+            else:
+                self._armed[route] = remaining - 1
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # another profiling tool is active
+            self._active.release()
+            return None
+        return profile
+
+    def finish(self, profile: cProfile.Profile, route: str, duration_ms: float,
+               request_id: Optional[str] = None, limit: int = 40) -> None:
+        profile.disable()
+        self._active.release()
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(limit)
+        self.results.append({
+            'route': route,
+            'request_id': request_id,
+            'captured_at': time.time(),
+            'duration_ms': round(duration_ms, 3),
+            'report': out.getvalue(),
+        })
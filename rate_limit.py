@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Token-bucket rate limiting for webhook routes
+Each route has limits per key dimension (client IP, TradingView strategy,
+ChartInk scan_name), written as "<count>/<period>": a bucket of <count>
+tokens refilled evenly over the period.
+
+    {"/webhook/tradingview": {"ip": "120/min", "strategy": "60/min"}}
+
+Buckets are GCRA (one float per key). LocalBuckets keeps them in this
+worker, split across lock-striped shards so concurrent requests for
+different keys rarely contend. SharedBuckets keeps them in the state store
+so every worker and instance draws from the same bucket, and falls back to
+the local ones if the store is unreachable.
+"""
+
+import re
+import time
+import zlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60, 'h': 3600, 'hour': 3600}
+
+_field_patterns: Dict[str, re.Pattern] = {}
+
+
+class Limit:
+    """One bucket size/refill rate for one key dimension"""
+
+    __slots__ = ('dimension', 'spec', 'rate', 'burst')
+
+    def __init__(self, dimension: str, spec: str):
+        count, _, period = spec.partition('/')
+        seconds = PERIODS.get(period.strip().lower()) if period else 1
+        if seconds is None or float(count) <= 0:
+            raise ValueError(f"Invalid rate limit for {dimension}: {spec!r} (expected e.g. '60/min')")
+        self.dimension = dimension
+        self.spec = spec
+        self.burst = float(count)
+        self.rate = self.burst / seconds
+
+
+def parse_rules(config: Dict[str, Dict[str, str]]) -> Dict[str, List[Limit]]:
+    """{route: {dimension: "count/period"}} -> {route: [Limit, ...]}"""
+    return {route: [Limit(dimension, spec) for dimension, spec in limits.items()]
+            for route, limits in config.items()}
+
+
+def json_string_field(body: bytes, *names: str) -> Optional[str]:
+    """First of `names` found as a top-level-looking "name": "value" pair in a raw JSON body"""
+    for name in names:
+        pattern = _field_patterns.get(name)
+        if pattern is None:
+            pattern = _field_patterns[name] = re.compile(rb'"' + re.escape(name.encode()) + rb'"\s*:\s*"([^"\\]{1,200})"')
+        match = pattern.search(body)
+        if match:
+            return match.group(1).decode(errors='replace')
+    return None
+
+
+class LocalBuckets:
+    """Per-worker GCRA buckets, lock-striped across shards"""
+
+    def __init__(self, shards: int = 16, max_keys_per_shard: int = 4096):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self.max_keys_per_shard = max_keys_per_shard
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """0 if a token was taken, else the seconds until one is available"""
+        buckets, lock = self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+        now = time.monotonic()
+        with lock:
+            tat = max(buckets.get(key, now), now)
+            wait = tat - (burst - 1) / rate - now
+            if wait > 0:
+                return wait
+            if len(buckets) >= self.max_keys_per_shard and key not in buckets:
+                # A full bucket (tat in the past) is the same as no bucket
+                for idle in [k for k, t in buckets.items() if t <= now]:
+                    del buckets[idle]
+            buckets[key] = tat + 1 / rate
+            return 0.0
+
+
+class SharedBuckets:
+    """GCRA buckets in the shared state store"""
+
+    def __init__(self, state, fallback: Optional[LocalBuckets] = None, key_prefix: str = 'ratelimit:'):
+        self.state = state
+        self.fallback = fallback or LocalBuckets()
+        self.key_prefix = key_prefix
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        try:
+            return self.state.take_token(self.key_prefix + key, rate, burst)
+        except Exception as e:
+            logger.warning(f"State store unavailable for rate limits, using local buckets: {e}")
+            return self.fallback.take(key, rate, burst)
+
+
+class RateLimiter:
+    """Applies a route's limits to the key values of one request"""
+
+    def __init__(self, rules: Dict[str, List[Limit]], buckets=None):
+        self.rules = rules
+        self.buckets = buckets or LocalBuckets()
+
+    def limits(self, route: str) -> List[Limit]:
+        return self.rules.get(route, [])
+
+    def check(self, route: str, values: Dict[str, Optional[str]]) -> Optional[Tuple[Limit, float]]:
+        """(limit hit, seconds to wait) if the request is over any limit, else None"""
+        for limit in self.rules.get(route, ()):
+            value = values.get(limit.dimension)
+            if value is None:
+                continue
+            wait = self.buckets.take(f"{route}:{limit.dimension}:{value}", limit.rate, limit.burst)
+            if wait > 0:
+                return limit, wait
+        return None
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Resilience primitives for calls to Supabase, Discord and Notion
+- CircuitBreaker: closed -> open after consecutive transient failures,
+  half-open after a cool-down (one probe at a time), closed again on success.
+  While open, calls fail fast with CircuitOpenError instead of waiting out
+  a timeout.
+- Adaptive timeouts: each breaker tracks recent call latency and suggests
+  a timeout of p99 * multiplier, clamped to [min, max].
+- LocalSpool: append-only JSONL file for work that must survive until the
+  dependency recovers (e.g. ChartInk inserts).
+"""
+
+import os
+import json
+import fcntl
+import time
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+def _transient_errors() -> Tuple[type, ...]:
+    """Errors that mean the dependency is unreachable or slow, not that the request was bad"""
+    errors = [ConnectionError, TimeoutError, OSError]
+    try:
+        import requests
+        errors += [requests.ConnectionError, requests.Timeout]
+    except ImportError:
+        pass
+    try:
+        import httpx
+        errors.append(httpx.TransportError)
+    except ImportError:
+        pass
+    try:
+        import psycopg2
+        errors.append(psycopg2.OperationalError)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+TRANSIENT_ERRORS = _transient_errors()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    """Per-dependency breaker with a latency-aware timeout"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_seconds: float = 30,
+                 min_timeout: float = 0.5, max_timeout: float = 5.0, timeout_multiplier: float = 3.0,
+                 min_samples: int = 20):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self.latency = LatencyTracker()
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def timeout(self) -> float:
+        """p99 * multiplier, clamped; the max until enough samples exist"""
+        if len(self.latency) < self.min_samples:
+            return self.max_timeout
+        p99 = self.latency.percentile(99)
+        return max(self.min_timeout, min(self.max_timeout, p99 * self.timeout_multiplier))
+
+    def allow(self) -> bool:
+        """Whether a call may go through now. Half-open lets one probe through at a time."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_seconds:
+                    self.rejected += 1
+                    return False
+                self._state = HALF_OPEN
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def retry_after(self) -> float:
+        return max(0.0, self.recovery_seconds - (time.monotonic() - self._opened_at))
+
+    def record_success(self, latency: float) -> None:
+        self.latency.add(latency)
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, latency: Optional[float] = None) -> None:
+        if latency is not None:
+            self.latency.add(latency)
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(f"Circuit {self.name} opened after {self._failures} failures")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, fn: Callable, *args, failure_if: Optional[Callable] = None, **kwargs):
+        """
+        Run fn through the breaker. Transient errors count as failures;
+        other exceptions (bad request, 4xx) pass through without tripping it.
+        failure_if(result) lets a returned value count as a failure too
+        (e.g. an HTTP 5xx response).
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except TRANSIENT_ERRORS:
+            self.record_failure(time.monotonic() - start)
+            raise
+        except Exception:
+            self.record_success(time.monotonic() - start)  # dependency answered
+            raise
+        if failure_if is not None and failure_if(result):
+            self.record_failure(time.monotonic() - start)
+        else:
+            self.record_success(time.monotonic() - start)
+        return result
+
+    def snapshot(self) -> Dict:
+        p99 = self.latency.percentile(99)
+        return {
+            'state': self.state,
+            'consecutive_failures': self._failures,
+            'timeout_seconds': round(self.timeout(), 3),
+            'p99_seconds': round(p99, 3) if p99 is not None else None,
+            'rejected': self.rejected,
+        }
+
+
+class LocalSpool:
+    """
+    Append-only JSONL spool. Records are appended (and fsynced) one per
+    line; drain() hands them to a handler and rewrites the file with only
+    the records that still failed. A flock on a sidecar file keeps gunicorn
+    workers sharing the spool from losing each other's appends.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @contextmanager
+    def _locked(self, suffix: str = '.lock', blocking: bool = True):
+        with open(self.path + suffix, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self) -> List[Dict]:
+        try:
+            with open(self.path) as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def append(self, record: Dict) -> None:
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock, self._locked():
+            with open(self.path, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    @property
+    def rejected_path(self) -> str:
+        return self.path + '.rejected'
+
+    def _reject(self, record: Dict, error: Exception) -> None:
+        line = json.dumps({**record, 'rejected_error': repr(error), 'rejected_at': time.time()}, default=str)
+        with open(self.rejected_path, 'a') as f:
+            f.write(line + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def count(self) -> int:
+        try:
+            with open(self.path) as f:
+                return sum(1 for line in f if line.strip())
+        except FileNotFoundError:
+            return 0
+
+    def drain(self, handler: Callable[[Dict], bool], limit: Optional[int] = None,
+              on_reject: Optional[Callable[[Dict, Exception], None]] = None) -> Tuple[int, int]:
+        """
+        Call handler(record) for spooled records in order; handler returns
+        True when the record is done. It returning False, or raising a
+        transient error or CircuitOpenError, keeps the record and stops the
+        drain so order is kept. Any other exception means the record can
+        never succeed: it is moved to <path>.rejected (see on_reject) and the
+        drain goes on. Returns (done, remaining).
+
+        Only one process drains at a time (others return (0, count)), and
+        appends are only blocked while the file is read and rewritten, not
+        while the handler runs.
+        """
+        with self._locked('.drain', blocking=False) as draining:
+            if not draining:
+                return 0, self.count()
+            with self._lock, self._locked():
+                records = self._read()
+
+            done = handled = 0
+            for record in records[:limit] if limit else records:
+                try:
+                    if not handler(record):
+                        break
+                    done += 1
+                except (*TRANSIENT_ERRORS, CircuitOpenError) as e:
+                    logger.warning(f"Spool handler failed for {self.path}: {e}")
+                    break
+                except Exception as e:
+                    logger.error(f"Rejecting spooled record from {self.path}: {e!r}")
+                    self._reject(record, e)
+                    if on_reject is not None:
+                        on_reject(record, e)
+                handled += 1
+            if not handled:
+                return 0, len(records)
+
+            with self._lock, self._locked():
+                # Records appended while the handler ran follow the snapshot
+                remaining = records[handled:] + self._read()[len(records):]
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    for record in remaining:
+                        f.write(json.dumps(record, default=str) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            return done, len(remaining)
@@ -0,0 +1,26 @@
+"""
+Local stand-ins for the webhook server's dependencies
+PostgRESTStub (Supabase), DiscordStub and NotionStub run as threaded HTTP
+servers on 127.0.0.1, so the real clients (supabase-py, requests) are
+exercised end to end; RespStub does the same over TCP for the shared state
+server (state_store.RedisStateStore). Each has a seeded Faults object for
+latency distributions, error rates, outages and timed schedules. tests/
+uses them; they can also back a manual run:
+
+    with PostgRESTStub() as db, DiscordStub() as discord:
+        db.add_control('CIO', discord.webhook('CIO'))
+        # export SUPABASE_URL=db.url before importing webhook_server
+"""
+
+from simulation.discord import DiscordStub
+from simulation.faults import (ERROR, HANG, REFUSE, Faults, Phase, constant, lognormal, spikes,
+                               uniform)
+from simulation.load import LoadResult, run_load
+from simulation.notion import NotionStub
+from simulation.postgrest import PostgRESTStub
+from simulation.resp import RespStub
+
+__all__ = [
+    'DiscordStub', 'NotionStub', 'PostgRESTStub', 'RespStub', 'Faults', 'Phase', 'REFUSE', 'HANG', 'ERROR',
+    'constant', 'uniform', 'lognormal', 'spikes', 'LoadResult', 'run_load',
+]
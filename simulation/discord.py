@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Discord webhook stand-in
+webhook(name) returns a URL of the real shape (<stub.url>/api/webhooks/<id>/<token>)
+to put in controls.discord_webhook_url. Posts are validated like Discord
+does (non-empty, content up to 2000 characters) and kept per webhook.
+Each webhook has its own rate-limit bucket (Discord allows about 5 posts per
+2 seconds); beyond it the stub answers 429 with retry_after and the
+X-RateLimit-* headers.
+"""
+
+import time
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from simulation.server import Request, StubServer
+
+MAX_CONTENT_LENGTH = 2000
+
+
+class DiscordStub(StubServer):
+    def __init__(self, seed: int = 0, rate_limit: Optional[Tuple[int, float]] = None):
+        super().__init__(seed)
+        self._lock = threading.Lock()
+        self.default_rate_limit = rate_limit
+        self.reset(seed)
+
+    def reset(self, seed: int = 0) -> None:
+        super().reset(seed)
+        with self._lock:
+            self._webhooks: Dict[str, str] = {}  # "<id>/<token>" -> name
+            self._messages: Dict[str, List[Dict]] = {}
+            self._buckets: Dict[str, List[float]] = {}  # name -> post times in the current window
+            self._limits: Dict[str, Tuple[int, float]] = {}
+
+    def webhook(self, name: str) -> str:
+        """URL of the webhook called `name`, created on first use"""
+        webhook_id = str(zlib.crc32(name.encode()))
+        path = f"{webhook_id}/token-{name.lower()}"
+        with self._lock:
+            self._webhooks[path] = name
+            self._messages.setdefault(name, [])
+        return f"{self.url}/api/webhooks/{path}"
+
+    def rate_limit(self, name: Optional[str], posts: int, per_seconds: float) -> None:
+        """Allow `posts` per `per_seconds` on one webhook (None: every webhook)"""
+        with self._lock:
+            if name is None:
+                self.default_rate_limit = (posts, per_seconds)
+            else:
+                self._limits[name] = (posts, per_seconds)
+
+    def messages(self, name: str) -> List[Dict]:
+        with self._lock:
+            return list(self._messages.get(name, []))
+
+    def error_body(self, status: int):
+        if status == 429:
+            return {'message': 'You are being rate limited.', 'retry_after': 1.0, 'global': False}
+        return {'message': '500: Internal Server Error', 'code': 0}
+
+    def _take(self, name: str) -> Tuple[Optional[float], Dict]:
+        """(seconds to wait or None, rate-limit headers) for one post"""
+        limit = self._limits.get(name, self.default_rate_limit)
+        if limit is None:
+            return None, {}
+        posts, per_seconds = limit
+        now = time.monotonic()
+        window = [t for t in self._buckets.get(name, []) if now - t < per_seconds]
+        headers = {'X-RateLimit-Limit': posts, 'X-RateLimit-Bucket': f"sim-{name.lower()}"}
+        if len(window) >= posts:
+            reset_after = per_seconds - (now - window[0])
+            self._buckets[name] = window
+            return reset_after, {**headers, 'X-RateLimit-Remaining': 0,
+                                 'X-RateLimit-Reset-After': f"{reset_after:.3f}",
+                                 'Retry-After': max(1, round(reset_after))}
+        window.append(now)
+        self._buckets[name] = window
+        return None, {**headers, 'X-RateLimit-Remaining': posts - len(window),
+                      'X-RateLimit-Reset-After': f"{per_seconds - (now - window[0]):.3f}"}
+
+    def handle(self, request: Request):
+        if request.method != 'POST' or not request.path.startswith('/api/webhooks/'):
+            return 405, {'message': '405: Method Not Allowed', 'code': 0}
+        with self._lock:
+            name = self._webhooks.get(request.path[len('/api/webhooks/'):])
+            if name is None:
+                return 404, {'message': 'Unknown Webhook', 'code': 10015}
+            retry_after, headers = self._take(name)
+            if retry_after is not None:
+                return 429, {'message': 'You are being rate limited.', 'retry_after': round(retry_after, 3),
+                             'global': False}, headers
+        try:
+            message = request.json() or {}
+        except ValueError:
+            return 400, {'message': 'Cannot send an empty message', 'code': 50006}, headers
+        content = message.get('content') or ''
+        if not content and not message.get('embeds'):
+            return 400, {'message': 'Cannot send an empty message', 'code': 50006}, headers
+        if len(content) > MAX_CONTENT_LENGTH:
+            return 400, {'content': [f'Must be {MAX_CONTENT_LENGTH} or fewer in length.']}, headers
+        with self._lock:
+            self._messages[name].append(message)
+        if request.param('wait') == 'true':
+            return 200, {'id': str(len(self._messages[name])), 'content': content}, headers
+        return 204, None, headers
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Scriptable faults for the dependency stand-ins
+Every stand-in owns a Faults object that decides, per request, how long to
+wait and whether to fail. Draws come from one seeded random.Random, so a
+given seed replays the same sequence of latencies and errors.
+
+    faults.configure(latency=lognormal(0.02, 0.12), error_rate=0.05)
+    faults.outage(3.0, mode=REFUSE)           # next 3 seconds: connections dropped
+    faults.schedule(Phase(2, latency=constant(0.5)), Phase(1, outage=HANG))
+
+Outage modes:
+  REFUSE  close the connection without a response (client sees a transport error)
+  HANG    hold the request until the outage ends (client sees a timeout)
+  ERROR   answer every request with error_status
+"""
+
+import math
+import time
+import random
+import threading
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
+
+Distribution = Callable[[random.Random], float]
+
+REFUSE = 'refuse'
+HANG = 'hang'
+ERROR = 'error'
+
+# Longest a HANG holds a request (it is released early when the outage ends)
+HANG_SECONDS = 30
+
+
+def constant(seconds: float) -> Distribution:
+    return lambda rng: seconds
+
+
+def uniform(low: float, high: float) -> Distribution:
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal(median: float, p99: float) -> Distribution:
+    """Right-skewed latency with the given median and 99th percentile"""
+    sigma = math.log(p99 / median) / 2.326
+    return lambda rng: rng.lognormvariate(math.log(median), sigma)
+
+
+def spikes(base: Distribution, spike: float, probability: float) -> Distribution:
+    """base, plus `spike` seconds on a `probability` share of requests (GC pauses, cold caches)"""
+    return lambda rng: base(rng) + (spike if rng.random() < probability else 0.0)
+
+
+class Phase:
+    """One step of a schedule: these settings hold for `seconds`"""
+
+    def __init__(self, seconds: float, latency: Optional[Distribution] = None,
+                 error_rate: Optional[float] = None, error_status: Optional[int] = None,
+                 outage: Optional[str] = None):
+        self.seconds = seconds
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.outage = outage
+
+
+class Decision:
+    """What to do with one request"""
+
+    __slots__ = ('delay', 'status', 'outage')
+
+    def __init__(self, delay: float, status: Optional[int] = None, outage: Optional[str] = None):
+        self.delay = delay
+        self.status = status
+        self.outage = outage
+
+
+class Faults:
+    def __init__(self, seed: int = 0):
+        self._lock = threading.Lock()
+        self.reset(seed)
+
+    def reset(self, seed: int = 0) -> None:
+        """Back to a healthy, zero-latency dependency"""
+        with self._lock:
+            self._rng = random.Random(seed)
+            self.latency: Distribution = constant(0.0)
+            self.error_rate = 0.0
+            self.error_status = 503
+            self._outages: List[Tuple[float, float, str]] = []
+            self._schedule: List[Phase] = []
+            self._schedule_start = 0.0
+
+    def configure(self, latency: Optional[Distribution] = None, error_rate: Optional[float] = None,
+                  error_status: Optional[int] = None) -> 'Faults':
+        with self._lock:
+            if latency is not None:
+                self.latency = latency
+            if error_rate is not None:
+                self.error_rate = error_rate
+            if error_status is not None:
+                self.error_status = error_status
+        return self
+
+    def outage(self, seconds: float, mode: str = REFUSE, after: float = 0.0) -> None:
+        """Be down for `seconds`, starting `after` seconds from now"""
+        start = time.monotonic() + after
+        with self._lock:
+            self._outages.append((start, start + seconds, mode))
+
+    @contextmanager
+    def down(self, mode: str = REFUSE):
+        """Be down for the duration of the block"""
+        window = [time.monotonic(), math.inf, mode]
+        with self._lock:
+            self._outages.append(window)
+        try:
+            yield
+        finally:
+            with self._lock:
+                if window in self._outages:  # unless reset() already cleared it
+                    self._outages.remove(window)
+
+    def schedule(self, *phases: Phase) -> None:
+        """Play phases back to back from now; the configured settings apply after the last"""
+        with self._lock:
+            self._schedule = list(phases)
+            self._schedule_start = time.monotonic()
+
+    def _phase(self, now: float) -> Optional[Phase]:
+        elapsed = now - self._schedule_start
+        for phase in self._schedule:
+            if elapsed < phase.seconds:
+                return phase
+            elapsed -= phase.seconds
+        return None
+
+    def _outage(self, now: float, phase: Optional[Phase]) -> Optional[str]:
+        for start, end, mode in self._outages:
+            if start <= now < end:
+                return mode
+        return phase.outage if phase else None
+
+    def current_outage(self) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            return self._outage(now, self._phase(now))
+
+    def decide(self) -> Decision:
+        now = time.monotonic()
+        with self._lock:
+            phase = self._phase(now)
+            outage = self._outage(now, phase)
+            latency = phase.latency if phase and phase.latency else self.latency
+            error_rate = phase.error_rate if phase and phase.error_rate is not None else self.error_rate
+            error_status = phase.error_status if phase and phase.error_status else self.error_status
+            delay = max(0.0, latency(self._rng))
+            failed = self._rng.random() < error_rate
+        if outage == ERROR:
+            return Decision(delay, error_status)
+        if outage:
+            return Decision(0.0, outage=outage)
+        return Decision(delay, error_status if failed else None)
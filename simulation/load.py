@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Closed-loop load generation for performance tests
+run_load() calls `send` from `concurrency` threads until `total` calls are
+done and returns each call's latency and status.
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+
+class LoadResult:
+    def __init__(self, latencies: List[float], statuses: List[int], elapsed: float):
+        self.latencies = sorted(latencies)
+        self.statuses = statuses
+        self.elapsed = elapsed
+
+    def percentile(self, pct: float) -> float:
+        index = min(len(self.latencies) - 1, int(len(self.latencies) * pct / 100))
+        return self.latencies[index]
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+    def count(self, status: int) -> int:
+        return self.statuses.count(status)
+
+    def __str__(self):
+        return (f"{len(self.latencies)} calls in {self.elapsed:.2f}s ({self.throughput:.0f}/s), "
+                f"p50 {self.percentile(50) * 1000:.1f}ms, p99 {self.percentile(99) * 1000:.1f}ms, "
+                f"statuses {sorted(set(self.statuses))}")
+
+
+def run_load(send: Callable[[int], int], total: int, concurrency: int,
+             interval: Optional[float] = None) -> LoadResult:
+    """send(i) -> HTTP status. With interval, call i starts no earlier than i * interval (open loop)."""
+    latencies, statuses = [], []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def one(i: int) -> None:
+        if interval:
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        began = time.perf_counter()
+        status = send(i)
+        with lock:
+            latencies.append(time.perf_counter() - began)
+            statuses.append(status)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return LoadResult(latencies, statuses, time.perf_counter() - start)
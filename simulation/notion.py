@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Notion pages API stand-in (NOTION_API_URL=<stub.url>)
+GET /v1/pages/<id> returns pages added with add_page(), in the shape of the
+real API, after checking the bearer token and Notion-Version header.
+"""
+
+import threading
+from typing import Dict, Optional
+
+from simulation.server import Request, StubServer
+
+
+def _error(status: int, code: str, message: str):
+    return status, {'object': 'error', 'status': status, 'code': code, 'message': message}
+
+
+class NotionStub(StubServer):
+    def __init__(self, seed: int = 0, token: Optional[str] = None):
+        super().__init__(seed)
+        self.token = token
+        self._lock = threading.Lock()
+        self.pages: Dict[str, Dict] = {}
+
+    def reset(self, seed: int = 0) -> None:
+        super().reset(seed)
+        with self._lock:
+            self.pages = {}
+
+    def error_body(self, status: int):
+        if status == 429:
+            return {'object': 'error', 'status': 429, 'code': 'rate_limited',
+                    'message': 'You have been rate limited. Please try again in a few minutes.'}
+        return {'object': 'error', 'status': status, 'code': 'service_unavailable',
+                'message': 'Notion is unavailable.'}
+
+    def add_page(self, page_id: str, title: str, url: Optional[str] = None, **properties) -> Dict:
+        page = {
+            'object': 'page',
+            'id': page_id,
+            'url': url or f"https://www.notion.so/{page_id.replace('-', '')}",
+            'properties': {
+                'Item': {'id': 'title', 'type': 'title', 'title': [{'type': 'text', 'plain_text': title}]},
+                **properties,
+            },
+        }
+        with self._lock:
+            self.pages[page_id.replace('-', '')] = page
+        return page
+
+    def handle(self, request: Request):
+        if self.token and request.headers.get('authorization') != f"Bearer {self.token}":
+            return _error(401, 'unauthorized', 'API token is invalid.')
+        if not request.headers.get('notion-version'):
+            return _error(400, 'missing_version', 'Notion-Version header failed validation.')
+        if request.method != 'GET' or not request.path.startswith('/v1/pages/'):
+            return _error(400, 'invalid_request_url', 'Invalid request URL.')
+        page_id = request.path[len('/v1/pages/'):]
+        with self._lock:
+            page = self.pages.get(page_id.replace('-', ''))
+        if page is None:
+            return _error(404, 'object_not_found', f'Could not find page with ID: {page_id}.')
+        return 200, page
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+PostgREST stand-in for Supabase (SUPABASE_URL=<stub.url>)
+Serves /rest/v1/<table> and /rest/v1/rpc/<function> from in-memory tables,
+with the subset of PostgREST that supabase-py sends for this app: select,
+eq/neq/gt/gte/lt/lte/is/in filters (and not.), order, limit, inserts with
+return=representation, deletes, and the claim/ack/nack and
+merge_chartink_alert_stats functions from create_table.sql.
+"""
+
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from simulation.server import Request, StubServer
+
+TABLES = ('chartink_alerts', 'controls', 'chartink_alert_stats')
+
+ALERT_DEFAULTS = {
+    'processing_status': 'new', 'claimed_by': None, 'lease_expires_at': None, 'attempts': 0,
+    'source_platform': 'ChartInk',
+}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _comparable(value):
+    """Numbers and ISO timestamps compare by value, like Postgres would (dates as UTC midnight)"""
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _matches(row: Dict, column: str, expression: str) -> bool:
+    negate = expression.startswith('not.')
+    if negate:
+        expression = expression[4:]
+    op, _, operand = expression.partition('.')
+    value = row.get(column)
+    if op == 'is':
+        result = value is None if operand == 'null' else value is (operand == 'true')
+    elif op == 'in':
+        result = str(value) in [item.strip('"') for item in operand.strip('()').split(',')]
+    elif value is None:
+        result = False
+    else:
+        left, right = _comparable(value), _comparable(operand)
+        if op == 'eq':
+            result = left == right or str(value) == operand
+        elif op == 'neq':
+            result = left != right
+        else:
+            try:
+                result = {'gt': left > right, 'gte': left >= right, 'lt': left < right, 'lte': left <= right}[op]
+            except (KeyError, TypeError):
+                raise ValueError(f"Unsupported filter {column}={expression}")
+    return result != negate
+
+
+def _error(status: int, code: str, message: str):
+    return status, {'code': code, 'message': message, 'details': None, 'hint': None}
+
+
+class PostgRESTStub(StubServer):
+    def __init__(self, seed: int = 0):
+        super().__init__(seed)
+        self._lock = threading.Lock()
+        self.tables: Dict[str, List[Dict]] = {}
+        self._next_id: Dict[str, int] = {}
+        self._reset_tables()
+
+    def _reset_tables(self) -> None:
+        with self._lock:
+            self.tables = {name: [] for name in TABLES}
+            self._next_id = {name: 1 for name in TABLES}
+
+    def reset(self, seed: int = 0) -> None:
+        super().reset(seed)
+        self._reset_tables()
+
+    def error_body(self, status: int):
+        if status == 503:
+            return {'code': 'PGRST000', 'message': 'Could not connect with the database', 'details': None,
+                    'hint': None}
+        return {'code': 'XX000', 'message': f'Simulated {status}', 'details': None, 'hint': None}
+
+    # Fixtures
+
+    def add_control(self, strategy: str, discord_webhook_url: Optional[str] = None,
+                    webhook_secret: Optional[str] = None) -> Dict:
+        return self.insert('controls', {'strategy': strategy, 'discord_webhook_url': discord_webhook_url,
+                                        'webhook_secret': webhook_secret})
+
+    def insert(self, table: str, row: Dict) -> Dict:
+        now = _now().isoformat()
+        with self._lock:
+            stored = {'id': self._next_id[table], 'created_at': now, 'updated_at': now}
+            if table == 'chartink_alerts':
+                stored.update(ALERT_DEFAULTS)
+            stored.update(row)
+            self._next_id[table] += 1
+            self.tables[table].append(stored)
+            return dict(stored)
+
+    def expire_leases(self) -> None:
+        """End every current lease now instead of waiting out lease_seconds"""
+        past = (_now() - timedelta(seconds=1)).isoformat()
+        with self._lock:
+            for row in self.tables['chartink_alerts']:
+                if row['processing_status'] == 'claimed':
+                    row['lease_expires_at'] = past
+
+    def rows(self, table: str, **equals) -> List[Dict]:
+        with self._lock:
+            return [dict(row) for row in self.tables[table]
+                    if all(row.get(column) == value for column, value in equals.items())]
+
+    # HTTP
+
+    def handle(self, request: Request):
+        path = request.path
+        if not path.startswith('/rest/v1/'):
+            return _error(404, 'PGRST000', f'Unknown path {path}')
+        name = path[len('/rest/v1/'):]
+        if name.startswith('rpc/'):
+            if request.method != 'POST':
+                return _error(405, 'PGRST117', 'Functions are called with POST')
+            return self._rpc(name[4:], request.json() or {})
+        if name not in self.tables:
+            return _error(404, '42P01', f'relation "public.{name}" does not exist')
+
+        if request.method == 'POST':
+            body = request.json()
+            rows = [self.insert(name, row) for row in (body if isinstance(body, list) else [body])]
+            return 201, rows
+        try:
+            filters = [(key, value) for key, value in request.query
+                       if key not in ('select', 'order', 'limit', 'offset')]
+            with self._lock:
+                selected = [row for row in self.tables[name]
+                            if all(_matches(row, column, expression) for column, expression in filters)]
+                if request.method == 'DELETE':
+                    self.tables[name] = [row for row in self.tables[name] if row not in selected]
+                selected = [dict(row) for row in selected]
+        except ValueError as e:
+            return _error(400, 'PGRST100', str(e))
+        if request.method == 'DELETE':
+            return 200, selected
+        if request.method != 'GET':
+            return _error(405, 'PGRST117', f'{request.method} not supported by the stand-in')
+
+        order = request.param('order')
+        if order:
+            for term in reversed(order.split(',')):
+                column, _, direction = term.partition('.')
+                selected.sort(key=lambda row: (row.get(column) is None, _comparable(row.get(column))),
+                              reverse=direction.startswith('desc'))
+        offset = int(request.param('offset') or 0)
+        limit = request.param('limit')
+        selected = selected[offset:offset + int(limit) if limit else None]
+        columns = [column.strip() for column in (request.param('select') or '*').split(',')]
+        if columns != ['*']:
+            selected = [{column: row.get(column) for column in columns} for row in selected]
+        return 200, selected
+
+    def _rpc(self, function: str, args: Dict):
+        handler = getattr(self, f'_rpc_{function}', None)
+        if handler is None:
+            return _error(404, 'PGRST202', f'Could not find the function public.{function}')
+        with self._lock:
+            result = handler(**args)
+        return (204, None) if result is None else (200, result)
+
+    def _rpc_claim_chartink_alerts(self, p_consumer: str, p_batch_size: int, p_lease_seconds: int,
+                                   p_max_attempts: int = 5):
+        now = _now()
+        claimed = []
+        for row in sorted(self.tables['chartink_alerts'], key=lambda r: r['id']):
+            expired = (row['processing_status'] == 'claimed' and row['lease_expires_at']
+                       and datetime.fromisoformat(row['lease_expires_at']) < now)
+            if expired and row['attempts'] >= p_max_attempts:
+                row.update(processing_status='failed', claimed_by=None, lease_expires_at=None)
+                continue
+            if len(claimed) >= p_batch_size:
+                continue
+            if (row['processing_status'] == 'new' or expired) and row['attempts'] < p_max_attempts:
+                row.update(processing_status='claimed', claimed_by=p_consumer, attempts=row['attempts'] + 1,
+                           lease_expires_at=(now + timedelta(seconds=p_lease_seconds)).isoformat())
+                claimed.append(dict(row))
+        return claimed
+
+    def _held(self, consumer: str, ids: List[int]) -> List[Dict]:
+        return [row for row in self.tables['chartink_alerts']
+                if row['id'] in ids and row['processing_status'] == 'claimed' and row['claimed_by'] == consumer]
+
+    def _rpc_ack_chartink_alerts(self, p_consumer: str, p_ids: List[int]):
+        rows = self._held(p_consumer, p_ids)
+        for row in rows:
+            row.update(processing_status='processed', lease_expires_at=None)
+        return [row['id'] for row in rows]
+
+    def _rpc_nack_chartink_alerts(self, p_consumer: str, p_ids: List[int], p_delay_seconds: int = 0,
+                                  p_max_attempts: int = 5):
+        rows = self._held(p_consumer, p_ids)
+        for row in rows:
+            if row['attempts'] >= p_max_attempts:
+                row.update(processing_status='failed', lease_expires_at=None)
+            elif p_delay_seconds > 0:
+                row.update(processing_status='claimed',
+                           lease_expires_at=(_now() + timedelta(seconds=p_delay_seconds)).isoformat())
+            else:
+                row.update(processing_status='new', lease_expires_at=None)
+            row['claimed_by'] = None
+        return [row['id'] for row in rows]
+
+    def _rpc_merge_chartink_alert_stats(self, deltas: List[Dict]):
+        table = self.tables['chartink_alert_stats']
+        for delta in deltas:
+            bucket = _comparable(delta['bucket_start'])
+            row = next((r for r in table if r['scan_name'] == delta['scan_name']
+                        and _comparable(r['bucket_start']) == bucket), None)
+            if row is None:
+                table.append({**delta, 'symbol_counts': dict(delta.get('symbol_counts') or {})})
+                continue
+            row['alert_count'] += delta['alert_count']
+            row['price_count'] += delta['price_count']
+            row['price_sum'] += delta['price_sum']
+            for symbol, count in (delta.get('symbol_counts') or {}).items():
+                row['symbol_counts'][symbol] = row['symbol_counts'].get(symbol, 0) + count
+            for column, pick in (('min_trigger_price', min), ('max_trigger_price', max)):
+                values = [v for v in (row.get(column), delta.get(column)) if v is not None]
+                row[column] = pick(values) if values else None
+        return None
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+RESP stand-in for the shared state server (REDIS_URL=<stub.url>)
+A threaded TCP server that speaks the Redis serialization protocol, with the
+commands state_store.RedisStateStore sends: GET, SET (NX, PX), DEL, INCRBY,
+PEXPIRE, PTTL, RPUSH, LRANGE, LTRIM, LLEN, MULTI/EXEC, AUTH, SELECT, PING,
+and EVAL of the take-token script (run in Python, since there is no Lua
+here). Faults apply per command: REFUSE and HANG drop the connection, an
+error status answers -ERR.
+"""
+
+import time
+import threading
+import socketserver
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from simulation.faults import HANG, HANG_SECONDS, REFUSE, Faults
+from state_store import _TAKE_TOKEN_SCRIPT
+
+
+class _Error(Exception):
+    """Becomes an error reply"""
+
+
+def _encode(reply) -> bytes:
+    if isinstance(reply, _Error):
+        return b'-%s\r\n' % str(reply).encode()
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, bool):
+        return b':%d\r\n' % reply
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, list):
+        return b'*%d\r\n' % len(reply) + b''.join(_encode(item) for item in reply)
+    if isinstance(reply, _Status):
+        return b'+%s\r\n' % reply.encode()
+    data = str(reply).encode()
+    return b'$%d\r\n%s\r\n' % (len(data), data)
+
+
+class _Status(str):
+    """Simple string reply (+OK) rather than a bulk string"""
+
+
+OK = _Status('OK')
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    stub: 'RespStub' = None
+
+    def _read_command(self) -> Optional[List[str]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if line[:1] != b'*':
+            raise _Error('ERR Protocol error: expected an array')
+        args = []
+        for _ in range(int(line[1:-2])):
+            header = self.rfile.readline()
+            length = int(header[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+    def handle(self):
+        session = {'authenticated': self.stub.password is None, 'queued': None}
+        with self.stub._lock:
+            self.stub.connections += 1
+        try:
+            self._serve_commands(session)
+        finally:
+            with self.stub._lock:
+                self.stub.closed += 1
+
+    def _serve_commands(self, session: Dict) -> None:
+        while True:
+            try:
+                args = self._read_command()
+            except (_Error, OSError, ValueError):
+                return
+            if args is None:
+                return
+            reply = self.stub._serve(args, session)
+            if reply is _DROP:
+                return
+            try:
+                self.wfile.write(_encode(reply))
+            except OSError:
+                return
+
+
+_DROP = object()
+
+
+class RespStub:
+    """Use as a context manager or call start()/stop(), like the HTTP stand-ins"""
+
+    def __init__(self, seed: int = 0, password: Optional[str] = None):
+        self.faults = Faults(seed)
+        self.password = password
+        self.calls: List[List[str]] = []
+        self.connections = 0  # accepted so far
+        self.closed = 0  # of those, ended by either side
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        handler = type('RespStubHandler', (_Handler,), {'stub': self})
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+        self._reset_data()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        password = f":{self.password}@" if self.password else ''
+        return f"redis://{password}{host}:{port}/0"
+
+    def start(self) -> 'RespStub':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='RespStub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _reset_data(self) -> None:
+        with self._lock:
+            self._values: Dict[str, Tuple[str, Optional[float]]] = {}
+            self._lists: Dict[str, deque] = {}
+
+    def reset(self, seed: int = 0) -> None:
+        """Forget data, recorded commands and faults"""
+        self.faults.reset(seed)
+        self._reset_data()
+        with self._lock:
+            self.calls = []
+            self.connections = 0
+            self.closed = 0
+
+    # Inspection
+
+    def commands(self, name: str) -> List[List[str]]:
+        with self._lock:
+            return [call for call in self.calls if call[0].upper() == name.upper()]
+
+    def ttl(self, key: str) -> Optional[float]:
+        """Seconds until key expires, None without an expiry (KeyError if absent)"""
+        with self._lock:
+            if self._live(key, time.monotonic()) is None:
+                raise KeyError(key)
+            expires_at = self._values[key][1]
+            return None if expires_at is None else expires_at - time.monotonic()
+
+    # Protocol
+
+    def _serve(self, args: List[str], session: Dict):
+        with self._lock:
+            self.calls.append(args)
+        decision = self.faults.decide()
+        if decision.outage == HANG:
+            deadline = time.monotonic() + HANG_SECONDS
+            while (self.faults.current_outage() == HANG and time.monotonic() < deadline
+                   and not self._stopping.wait(0.05)):
+                pass
+        if decision.outage in (HANG, REFUSE):
+            return _DROP
+        if decision.delay:
+            time.sleep(decision.delay)
+        if decision.status is not None:
+            return _Error(f'ERR simulated failure ({decision.status})')
+
+        name = args[0].upper()
+        if name == 'AUTH':
+            if args[-1] != self.password:
+                return _Error('WRONGPASS invalid username-password pair')
+            session['authenticated'] = True
+            return OK
+        if not session['authenticated']:
+            return _Error('NOAUTH Authentication required.')
+        if name == 'MULTI':
+            if session['queued'] is not None:
+                return _Error('ERR MULTI calls can not be nested')
+            session['queued'] = []
+            return OK
+        if name == 'EXEC':
+            queued, session['queued'] = session['queued'], None
+            if queued is None:
+                return _Error('ERR EXEC without MULTI')
+            with self._lock:
+                return [self._execute(command) for command in queued]
+        if name == 'DISCARD':
+            session['queued'] = None
+            return OK
+        if session['queued'] is not None:
+            session['queued'].append(args)
+            return _Status('QUEUED')
+        with self._lock:
+            return self._execute(args)
+
+    def _live(self, key: str, now: float) -> Optional[str]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._values[key]
+            return None
+        return entry[0]
+
+    def _execute(self, args: List[str]):
+        """Run one command; the caller holds the lock"""
+        name, args = args[0].upper(), args[1:]
+        handler = getattr(self, f'_cmd_{name.lower()}', None)
+        if handler is None:
+            return _Error(f"ERR unknown command '{name}'")
+        try:
+            return handler(time.monotonic(), *args)
+        except _Error as e:
+            return e
+        except (TypeError, ValueError):
+            return _Error(f"ERR wrong number or type of arguments for '{name.lower()}' command")
+
+    def _cmd_ping(self, now):
+        return _Status('PONG')
+
+    def _cmd_select(self, now, db):
+        return OK
+
+    def _cmd_get(self, now, key):
+        if key in self._lists:
+            raise _Error('WRONGTYPE Operation against a key holding the wrong kind of value')
+        return self._live(key, now)
+
+    def _cmd_set(self, now, key, value, *options):
+        options = [option.upper() for option in options]
+        expires_at = None
+        if 'PX' in options:
+            milliseconds = int(options[options.index('PX') + 1])
+            if milliseconds <= 0:
+                raise _Error("ERR invalid expire time in 'set' command")
+            expires_at = now + milliseconds / 1000
+        if 'NX' in options and self._live(key, now) is not None:
+            return None
+        self._values[key] = (value, expires_at)
+        return OK
+
+    def _cmd_del(self, now, *keys):
+        removed = 0
+        for key in keys:
+            removed += self._live(key, now) is not None
+            self._values.pop(key, None)
+            removed += self._lists.pop(key, None) is not None
+        return removed
+
+    def _cmd_incrby(self, now, key, amount):
+        current = self._live(key, now)
+        try:
+            value = int(current or 0) + int(amount)
+        except ValueError:
+            raise _Error('ERR value is not an integer or out of range')
+        expires_at = self._values[key][1] if current is not None else None
+        self._values[key] = (str(value), expires_at)
+        return value
+
+    def _cmd_pexpire(self, now, key, milliseconds):
+        current = self._live(key, now)
+        if current is None:
+            return 0
+        self._values[key] = (current, now + int(milliseconds) / 1000)
+        return 1
+
+    def _cmd_pttl(self, now, key):
+        if self._live(key, now) is None:
+            return -2
+        expires_at = self._values[key][1]
+        return -1 if expires_at is None else int((expires_at - now) * 1000)
+
+    def _cmd_rpush(self, now, key, *values):
+        items = self._lists.setdefault(key, deque())
+        items.extend(values)
+        return len(items)
+
+    def _cmd_lrange(self, now, key, start, stop):
+        items = list(self._lists.get(key, ()))
+        stop = int(stop)
+        return items[int(start):None if stop == -1 else stop + 1]
+
+    def _cmd_ltrim(self, now, key, start, stop):
+        items = list(self._lists.get(key, ()))
+        stop = int(stop)
+        kept = items[int(start):None if stop == -1 else stop + 1]
+        if kept:
+            self._lists[key] = deque(kept)
+        else:
+            self._lists.pop(key, None)
+        return OK
+
+    def _cmd_llen(self, now, key):
+        return len(self._lists.get(key, ()))
+
+    def _cmd_eval(self, now, script, numkeys, *rest):
+        keys, argv = rest[:int(numkeys)], rest[int(numkeys):]
+        if script != _TAKE_TOKEN_SCRIPT:
+            raise _Error('NOSCRIPT the stand-in only runs the take-token script')
+        return self._take_token(now, keys[0], *argv)
+
+    def _take_token(self, now, key, rate, burst, client_now):
+        # Mirrors _TAKE_TOKEN_SCRIPT; the bucket is in client time, expiry in ours
+        rate, burst, client_now = float(rate), float(burst), float(client_now)
+        current = self._live(key, now)
+        tat = max(float(current), client_now) if current is not None else client_now
+        wait = tat - (burst - 1) / rate - client_now
+        if wait > 0:
+            return str(wait)
+        tat += 1 / rate
+        self._values[key] = ('%.6f' % tat, now + max(0.001, tat - client_now))
+        return '0'
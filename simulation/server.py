@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Threaded local HTTP server that the dependency stand-ins build on
+A subclass implements handle(request) -> (status, body[, headers]); the base
+class applies the Faults decision first (latency, error responses, dropped
+or hanging connections) and records every request in `calls`.
+"""
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from simulation.faults import HANG, HANG_SECONDS, REFUSE, Faults
+
+
+class Request:
+    """One request as the stand-in saw it"""
+
+    __slots__ = ('method', 'path', 'query', 'headers', 'body', 'received_at', 'status')
+
+    def __init__(self, method: str, path: str, query: List[Tuple[str, str]], headers: Dict[str, str],
+                 body: bytes):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.received_at = time.monotonic()
+        self.status: Optional[int] = None  # None if the connection was dropped
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+    def param(self, name: str) -> Optional[str]:
+        for key, value in self.query:
+            if key == name:
+                return value
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real services
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+    stub: 'StubServer' = None
+
+    def _dispatch(self):
+        self.stub._serve(self)
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _dispatch
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer:
+    """Base for the stand-ins; use as a context manager or call start()/stop()"""
+
+    def __init__(self, seed: int = 0):
+        self.faults = Faults(seed)
+        self.calls: List[Request] = []
+        self._calls_lock = threading.Lock()
+        self._stopping = threading.Event()
+        handler = type(f'{type(self).__name__}Handler', (_Handler,), {'stub': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopping.set()  # releases hanging requests
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self, seed: int = 0) -> None:
+        """Forget recorded calls and faults (subclasses also clear their data)"""
+        self.faults.reset(seed)
+        with self._calls_lock:
+            self.calls = []
+
+    def requests_to(self, path_prefix: str, method: Optional[str] = None) -> List[Request]:
+        with self._calls_lock:
+            return [call for call in self.calls
+                    if call.path.startswith(path_prefix) and (method is None or call.method == method)]
+
+    def handle(self, request: Request):
+        """(status, JSON-able body or None[, headers]) for a request that got through"""
+        raise NotImplementedError
+
+    def error_body(self, status: int):
+        return {'message': f'Simulated {status}'}
+
+    def _serve(self, http: BaseHTTPRequestHandler) -> None:
+        parts = urlsplit(http.path)
+        length = int(http.headers.get('Content-Length') or 0)
+        request = Request(http.command, parts.path, parse_qsl(parts.query, keep_blank_values=True),
+                          {name.lower(): value for name, value in http.headers.items()},
+                          http.rfile.read(length) if length else b'')
+        with self._calls_lock:
+            self.calls.append(request)
+
+        decision = self.faults.decide()
+        if decision.outage == HANG:
+            deadline = time.monotonic() + HANG_SECONDS
+            while (self.faults.current_outage() == HANG and time.monotonic() < deadline
+                   and not self._stopping.wait(0.05)):
+                pass
+        if decision.outage in (HANG, REFUSE):
+            http.close_connection = True
+            return
+        if decision.delay:
+            time.sleep(decision.delay)
+
+        headers = {}
+        if decision.status is not None:
+            status, body = decision.status, self.error_body(decision.status)
+        else:
+            try:
+                status, body, *rest = self.handle(request)
+                headers = rest[0] if rest else {}
+            except Exception as e:
+                status, body = 500, {'message': f'{type(e).__name__}: {e}'}
+        request.status = status
+
+        payload = b'' if body is None else json.dumps(body).encode()
+        http.send_response(status)
+        if payload:
+            http.send_header('Content-Type', 'application/json; charset=utf-8')
+        http.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            http.send_header(name, str(value))
+        http.end_headers()
+        http.wfile.write(payload)
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Shared state backends for the webhook server
+Caches, dedup keys, rate-limit counters and delivery queues live behind one
+small interface so several instances can run behind a load balancer.
+
+STATE_BACKEND=memory (default) keeps everything in process.
+STATE_BACKEND=redis talks RESP to REDIS_URL (Redis or any compatible server).
+"""
+
+import os
+import socket
+import threading
+import time
+import logging
+from collections import deque
+from queue import Queue, Empty, Full
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """Interface shared by all backends. Keys and values are strings."""
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def add_if_absent(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """Set key only if it does not exist. Returns True if it was set."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Increment a counter; ttl is applied when the counter is created."""
+        raise NotImplementedError
+
+    def take_token(self, key: str, rate: float, burst: float) -> float:
+        """
+        Token bucket of `burst` tokens refilled at `rate` per second (GCRA).
+        Takes one token and returns 0, or returns the seconds until one is free.
+        """
+        raise NotImplementedError
+
+    def push(self, queue: str, value: str) -> int:
+        """Append to a queue. Returns the new queue length."""
+        raise NotImplementedError
+
+    def pop(self, queue: str, count: int = 1) -> List[str]:
+        """Remove and return up to count items from the head of a queue."""
+        raise NotImplementedError
+
+    def queue_length(self, queue: str) -> int:
+        raise NotImplementedError
+
+    def ping(self) -> bool:
+        return True
+
+
+class MemoryStateStore(StateStore):
+    """In-process backend. State is private to each worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._queues: Dict[str, deque] = {}
+
+    def _live(self, key: str, now: float) -> Optional[str]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._values[key]
+            return None
+        return value
+
+    @staticmethod
+    def _expiry(ttl: Optional[float], now: float) -> Optional[float]:
+        return now + ttl if ttl else None
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._live(key, time.time())
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._values[key] = (value, self._expiry(ttl, now))
+
+    def add_if_absent(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._values[key] = (value, self._expiry(ttl, now))
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        with self._lock:
+            current = self._live(key, now)
+            if current is None:
+                value = amount
+                expires_at = self._expiry(ttl, now)
+            else:
+                value = int(current) + amount
+                expires_at = self._values[key][1]
+            self._values[key] = (str(value), expires_at)
+            return value
+
+    def take_token(self, key: str, rate: float, burst: float) -> float:
+        now = time.time()
+        with self._lock:
+            current = self._live(key, now)
+            tat = max(float(current), now) if current is not None else now
+            wait = tat - (burst - 1) / rate - now
+            if wait > 0:
+                return wait
+            tat += 1 / rate
+            self._values[key] = (repr(tat), tat)
+            return 0.0
+
+    def push(self, queue: str, value: str) -> int:
+        with self._lock:
+            q = self._queues.setdefault(queue, deque())
+            q.append(value)
+            return len(q)
+
+    def pop(self, queue: str, count: int = 1) -> List[str]:
+        with self._lock:
+            q = self._queues.get(queue)
+            if not q:
+                return []
+            return [q.popleft() for _ in range(min(count, len(q)))]
+
+    def queue_length(self, queue: str) -> int:
+        with self._lock:
+            return len(self._queues.get(queue, ()))
+
+
+class RespError(Exception):
+    """Error reply from a RESP server"""
+
+
+class _RespConnection:
+    """One blocking connection speaking the Redis serialization protocol."""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by state server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RespError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length == -1:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2].decode()
+        if kind == b'*':
+            length = int(rest)
+            if length == -1:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RespError(f"Unexpected reply: {line!r}")
+
+    def execute(self, *args):
+        self.sock.sendall(self._encode(args))
+        return self._read_reply()
+
+    def pipeline(self, commands: List[tuple]) -> list:
+        self.sock.sendall(b''.join(self._encode(c) for c in commands))
+        return [self._read_reply() for _ in commands]
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+# GCRA: the key holds the bucket's theoretical arrival time. Returns the wait
+# as a string because Lua numbers are truncated to integers in replies.
+_TAKE_TOKEN_SCRIPT = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+local wait = tat - (burst - 1) / rate - now
+if wait > 0 then return tostring(wait) end
+tat = tat + 1 / rate
+redis.call('SET', KEYS[1], string.format('%.6f', tat), 'PX', math.ceil((tat - now) * 1000))
+return '0'
+"""
+
+
+class RedisStateStore(StateStore):
+    """
+    Networked backend over RESP, shared by every instance pointing at the
+    same server. Uses a bounded pool of blocking connections.
+    """
+
+    def __init__(self, url: str, key_prefix: str = '', pool_size: int = 8, timeout: float = 1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self._pool: Queue = Queue(maxsize=pool_size)
+
+    def _connect(self) -> _RespConnection:
+        conn = _RespConnection(self.host, self.port, self.timeout)
+        if self.password:
+            conn.execute('AUTH', self.password)
+        if self.db:
+            conn.execute('SELECT', self.db)
+        return conn
+
+    def _run(self, commands: List[tuple]) -> list:
+        try:
+            conn = self._pool.get_nowait()
+        except Empty:
+            conn = self._connect()
+        try:
+            replies = conn.pipeline(commands)
+        except BaseException:
+            # Replies after a failed one are still unread; never reuse the connection
+            conn.close()
+            raise
+        try:
+            self._pool.put_nowait(conn)
+        except Full:
+            conn.close()
+        return replies
+
+    def _key(self, key: str) -> str:
+        return self.key_prefix + key
+
+    def get(self, key: str) -> Optional[str]:
+        return self._run([('GET', self._key(key))])[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        cmd = ('SET', self._key(key), value)
+        if ttl:
+            cmd += ('PX', int(ttl * 1000))
+        self._run([cmd])
+
+    def add_if_absent(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        cmd = ('SET', self._key(key), value, 'NX')
+        if ttl:
+            cmd += ('PX', int(ttl * 1000))
+        return self._run([cmd])[0] == 'OK'
+
+    def delete(self, key: str) -> None:
+        self._run([('DEL', self._key(key))])
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        key = self._key(key)
+        if not ttl:
+            return self._run([('INCRBY', key, amount)])[0]
+        # SET NX only creates the key (with its expiry, so windows do not slide);
+        # MULTI keeps it and the increment atomic against other workers
+        replies = self._run([
+            ('MULTI',),
+            ('SET', key, 0, 'NX', 'PX', max(1, int(ttl * 1000))),
+            ('INCRBY', key, amount),
+            ('EXEC',),
+        ])
+        return replies[-1][1]
+
+    def take_token(self, key: str, rate: float, burst: float) -> float:
+        # Client clock: every worker reads the same host clock (or NTP)
+        reply = self._run([('EVAL', _TAKE_TOKEN_SCRIPT, 1, self._key(key), rate, burst, repr(time.time()))])[0]
+        return float(reply)
+
+    def push(self, queue: str, value: str) -> int:
+        return self._run([('RPUSH', self._key(queue), value)])[0]
+
+    def pop(self, queue: str, count: int = 1) -> List[str]:
+        key = self._key(queue)
+        replies = self._run([
+            ('MULTI',),
+            ('LRANGE', key, 0, count - 1),
+            ('LTRIM', key, count, -1),
+            ('EXEC',),
+        ])
+        return replies[-1][0] or []
+
+    def queue_length(self, queue: str) -> int:
+        return self._run([('LLEN', self._key(queue))])[0]
+
+    def ping(self) -> bool:
+        try:
+            return self._run([('PING',)])[0] == 'PONG'
+        except (OSError, ConnectionError, RespError):
+            return False
+
+
+def create_state_store() -> StateStore:
+    """Build the backend selected by STATE_BACKEND"""
+    backend = os.getenv('STATE_BACKEND', 'memory').lower()
+    if backend == 'redis':
+        url = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+        prefix = os.getenv('STATE_KEY_PREFIX', 'chartink-webhook:')
+        logger.info(f"Using networked state backend at {urlparse(url).hostname}")
+        return RedisStateStore(url, key_prefix=prefix, pool_size=int(os.getenv('STATE_POOL_SIZE', 8)))
+    if backend != 'memory':
+        raise ValueError(f"Unknown STATE_BACKEND: {backend}")
+    return MemoryStateStore()
@@ -0,0 +1,133 @@
+"""
+ChartInk digests: throttle windows, batching into one message per
+destination, shared windows across instances and message formatting
+"""
+
+from datetime import datetime
+
+import pytest
+
+from conftest import CHARTINK_PAYLOAD, wait_until
+from state_store import MemoryStateStore
+
+
+@pytest.fixture
+def store():
+    return MemoryStateStore()
+
+
+@pytest.fixture
+def digest(server, store):
+    buffer = server.ChartInkDigestBuffer(store, window_seconds=60)
+    yield buffer
+    buffer.flush_all()  # cancel timers left by the test
+
+
+def alert(server, scan='Breakouts', stocks=('TCS', 'INFY'), prices=(3500.0, 1500.0), minute=25):
+    return {'scan_name': scan, 'stocks': list(stocks), 'trigger_prices': list(prices),
+            'received_at': datetime(2026, 1, 5, 9, minute, 4, tzinfo=server.MARKET_TIMEZONE)}
+
+
+def test_zero_window_posts_each_alert_on_its_own(server, discord, digest):
+    digest.add('AUDIT', discord.webhook('AUDIT'), alert(server), window_seconds=0)
+
+    [message] = discord.messages('AUDIT')
+    assert message['content'].splitlines() == [
+        '\U0001f4c8 **Breakouts** (09:20 candle)',
+        '2 stocks: TCS@3500.0, INFY@1500.0',
+    ]
+    assert message['username'] == 'ChartInk'
+
+
+def test_alerts_in_one_window_go_out_as_one_digest(server, discord, digest):
+    url = discord.webhook('AUDIT')
+    digest.add('AUDIT', url, alert(server, 'Breakouts'))
+    digest.add('AUDIT', url, alert(server, 'Volume spike', ('SBIN',), (600.0,)))
+    digest.add('AUDIT', url, alert(server, 'Late', ('ITC',), (), minute=31))
+    assert discord.messages('AUDIT') == []  # held for the window
+
+    deliveries = digest.flush('AUDIT', url)
+
+    assert [d['target'] for d in deliveries] == ['AUDIT']
+    [message] = discord.messages('AUDIT')
+    assert message['content'].splitlines() == [
+        '\U0001f4ca **2 scans fired on 09:20 candle**',
+        '• **Breakouts** — 2 stocks: TCS@3500.0, INFY@1500.0',
+        '• **Volume spike** — 1 stocks: SBIN@600.0',
+        '',
+        '\U0001f4ca **1 scans fired on 09:25 candle**',
+        '• **Late** — 1 stocks: ITC',
+    ]
+    assert digest.flush('AUDIT', url) is None  # nothing left
+    assert digest._timers == {}
+
+
+def test_window_timer_posts_the_digest(server, discord, store):
+    digest = server.ChartInkDigestBuffer(store, window_seconds=0.2)
+    url = discord.webhook('AUDIT')
+    digest.add('AUDIT', url, alert(server, 'Breakouts'))
+    digest.add('AUDIT', url, alert(server, 'Volume spike'))
+
+    assert wait_until(lambda: discord.messages('AUDIT'))
+    assert len(discord.messages('AUDIT')) == 1
+    assert '2 scans fired' in discord.messages('AUDIT')[0]['content']
+
+    # The next alert opens a new window
+    digest.add('AUDIT', url, alert(server, 'Again'))
+    assert wait_until(lambda: len(discord.messages('AUDIT')) == 2)
+    assert '**Again**' in discord.messages('AUDIT')[1]['content']
+
+
+def test_destinations_are_batched_separately(server, discord, digest):
+    digest.add('AUDIT', discord.webhook('AUDIT'), alert(server, 'Breakouts'))
+    digest.add('CIO', discord.webhook('CIO'), alert(server, 'Volume spike'))
+
+    digest.flush_all()
+
+    assert '**Breakouts**' in discord.messages('AUDIT')[0]['content']
+    assert '**Volume spike**' in discord.messages('CIO')[0]['content']
+    assert len(discord.messages('AUDIT')) == len(discord.messages('CIO')) == 1
+
+
+def test_instances_sharing_a_store_post_one_digest(server, discord, digest, store):
+    other = server.ChartInkDigestBuffer(store, window_seconds=60)
+    url = discord.webhook('AUDIT')
+    digest.add('AUDIT', url, alert(server, 'Breakouts'))
+    other.add('AUDIT', url, alert(server, 'Volume spike'))
+
+    other.flush_all()  # owns no window
+    assert discord.messages('AUDIT') == []
+    digest.flush_all()
+
+    [message] = discord.messages('AUDIT')
+    assert '**Breakouts**' in message['content'] and '**Volume spike**' in message['content']
+
+
+def test_long_digests_are_shortened(server, discord, digest):
+    url = discord.webhook('AUDIT')
+    many = [f'S{i}' for i in range(40)]
+    for i in range(60):
+        digest.add('AUDIT', url, alert(server, f'Scan {i:02}', many, [float(i)] * 40))
+
+    digest.flush('AUDIT', url)
+
+    content = discord.messages('AUDIT')[0]['content']
+    assert len(content) <= 1950
+    assert content.endswith('… [truncated]')
+    assert '40 stocks: S0@0.0, S1@0.0' in content and '+32 more' in content
+
+
+def test_published_alerts_use_the_per_scan_window(client, server, discord, digest, monkeypatch):
+    monkeypatch.setattr(server, '_chartink_digest', digest)
+    monkeypatch.setattr(server, 'CHARTINK_DISCORD_ENABLED', True)
+    monkeypatch.setattr(server, '_routing_rules', {
+        'chartink': {'SHORT TERM BREAKOUTS': ['AUDIT', 'CIO']},
+        'chartink_throttle': {'SHORT TERM BREAKOUTS': 0},
+    })
+
+    assert client.post('/webhook/chartink', json=CHARTINK_PAYLOAD).status_code == 200
+
+    for name in ('AUDIT', 'CIO'):
+        assert wait_until(lambda: discord.messages(name))
+        assert 'SEPOWER@3.75, ASTEC@541.8, EDUCOMP@2.1' in discord.messages(name)[0]['content']
+    assert digest._timers == {}
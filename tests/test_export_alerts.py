@@ -0,0 +1,139 @@
+"""
+export_alerts.py against the PostgREST stand-in: partitioning, explosion into
+one row per symbol, incremental resumes and both output formats
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import SERVICE_ROLE_KEY
+
+pa = pytest.importorskip('pyarrow')
+import pyarrow.dataset as ds  # noqa: E402
+
+import export_alerts  # noqa: E402
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+
+@pytest.fixture
+def client(supabase):
+    from supabase import create_client
+    return create_client(supabase.url, SERVICE_ROLE_KEY)
+
+
+def add_alert(supabase, created_at: datetime, stocks, prices, scan='Breakouts'):
+    return supabase.insert('chartink_alerts', {
+        'created_at': created_at.isoformat(), 'scan_name': scan, 'scan_url': scan.lower(),
+        'alert_name': f'Alert for {scan}', 'stocks': stocks, 'trigger_prices': prices, 'total_stocks': len(stocks),
+    })
+
+
+def partitions(out_dir):
+    return sorted(name for name in os.listdir(out_dir) if name.startswith('date='))
+
+
+def read_rows(out_dir, fmt='parquet'):
+    table = ds.dataset(out_dir, format='ipc' if fmt == 'arrow' else fmt, partitioning='hive').to_table()
+    return sorted(table.to_pylist(), key=lambda row: (row['alert_id'], row['position']))
+
+
+def test_full_export_writes_one_row_per_symbol_by_trading_date(supabase, client, tmp_path):
+    out = str(tmp_path / 'export')
+    add_alert(supabase, datetime(2025, 1, 2, 10, 0, tzinfo=IST), ['TCS', 'INFY'], [3500.5, 1500.25])
+    # 20:00 UTC is already the next trading date in India
+    add_alert(supabase, datetime(2025, 1, 2, 20, 0, tzinfo=timezone.utc), ['SBIN'], [600.0])
+    add_alert(supabase, datetime(2025, 1, 3, 11, 0, tzinfo=IST), ['RELIANCE', 'HDFCBANK'], [2500.0])
+
+    summary = export_alerts.export_alerts(client, out, page_size=2)
+
+    assert summary == {'files': 2, 'rows': 5, 'last_id': 3}
+    assert partitions(out) == ['date=2025-01-02', 'date=2025-01-03']
+    rows = read_rows(out)
+    assert [(row['alert_id'], row['position'], row['symbol'], row['trigger_price']) for row in rows] == [
+        (1, 0, 'TCS', 3500.5), (1, 1, 'INFY', 1500.25),
+        (2, 0, 'SBIN', 600.0),
+        (3, 0, 'RELIANCE', 2500.0), (3, 1, 'HDFCBANK', None),  # missing price stays null
+    ]
+    assert {row['scan_name'] for row in rows} == {'Breakouts'}
+
+
+def test_incremental_export_resumes_and_skips_the_open_day(supabase, client, tmp_path):
+    out = str(tmp_path / 'export')
+    now = datetime.now(IST)
+    add_alert(supabase, now - timedelta(days=2), ['TCS'], [3500.0])
+    add_alert(supabase, now, ['INFY'], [1500.0])
+
+    first = export_alerts.export_alerts(client, out, incremental=True)
+    assert (first['rows'], first['last_id']) == (1, 1)
+    assert export_alerts.load_state(out)['last_id'] == 1
+
+    add_alert(supabase, now, ['SBIN'], [600.0])
+    again = export_alerts.export_alerts(client, out, incremental=True)
+    assert (again['rows'], again['last_id']) == (0, 1)  # today is still open
+    assert [row['symbol'] for row in read_rows(out)] == ['TCS']
+
+
+def test_since_limits_the_export(supabase, client, tmp_path):
+    out = str(tmp_path / 'export')
+    add_alert(supabase, datetime(2024, 12, 31, 10, 0, tzinfo=IST), ['OLD'], [1.0])
+    add_alert(supabase, datetime(2025, 1, 2, 10, 0, tzinfo=IST), ['NEW'], [2.0])
+
+    export_alerts.export_alerts(client, out, since='2025-01-01')
+
+    assert [row['symbol'] for row in read_rows(out)] == ['NEW']
+
+
+def test_arrow_format(supabase, client, tmp_path):
+    out = str(tmp_path / 'export')
+    add_alert(supabase, datetime(2025, 1, 2, 10, 0, tzinfo=IST), ['TCS', 'INFY'], [3500.0, 1500.0])
+
+    export_alerts.export_alerts(client, out, fmt='arrow')
+
+    assert os.listdir(os.path.join(out, 'date=2025-01-02')) == ['part-1-1.arrow']
+    assert [row['symbol'] for row in read_rows(out, 'arrow')] == ['TCS', 'INFY']
+
+
+def test_full_export_replaces_the_days_it_rewrites(supabase, client, tmp_path):
+    out = str(tmp_path / 'export')
+    add_alert(supabase, datetime(2025, 1, 2, 10, 0, tzinfo=IST), ['TCS'], [3500.0])
+    add_alert(supabase, datetime(2025, 1, 3, 10, 0, tzinfo=IST), ['INFY'], [1500.0])
+    export_alerts.export_alerts(client, out)
+
+    add_alert(supabase, datetime(2025, 1, 3, 14, 0, tzinfo=IST), ['SBIN'], [600.0])
+    export_alerts.export_alerts(client, out)
+
+    assert os.listdir(os.path.join(out, 'date=2025-01-02')) == ['part-1-1.parquet']
+    assert os.listdir(os.path.join(out, 'date=2025-01-03')) == ['part-2-3.parquet']
+    assert [row['symbol'] for row in read_rows(out)] == ['TCS', 'INFY', 'SBIN']
+
+
+def test_failed_write_keeps_the_previous_file(supabase, client, tmp_path, monkeypatch):
+    out = str(tmp_path / 'export')
+    add_alert(supabase, datetime(2025, 1, 2, 10, 0, tzinfo=IST), ['TCS'], [3500.0])
+    export_alerts.export_alerts(client, out)
+    add_alert(supabase, datetime(2025, 1, 2, 14, 0, tzinfo=IST), ['INFY'], [1500.0])
+
+    def disk_full(table, path, **kwargs):
+        with open(path, 'wb') as f:
+            f.write(b'PAR1 half a file')
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(export_alerts.pq, 'write_table', disk_full)
+    with pytest.raises(OSError):
+        export_alerts.export_alerts(client, out)
+
+    assert os.listdir(os.path.join(out, 'date=2025-01-02')) == ['part-1-1.parquet']
+    assert [row['symbol'] for row in read_rows(out)] == ['TCS']
+
+
+def test_since_date_starts_at_market_midnight(supabase, client, tmp_path):
+    out = str(tmp_path / 'export')
+    add_alert(supabase, datetime(2024, 12, 31, 23, 0, tzinfo=IST), ['OLD'], [1.0])
+    add_alert(supabase, datetime(2025, 1, 1, 2, 0, tzinfo=IST), ['EARLY'], [2.0])  # still Dec 31 in UTC
+
+    export_alerts.export_alerts(client, out, since='2025-01-01')
+
+    assert [row['symbol'] for row in read_rows(out)] == ['EARLY']
@@ -0,0 +1,246 @@
+"""
+Regression tests for slow, failing and rate-limiting dependencies
+"""
+
+import json
+import time
+import threading
+
+from conftest import CHARTINK_PAYLOAD, wait_until
+from simulation import ERROR, HANG, REFUSE, Phase, constant
+
+
+def post_tradingview(client, strategy='CIO', content='signal'):
+    return client.post('/webhook/tradingview', data=json.dumps({'strategy': strategy, 'content': content}))
+
+
+# Supabase
+
+def test_storage_outage_spools_then_replays(client, server, supabase):
+    with supabase.faults.down(REFUSE):
+        resp = client.post('/webhook/chartink', json=CHARTINK_PAYLOAD)
+        assert resp.status_code == 202
+        assert resp.get_json()['spooled'] is True
+        assert server.alert_spool.count() == 1
+
+    assert wait_until(lambda: supabase.rows('chartink_alerts'))
+    assert wait_until(lambda: server.alert_spool.count() == 0)
+
+
+def test_rejected_spool_record_does_not_block_the_ones_behind_it(server, supabase):
+    rejected_labels = {'dependency': 'storage', 'action': 'rejected'}
+    rejected_before = server.metrics.value('fallback_total', rejected_labels)
+    good = {'scan_name': 'Good', 'scan_url': 'good', 'alert_name': 'Good', 'stocks': ['ASTEC'],
+            'trigger_prices': [541.8], 'total_stocks': 1}
+    server.alert_spool.append({'alert': None})  # storage answers, but can never take it
+    server.alert_spool.append({'alert': good})
+    server.alert_spool.append({'alert': {**good, 'scan_name': 'Also good'}})
+    server.start_recovery()
+
+    assert wait_until(lambda: server.alert_spool.count() == 0)
+    assert [row['scan_name'] for row in supabase.rows('chartink_alerts')] == ['Good', 'Also good']
+    with open(server.alert_spool.rejected_path) as f:
+        rejected = [json.loads(line) for line in f]
+    assert len(rejected) == 1 and rejected[0]['alert'] is None
+    assert server.metrics.value('fallback_total', rejected_labels) == rejected_before + 1
+
+
+def test_storage_timeout_is_bounded_and_spooled(client, server, supabase):
+    with supabase.faults.down(HANG):
+        started = time.monotonic()
+        resp = client.post('/webhook/chartink', json=CHARTINK_PAYLOAD)
+        elapsed = time.monotonic() - started
+
+    assert resp.status_code == 202
+    assert elapsed < server.SUPABASE_TIMEOUT_SECONDS + 1
+
+
+def test_open_storage_circuit_fails_fast_and_recovers(client, server, supabase):
+    with supabase.faults.down(REFUSE):
+        for _ in range(server.BREAKER_FAILURE_THRESHOLD):
+            client.post('/webhook/chartink', json=CHARTINK_PAYLOAD)
+        assert server.breakers['storage'].state == 'open'
+        calls = len(supabase.calls)
+
+        assert client.post('/webhook/chartink', json=CHARTINK_PAYLOAD).status_code == 202
+        assert client.get('/alerts/recent').status_code == 503
+        assert len(supabase.calls) == calls  # nothing reached the database
+        assert client.get('/health').get_json()['dependencies']['storage']['state'] == 'open'
+
+    time.sleep(server.BREAKER_RECOVERY_SECONDS)
+    assert client.get('/health').status_code == 200
+    assert server.breakers['storage'].state == 'closed'
+    assert wait_until(lambda: len(supabase.rows('chartink_alerts')) == server.BREAKER_FAILURE_THRESHOLD + 1)
+
+
+def test_storage_errors_are_dead_lettered_not_spooled(client, server, supabase, admin_headers):
+    supabase.faults.schedule(Phase(60, outage=ERROR, error_status=503))
+
+    resp = client.post('/webhook/chartink', json=CHARTINK_PAYLOAD)
+
+    assert resp.status_code == 400
+    assert server.alert_spool.count() == 0
+    listing = client.get('/admin/dead-letters?error=Could not connect', headers=admin_headers).get_json()
+    assert listing['count'] == 1
+
+
+def test_claims_during_storage_outage(client, server, supabase, consumer_headers):
+    with supabase.faults.down(REFUSE):
+        for _ in range(server.BREAKER_FAILURE_THRESHOLD):
+            client.post('/alerts/claim', json={'consumer': 'bot'}, headers=consumer_headers)
+        calls = len(supabase.calls)
+        responses = [client.post(path, json={'consumer': 'bot', 'ids': [1]}, headers=consumer_headers)
+                     for path in ('/alerts/claim', '/alerts/ack', '/alerts/nack')]
+
+    assert [resp.status_code for resp in responses] == [503, 503, 503]
+    assert all('Retry-After' in resp.headers for resp in responses)
+    assert len(supabase.calls) == calls
+
+
+def test_controls_outage_keeps_the_cached_webhooks(client, server, supabase, discord, monkeypatch):
+    assert post_tradingview(client).status_code == 200  # loads the controls cache
+    monkeypatch.setattr(server, '_cache_timestamp', 0)  # expired
+    server.state.delete(server._CONTROLS_CACHE_KEY)
+
+    with supabase.faults.down(REFUSE):
+        assert post_tradingview(client).status_code == 200
+
+    assert len(discord.messages('CIO')) == 2
+
+
+# Discord
+
+def test_discord_429_is_queued_and_delivered_after_retry_after(client, discord):
+    discord.rate_limit('CIO', 1, 1.0)
+    assert post_tradingview(client, content='first').status_code == 200
+
+    resp = post_tradingview(client, content='second')
+
+    assert resp.status_code == 200
+    assert resp.get_json()['deliveries'][0]['queued'] is True
+    assert wait_until(lambda: len(discord.messages('CIO')) == 2)
+    assert [m['content'] for m in discord.messages('CIO')] == ['first', 'second']
+
+
+def test_discord_5xx_outage_is_retried(client, discord):
+    with discord.faults.down(ERROR):
+        resp = post_tradingview(client)
+        assert resp.get_json()['deliveries'][0]['queued'] is True
+
+    assert wait_until(lambda: discord.messages('CIO'), timeout=8)
+
+
+def test_discord_outage_does_not_block_other_destinations(client, server, discord, monkeypatch):
+    monkeypatch.setattr(server, '_routing_rules', {'tradingview': {'CIO': ['AUDIT']}})
+    discord.rate_limit('CIO', 0, 60)  # CIO always rate limited
+
+    deliveries = post_tradingview(client).get_json()['deliveries']
+
+    assert deliveries[0]['queued'] is True
+    assert deliveries[1]['discord_status'] == 204
+    assert len(discord.messages('AUDIT')) == 1
+
+
+def test_discord_slowness_is_reflected_in_the_breaker(client, server, discord):
+    discord.faults.configure(latency=constant(0.05))
+
+    post_tradingview(client)
+
+    assert server.breakers['discord'].snapshot()['p99_seconds'] >= 0.05
+
+
+# Notion
+
+def test_notion_hang_does_not_hold_the_webhook(client, server, notion, discord):
+    notion.add_page('parent-hang', 'Never fetched')
+    page = {'data': {'object': 'page', 'url': 'https://www.notion.so/x', 'properties': {
+        'Item': {'type': 'title', 'title': [{'plain_text': 'Child'}]},
+        'Parent Item': {'type': 'relation', 'relation': [{'id': 'parent-hang'}]},
+    }}}
+
+    with notion.faults.down(HANG):
+        started = time.monotonic()
+        resp = client.post('/webhook/notion', json=page)
+        elapsed = time.monotonic() - started
+
+    assert resp.status_code == 200
+    assert elapsed < server.NOTION_TIMEOUT_SECONDS + 0.5
+    assert 'https://www.notion.so/parenthang' in discord.messages('BUILDER_INFRA')[0]['content']
+
+
+def test_notion_rate_limit_falls_back_to_the_page_link(client, notion, discord):
+    notion.add_page('parent-429', 'Rate limited')
+    notion.faults.configure(error_rate=1.0, error_status=429)
+    page = {'data': {'object': 'page', 'properties': {
+        'Parent Item': {'type': 'relation', 'relation': [{'id': 'parent-429'}]},
+    }}}
+
+    assert client.post('/webhook/notion', json=page).status_code == 200
+    assert '[parent-429](https://www.notion.so/parent429)' in discord.messages('BUILDER_INFRA')[0]['content']
+
+
+# Admission
+
+def test_rate_limited_webhooks_never_reach_dependencies(client, server, supabase, monkeypatch):
+    import rate_limit
+    monkeypatch.setattr(server, 'rate_limiter', rate_limit.RateLimiter(
+        rate_limit.parse_rules({'/webhook/chartink': {'scan': '2/min'}})))
+
+    statuses = [client.post('/webhook/chartink', json=CHARTINK_PAYLOAD).status_code for _ in range(4)]
+
+    assert statuses == [200, 200, 429, 429]
+    assert len(supabase.requests_to('/rest/v1/chartink_alerts', 'POST')) == 2
+
+
+def test_unauthenticated_webhooks_never_reach_dependencies(client, server, supabase, monkeypatch):
+    import webhook_auth
+    monkeypatch.setattr(server, 'authenticator', webhook_auth.WebhookAuthenticator(
+        lambda: {}, static_keys={'chartink': ['s3cret']}, refresh_seconds=300))
+
+    assert client.post('/webhook/chartink', json=CHARTINK_PAYLOAD).status_code == 401
+    assert client.post('/webhook/chartink?token=s3cret', json=CHARTINK_PAYLOAD).status_code == 200
+    assert len(supabase.requests_to('/rest/v1/chartink_alerts', 'POST')) == 1
+
+
+# Shutdown
+
+def test_drain_publishes_alerts_replayed_from_the_spool(client, server, supabase, discord, monkeypatch):
+    from concurrency import AdaptiveExecutor
+    monkeypatch.setattr(server, '_delivery_pool', AdaptiveExecutor(server.delivery_limit))  # the drain stops it
+    monkeypatch.setattr(server, 'CHARTINK_DISCORD_ENABLED', True)
+    monkeypatch.setattr(server, '_routing_rules', {'chartink': {'SHORT TERM BREAKOUTS': ['AUDIT']}})
+    server.lifecycle.begin_drain()  # the recovery loop leaves the spool to the drain steps
+
+    with supabase.faults.down(REFUSE):
+        assert client.post('/webhook/chartink', json=CHARTINK_PAYLOAD).status_code == 202
+    result = server.lifecycle.drain()
+
+    assert set(result.values()) == {'done'}
+    assert len(supabase.rows('chartink_alerts')) == 1
+    assert 'Short term breakouts' in discord.messages('AUDIT')[0]['content']
+
+
+def test_drain_queues_deliveries_it_cannot_wait_for(client, server, discord, monkeypatch, tmp_path):
+    from concurrency import AIMDLimit, AdaptiveExecutor
+    from resilience import LocalSpool
+    # One worker, so two of the three posts wait behind the first, hanging one
+    monkeypatch.setattr(server, '_delivery_pool', AdaptiveExecutor(AIMDLimit('delivery', 1, 1, 1)))
+    monkeypatch.setattr(server, 'shutdown_spool', LocalSpool(str(tmp_path / 'shutdown.jsonl')))
+    monkeypatch.setattr(server, '_routing_rules', {'tradingview': {'CIO': ['AUDIT', 'BUILDER_INFRA']}})
+    responses = []
+
+    with discord.faults.down(HANG):
+        request = threading.Thread(target=lambda: responses.append(post_tradingview(client)))
+        request.start()
+        assert wait_until(lambda: discord.requests_to('/api/webhooks'))
+        started = time.monotonic()
+        result = server.lifecycle.drain()
+        elapsed = time.monotonic() - started
+    request.join(timeout=10)
+
+    assert result['delivery_pool'] == result['discord_queue'] == 'done'
+    assert elapsed < server.SHUTDOWN_DRAIN_SECONDS + 0.5
+    persisted = [record['message']['url'] for record in server.shutdown_spool._read()]
+    assert sorted(persisted) == sorted([discord.webhook('AUDIT'), discord.webhook('BUILDER_INFRA')])
+    deliveries = responses[0].get_json()['deliveries']
+    assert [delivery['queued'] for delivery in deliveries] == [True, True, True]
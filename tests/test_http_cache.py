@@ -0,0 +1,155 @@
+"""
+HTTP caching helpers: content negotiation, compressed variants, ETags and
+the micro-cache, plus compression on a cached route
+"""
+
+import gzip
+import threading
+
+import pytest
+
+import http_cache
+from conftest import CHARTINK_PAYLOAD
+from http_cache import CachedResponse, MicroCache, etag_for, etag_matches, negotiate_encoding
+
+
+@pytest.fixture
+def without_brotli(monkeypatch):
+    monkeypatch.setattr(http_cache, 'brotli', None)
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    monkeypatch.setattr(http_cache, 'brotli', pytest.importorskip('brotli'))
+
+
+# Negotiation
+
+def test_small_bodies_and_missing_headers_are_sent_as_is(without_brotli):
+    assert negotiate_encoding('gzip', 100, min_bytes=1024) is None
+    assert negotiate_encoding(None, 5000, min_bytes=1024) is None
+    assert negotiate_encoding('', 5000, min_bytes=1024) is None
+    assert negotiate_encoding('identity', 5000, min_bytes=1024) is None
+
+
+@pytest.mark.parametrize('header', ['gzip', 'GZIP', 'deflate, gzip;q=0.5', 'br, gzip', 'br;q=1.0, gzip;q=0.8'])
+def test_gzip_is_used_when_accepted_and_brotli_is_not_installed(without_brotli, header):
+    assert negotiate_encoding(header, 5000, min_bytes=1024) == 'gzip'
+
+
+@pytest.mark.parametrize('header', ['gzip;q=0', 'gzip;q=bogus', 'br'])
+def test_refused_or_unavailable_encodings_are_skipped(without_brotli, header):
+    assert negotiate_encoding(header, 5000, min_bytes=1024) is None
+
+
+def test_brotli_is_preferred_when_installed(with_brotli):
+    assert negotiate_encoding('gzip, br', 5000, min_bytes=1024) == 'br'
+    assert negotiate_encoding('gzip, br;q=0', 5000, min_bytes=1024) == 'gzip'
+
+
+# Compressed variants
+
+def test_gzip_variant_is_built_once_and_round_trips():
+    body = b'{"alerts": []}' * 200
+    cached = CachedResponse(200, body, 'application/json', etag_for(body))
+
+    compressed = cached.encoded('gzip')
+
+    assert gzip.decompress(compressed) == body
+    assert len(compressed) < len(body)
+    assert cached.encoded('gzip') is compressed
+    assert cached.encoded(None) is body
+
+
+def test_brotli_variant_round_trips(with_brotli):
+    body = b'{"alerts": []}' * 200
+    compressed = CachedResponse(200, body, 'application/json', None).encoded('br')
+    assert http_cache.brotli.decompress(compressed) == body
+
+
+# ETags
+
+def test_etags_are_weak_and_stable():
+    assert etag_for('a', 1) == etag_for('a', 1)
+    assert etag_for('a', 1) != etag_for('a1')
+    assert etag_for(b'body').startswith('W/"')
+
+
+def test_etag_matching_is_weak():
+    etag = etag_for('v1')
+    assert etag_matches(etag, etag)
+    assert etag_matches(etag[2:], etag)  # strong form of the same tag
+    assert etag_matches(f'"other", {etag}', etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches(etag_for('v2'), etag)
+
+
+# Micro-cache
+
+def test_micro_cache_hits_until_the_ttl_and_skips_uncacheable_values():
+    cache = MicroCache(ttl_seconds=60)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert cache.get_or_compute('k', compute) == (1, 'miss')
+    assert cache.get_or_compute('k', compute) == (1, 'hit')
+    assert cache.get_or_compute('odd', compute, cacheable=lambda value: value % 2 == 1) == (2, 'miss')
+    assert cache.get_or_compute('odd', compute, cacheable=lambda value: value % 2 == 1) == (3, 'miss')
+    assert cache.get_or_compute('odd', compute, cacheable=lambda value: value % 2 == 1) == (3, 'hit')
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = MicroCache(ttl_seconds=60)
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return 'value'
+
+    outcomes = []
+    threads = [threading.Thread(target=lambda: outcomes.append(cache.get_or_compute('k', slow)[1]))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(outcomes).count('miss') == 1
+    assert set(outcomes) <= {'miss', 'shared', 'hit'}
+
+
+def test_micro_cache_is_bounded():
+    cache = MicroCache(ttl_seconds=60, max_entries=3)
+    for key in range(5):
+        cache.get_or_compute(key, lambda: 'v')
+    assert len(cache._entries) == 3
+
+
+# On a route
+
+def test_cached_route_compresses_large_bodies(client, without_brotli):
+    for _ in range(10):
+        client.post('/webhook/chartink', json=CHARTINK_PAYLOAD)
+
+    plain = client.get('/alerts/recent?limit=10')
+    compressed = client.get('/alerts/recent?limit=10', headers={'Accept-Encoding': 'gzip'})
+
+    assert len(plain.data) >= 1024 and 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(compressed.data) == plain.data
+    assert compressed.headers['ETag'] == plain.headers['ETag']
+
+
+def test_cached_route_leaves_small_bodies_uncompressed(client):
+    resp = client.get('/alerts/recent?limit=1', headers={'Accept-Encoding': 'gzip, br'})
+    assert len(resp.data) < 1024
+    assert 'Content-Encoding' not in resp.headers
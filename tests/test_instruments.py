@@ -0,0 +1,93 @@
+"""
+Instrument master: symbol normalization, index build and lookups
+"""
+
+import pytest
+
+from instruments import InstrumentMaster, build_index, normalize_symbol
+
+MASTER_CSV = """symbol,exchange,token,isin
+RELIANCE,BSE,500325,INE002A01018
+RELIANCE,NSE,2885,INE002A01018
+TCS-EQ,NSE,11536,ine467b01029
+nse:infy,NSE,1594,INE009A01021
+A_VERY_LONG_SYMBOL_THAT_DOES_NOT_FIT_THE_INDEX,NSE,1,
+HDFCBANK,NSE,not-a-number,INE040A01034
+"""
+
+
+@pytest.fixture
+def master_csv(tmp_path):
+    path = tmp_path / 'instruments.csv'
+    path.write_text(MASTER_CSV)
+    return str(path)
+
+
+@pytest.fixture
+def master(master_csv, tmp_path):
+    index_path = str(tmp_path / 'instruments.idx')
+    build_index(master_csv, index_path, prefer='NSE')
+    master = InstrumentMaster(index_path)
+    yield master
+    master.close()
+
+
+@pytest.mark.parametrize('raw', ['RELIANCE', ' reliance ', 'NSE:RELIANCE', 'BSE_RELIANCE', 'RELIANCE.NS',
+                                 'RELIANCE.BO', 'RELIANCE-EQ', 'nse:reliance-be'])
+def test_normalize_symbol_strips_exchange_prefixes_and_suffixes(raw):
+    assert normalize_symbol(raw) == 'RELIANCE'
+
+
+def test_normalize_symbol_keeps_the_rest_of_the_symbol():
+    assert normalize_symbol('M&M') == 'M&M'
+    assert normalize_symbol('BAJAJ-AUTO') == 'BAJAJ-AUTO'
+
+
+def test_build_index_normalizes_and_skips_unusable_rows(master_csv, tmp_path):
+    assert build_index(master_csv, str(tmp_path / 'instruments.idx')) == 4
+
+
+def test_lookup_finds_normalized_variants(master):
+    assert len(master) == 4
+    assert master.lookup('TCS.NS') == ('TCS', 'NSE', 11536, 'INE467B01029')
+    assert master.lookup('NSE:INFY').token == 1594
+    assert master.lookup('hdfcbank').token == 0
+
+
+def test_lookup_prefers_the_requested_exchange(master_csv, master, tmp_path):
+    assert master.lookup('RELIANCE').exchange == 'NSE'
+
+    first_listed = str(tmp_path / 'first.idx')
+    build_index(master_csv, first_listed)
+    other = InstrumentMaster(first_listed)
+    try:
+        assert other.lookup('RELIANCE').exchange == 'BSE'
+    finally:
+        other.close()
+
+
+def test_lookup_misses_unknown_and_oversized_symbols(master):
+    assert master.lookup('UNKNOWN') is None
+    assert master.lookup('X' * 40) is None
+    assert master.lookup('AAA') is None  # sorts before every record
+    assert master.lookup('ZZZ') is None  # and after
+
+
+def test_lookup_cache_is_bounded(master_csv, tmp_path):
+    index_path = str(tmp_path / 'small_cache.idx')
+    build_index(master_csv, index_path)
+    master = InstrumentMaster(index_path, cache_size=2)
+    try:
+        for symbol in ('RELIANCE', 'TCS', 'INFY', 'UNKNOWN'):
+            master.lookup(symbol)
+        assert len(master._cache) <= 2
+        assert master.lookup('INFY').token == 1594
+    finally:
+        master.close()
+
+
+def test_rejects_a_file_that_is_not_an_index(tmp_path):
+    path = tmp_path / 'bogus.idx'
+    path.write_bytes(b'not an index at all')
+    with pytest.raises(ValueError):
+        InstrumentMaster(str(path))
@@ -0,0 +1,57 @@
+"""
+Partition maintenance helpers: partition bounds, the table's interval and
+the retention cutoff
+"""
+
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from partition_maintenance import _parse_bound, retention_cutoff, table_interval
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize('bound, start, end', [
+    ("FOR VALUES FROM ('2026-01-01 00:00:00+00') TO ('2026-02-01 00:00:00+00')", utc(2026, 1, 1), utc(2026, 2, 1)),
+    ("FOR VALUES FROM ('2026-01-31 00:00:00+00') TO ('2026-02-01 00:00:00+00')", utc(2026, 1, 31), utc(2026, 2, 1)),
+    # A session in another time zone prints the same instants with its offset
+    ("FOR VALUES FROM ('2026-01-01 05:30:00+05:30') TO ('2026-02-01 05:30:00+05:30')",
+     utc(2026, 1, 1), utc(2026, 2, 1)),
+    ("FOR VALUES FROM ('2025-12-31 19:00:00-05') TO ('2026-01-31 19:00:00-05')", utc(2026, 1, 1), utc(2026, 2, 1)),
+])
+def test_parse_bound(bound, start, end):
+    assert _parse_bound(bound) == (start, end)
+    assert _parse_bound(bound)[0].utcoffset() is not None
+
+
+def partition(start, end):
+    return {'name': 'p', 'start': start, 'end': end, 'default': False}
+
+
+def test_table_interval():
+    default = {'name': 'chartink_alerts_default', 'default': True}
+    assert table_interval([]) is None
+    assert table_interval([default]) is None
+    assert table_interval([default, partition(utc(2026, 1, 1), utc(2026, 1, 2))]) == 'day'
+    assert table_interval([default, partition(utc(2026, 2, 1), utc(2026, 3, 1))]) == 'month'
+    # Offsets do not change the width
+    assert table_interval([partition(datetime(2026, 1, 1, tzinfo=IST), utc(2026, 1, 1, 18, 30))]) == 'day'
+
+
+@pytest.mark.parametrize('today, interval, retention, cutoff', [
+    (date(2026, 3, 15), 'day', 90, utc(2025, 12, 15)),
+    (date(2026, 3, 15), 'day', 0, utc(2026, 3, 15)),
+    (date(2026, 3, 15), 'month', 6, utc(2025, 9, 1)),
+    (date(2026, 3, 1), 'month', 2, utc(2026, 1, 1)),
+    (date(2026, 1, 31), 'month', 1, utc(2025, 12, 1)),
+    (date(2026, 12, 31), 'month', 12, utc(2025, 12, 1)),
+    (date(2026, 3, 15), 'month', 0, utc(2026, 3, 1)),
+])
+def test_retention_cutoff(today, interval, retention, cutoff):
+    assert retention_cutoff(today, interval, retention) == cutoff
+
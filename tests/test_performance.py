@@ -0,0 +1,121 @@
+"""
+Latency and throughput budgets against simulated dependencies
+Runs the app behind a real threaded server and drives it with concurrent
+clients. Budgets are loose enough for a shared CI runner; a failure means
+a path got serial, unbounded or lossy, not that it got a few percent slower.
+"""
+
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from claim_client import AlertClaimClient
+from conftest import CHARTINK_PAYLOAD, CONSUMER_TOKEN, wait_until
+from simulation import HANG, constant, lognormal, run_load, spikes
+
+pytestmark = pytest.mark.performance
+
+_sessions = threading.local()
+
+
+def http() -> requests.Session:
+    """One keep-alive session per load thread"""
+    if not hasattr(_sessions, 'session'):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+
+def post_chartink(live_server, i=0):
+    payload = {**CHARTINK_PAYLOAD, 'scan_name': f"Load scan {i % 20}"}
+    return http().post(f"{live_server}/webhook/chartink", json=payload, timeout=10).status_code
+
+
+def test_chartink_ingest_under_realistic_supabase_latency(live_server, supabase):
+    supabase.faults.configure(latency=spikes(lognormal(0.015, 0.06), 0.25, 0.01))
+
+    result = run_load(lambda i: post_chartink(live_server, i), total=300, concurrency=16)
+    print(f"\nchartink ingest: {result}")
+
+    assert result.count(200) == 300
+    assert len(supabase.rows('chartink_alerts')) == 300
+    assert result.percentile(99) < 1.0
+    assert result.throughput > 50
+
+
+def test_discord_fan_out_is_concurrent(live_server, server, discord, monkeypatch):
+    monkeypatch.setattr(server, '_routing_rules', {'tradingview': {'CIO': ['AUDIT', 'BUILDER_DATA', 'BUILDER_INFRA']}})
+    discord.faults.configure(latency=constant(0.2))
+    body = json.dumps({'strategy': 'CIO', 'content': 'fan out'})
+
+    result = run_load(lambda i: http().post(f"{live_server}/webhook/tradingview", data=body, timeout=10).status_code,
+                      total=10, concurrency=2)
+    print(f"\n4-way fan-out at 200ms per post: {result}")
+
+    assert result.count(200) == 10
+    assert result.percentile(50) < 0.4  # serial delivery would take 0.8s
+
+
+def test_storage_outage_does_not_stall_ingest(live_server, server, supabase):
+    with supabase.faults.down(HANG):
+        # Concurrent timeouts open the breaker after one SUPABASE_TIMEOUT_SECONDS
+        run_load(lambda i: post_chartink(live_server, i), total=server.BREAKER_FAILURE_THRESHOLD,
+                 concurrency=server.BREAKER_FAILURE_THRESHOLD)
+        assert server.breakers['storage'].state == 'open'
+
+        result = run_load(lambda i: post_chartink(live_server, i), total=100, concurrency=8)
+        print(f"\nchartink with storage circuit open: {result}")
+
+    assert result.count(202) == 100
+    assert result.percentile(99) < 0.2
+    assert wait_until(lambda: len(supabase.rows('chartink_alerts')) == 100 + server.BREAKER_FAILURE_THRESHOLD,
+                      timeout=10)
+
+
+def test_discord_rate_limit_burst_loses_nothing(live_server, discord):
+    discord.rate_limit('CIO', 10, 1.0)
+    bodies = [json.dumps({'strategy': 'CIO', 'content': f'signal {i}'}) for i in range(30)]
+
+    result = run_load(lambda i: http().post(f"{live_server}/webhook/tradingview", data=bodies[i],
+                                            timeout=10).status_code, total=30, concurrency=8)
+    print(f"\n30 alerts into a 10/s Discord webhook: {result}")
+
+    assert result.count(200) == 30
+    assert result.percentile(99) < 0.5  # 429s are queued, not waited out
+    assert wait_until(lambda: len(discord.messages('CIO')) == 30, timeout=20)
+    assert sorted(m['content'] for m in discord.messages('CIO')) == sorted(f'signal {i}' for i in range(30))
+
+
+def test_claim_long_poll_wakes_on_insert(live_server):
+    consumer = AlertClaimClient(live_server, 'bot', token=CONSUMER_TOKEN)
+    claimed = {}
+
+    def claim():
+        started = time.monotonic()
+        alerts = consumer.claim(wait_seconds=5)
+        claimed.update(count=len(alerts), elapsed=time.monotonic() - started)
+
+    waiter = threading.Thread(target=claim)
+    waiter.start()
+    time.sleep(0.3)
+    assert post_chartink(live_server) == 200
+    waiter.join(10)
+
+    assert claimed['count'] == 1
+    assert claimed['elapsed'] < 1.0
+
+
+def test_slow_supabase_backs_off_request_concurrency(live_server, server, supabase):
+    supabase.faults.configure(latency=constant(0.01))
+    run_load(lambda i: post_chartink(live_server, i), total=300, concurrency=16)
+    fast_limit = server.request_limit.limit
+
+    supabase.faults.configure(latency=constant(0.3))
+    result = run_load(lambda i: post_chartink(live_server, i), total=60, concurrency=16)
+    print(f"\nchartink after Supabase slowed 30x: {result}, limit {fast_limit} -> {server.request_limit.limit}")
+
+    assert result.count(200) == 60
+    assert server.request_limit.decisions['decrease'] >= 1
+    assert server.request_limit.limit < fast_limit
@@ -0,0 +1,150 @@
+"""
+Rate limits: limit specs, GCRA buckets (local and shared), key extraction
+and applying a route's limits
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limit
+from rate_limit import Limit, LocalBuckets, RateLimiter, SharedBuckets, json_string_field, parse_rules
+from state_store import MemoryStateStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, 'time', SimpleNamespace(monotonic=clock))
+    return clock
+
+
+# Limits
+
+@pytest.mark.parametrize('spec, burst, rate', [
+    ('60/min', 60, 1.0), ('5', 5, 5.0), ('10/s', 10, 10.0), ('7200/hour', 7200, 2.0), ('30 / Minute', 30, 0.5),
+])
+def test_limit_specs(spec, burst, rate):
+    limit = Limit('ip', spec)
+    assert (limit.burst, limit.rate) == (burst, rate)
+
+
+@pytest.mark.parametrize('spec', ['10/fortnight', '0/min', '-1/s', 'lots/min'])
+def test_invalid_limit_specs_are_rejected(spec):
+    with pytest.raises(ValueError):
+        Limit('ip', spec)
+
+
+def test_parse_rules():
+    rules = parse_rules({'/webhook/tradingview': {'ip': '120/min', 'strategy': '60/min'}})
+    assert [(limit.dimension, limit.spec) for limit in rules['/webhook/tradingview']] == [
+        ('ip', '120/min'), ('strategy', '60/min')]
+
+
+def test_json_string_field():
+    body = b'{"passphrase": "x", "strategy" : "CIO", "scan_name": "Breakouts"}'
+    assert json_string_field(body, 'strategy') == 'CIO'
+    assert json_string_field(body, 'missing', 'scan_name') == 'Breakouts'
+    assert json_string_field(body, 'missing') is None
+    assert json_string_field(b'{"strategy": 5}', 'strategy') is None
+
+
+# Local buckets
+
+def test_burst_then_evenly_spaced_tokens(clock):
+    buckets = LocalBuckets()
+    assert [buckets.take('k', rate=2.0, burst=3) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.take('k', rate=2.0, burst=3) == pytest.approx(0.5)
+
+    clock.now += 0.25
+    assert buckets.take('k', rate=2.0, burst=3) == pytest.approx(0.25)
+    clock.now += 0.25
+    assert buckets.take('k', rate=2.0, burst=3) == 0.0
+    assert buckets.take('k', rate=2.0, burst=3) == pytest.approx(0.5)
+
+
+def test_refused_requests_do_not_spend_tokens(clock):
+    buckets = LocalBuckets()
+    buckets.take('k', rate=1.0, burst=1)
+    for _ in range(5):
+        assert buckets.take('k', rate=1.0, burst=1) == pytest.approx(1.0)
+    clock.now += 1
+    assert buckets.take('k', rate=1.0, burst=1) == 0.0
+
+
+def test_an_idle_bucket_refills_only_to_its_burst(clock):
+    buckets = LocalBuckets()
+    buckets.take('k', rate=1.0, burst=2)
+    clock.now += 3600
+    assert [buckets.take('k', rate=1.0, burst=2) for _ in range(3)] == [0.0, 0.0, pytest.approx(1.0)]
+
+
+def test_keys_have_their_own_buckets(clock):
+    buckets = LocalBuckets()
+    assert buckets.take('a', rate=1.0, burst=1) == 0.0
+    assert buckets.take('a', rate=1.0, burst=1) > 0
+    assert buckets.take('b', rate=1.0, burst=1) == 0.0
+
+
+def test_full_shards_evict_idle_keys_only(clock):
+    buckets = LocalBuckets(shards=1, max_keys_per_shard=2)
+    buckets.take('idle', rate=1.0, burst=1)
+    buckets.take('busy', rate=0.01, burst=1)
+    clock.now += 10
+
+    assert buckets.take('new', rate=1.0, burst=1) == 0.0
+
+    shard = buckets._shards[0][0]
+    assert set(shard) == {'busy', 'new'}
+    assert buckets.take('busy', rate=0.01, burst=1) > 0  # still limited
+
+
+# Shared buckets
+
+def test_shared_buckets_are_shared_between_workers():
+    store = MemoryStateStore()
+    first, second = SharedBuckets(store), SharedBuckets(store)
+
+    assert first.take('k', rate=0.01, burst=2) == 0.0
+    assert second.take('k', rate=0.01, burst=2) == 0.0
+    assert first.take('k', rate=0.01, burst=2) > 0
+    assert second.take('k', rate=0.01, burst=2) > 0
+
+
+def test_shared_buckets_fall_back_to_local_ones():
+    class Down:
+        def take_token(self, key, rate, burst):
+            raise ConnectionError('state store down')
+
+    buckets = SharedBuckets(Down())
+    assert buckets.take('k', rate=0.01, burst=1) == 0.0
+    assert buckets.take('k', rate=0.01, burst=1) > 0
+    assert buckets.fallback.take('k', rate=0.01, burst=1) > 0  # the tokens came from here
+
+
+# Limiter
+
+def test_limiter_applies_every_dimension_with_a_value(clock):
+    limiter = RateLimiter(parse_rules({'/webhook/tradingview': {'ip': '4/min', 'strategy': '1/min'}}))
+    route = '/webhook/tradingview'
+
+    assert limiter.check(route, {'ip': '10.0.0.1', 'strategy': 'CIO'}) is None
+    limit, wait = limiter.check(route, {'ip': '10.0.0.1', 'strategy': 'CIO'})
+    assert (limit.dimension, wait) == ('strategy', pytest.approx(60))
+    # Limits are taken in order, so the ip token for that refused request is spent
+
+    assert limiter.check(route, {'ip': '10.0.0.1', 'strategy': 'AUDIT'}) is None
+    assert limiter.check(route, {'ip': '10.0.0.1', 'strategy': None}) is None  # not keyed by strategy
+    limit, _ = limiter.check(route, {'ip': '10.0.0.1', 'strategy': 'BUILDER_DATA'})
+    assert limit.dimension == 'ip'
+
+    assert limiter.check('/webhook/other', {'ip': '10.0.0.1'}) is None
+    assert limiter.limits('/webhook/other') == []
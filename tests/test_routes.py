@@ -0,0 +1,425 @@
+"""
+Regression tests for every route, with healthy dependencies
+"""
+
+import json
+import time
+from datetime import datetime
+
+from conftest import CHARTINK_PAYLOAD, NOTION_TOKEN, wait_until
+
+
+def notion_page(plan_status='Needs Re-Plan', builders=('BUILDER_INFRA',), parent_id=None):
+    properties = {
+        'Item': {'type': 'title', 'title': [{'plain_text': 'Webhook load tests'}]},
+        'Plan Status': {'type': 'select', 'select': {'name': plan_status}},
+        'Builders Involved': {'type': 'multi_select', 'multi_select': [{'name': b} for b in builders]},
+        'Priority': {'type': 'select', 'select': {'name': 'P1'}},
+    }
+    if parent_id:
+        properties['Parent Item'] = {'type': 'relation', 'relation': [{'id': parent_id}]}
+    return {'data': {'object': 'page', 'id': 'page-1', 'url': 'https://www.notion.so/page1',
+                     'properties': properties}}
+
+
+# ChartInk ingest
+
+def test_chartink_alert_is_stored(client, supabase):
+    resp = client.post('/webhook/chartink', json=CHARTINK_PAYLOAD)
+
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body['success'] is True
+    assert body['data']['total_stocks'] == 3
+    row = supabase.rows('chartink_alerts', id=body['data']['id'])[0]
+    assert row['stocks'] == ['SEPOWER', 'ASTEC', 'EDUCOMP']
+    assert row['trigger_prices'] == [3.75, 541.8, 2.1]
+    assert row['min_trigger_price'] == 2.1 and row['max_trigger_price'] == 541.8
+    assert row['processing_status'] == 'new'
+
+
+def test_chartink_legacy_symbol_at_price_format(client, supabase):
+    payload = {**CHARTINK_PAYLOAD, 'stocks': 'SEPOWER@3.75,ASTEC@541.8'}
+    del payload['trigger_prices']
+
+    resp = client.post('/webhook/chartink', json=payload)
+
+    assert resp.status_code == 200
+    row = supabase.rows('chartink_alerts')[0]
+    assert row['stocks'] == ['SEPOWER', 'ASTEC'] and row['trigger_prices'] == [3.75, 541.8]
+
+
+def test_chartink_prices_fill_once_the_snapshot_feed_starts(client, server, supabase, tmp_path, monkeypatch):
+    from price_snapshot import PriceSnapshot
+    feed = tmp_path / 'ltp.csv'
+    snapshot = PriceSnapshot()
+    snapshot.load_file(str(feed))  # the feed hasn't written anything at boot
+    monkeypatch.setattr(server, 'price_snapshot', snapshot)
+    monkeypatch.setattr(server, 'PRICE_SNAPSHOT_FILE', str(feed))
+    monkeypatch.setattr(server, 'PRICE_SNAPSHOT_REFRESH_SECONDS', 0.05)
+    payload = {**CHARTINK_PAYLOAD, 'stocks': 'SEPOWER,ASTEC'}
+    del payload['trigger_prices']
+
+    assert client.post('/webhook/chartink', json=payload).status_code == 400
+    feed.write_text('SEPOWER,3.8\nASTEC,542.1\n')
+    assert wait_until(lambda: len(snapshot) == 2)
+
+    assert client.post('/webhook/chartink', json=payload).status_code == 200
+    assert supabase.rows('chartink_alerts')[0]['trigger_prices'] == [3.8, 542.1]
+
+
+def test_chartink_rejects_bad_payloads(client, supabase):
+    assert client.post('/webhook/chartink', data='stocks=A', content_type='text/plain').status_code == 400
+    assert client.post('/webhook/chartink', json={'scan_name': 'x'}).status_code == 400
+    mismatch = {**CHARTINK_PAYLOAD, 'trigger_prices': '1.0'}
+    assert client.post('/webhook/chartink', json=mismatch).status_code == 400
+    assert supabase.rows('chartink_alerts') == []
+
+
+def test_failed_webhooks_are_dead_lettered(client, server, admin_headers):
+    client.post('/webhook/chartink', json={'scan_name': 'x'})
+
+    listing = client.get('/admin/dead-letters?route=/webhook/chartink', headers=admin_headers).get_json()
+    assert listing['count'] == 1
+    entry = client.get(f"/admin/dead-letters/{listing['entries'][0]['id']}", headers=admin_headers).get_json()
+    assert json.loads(entry['body']) == {'scan_name': 'x'}
+    assert 'Missing required field' in entry['error']
+
+
+def test_test_route_stores_the_sample_alert(client, supabase):
+    resp = client.post('/test')
+
+    assert resp.get_json()['success'] is True
+    assert supabase.rows('chartink_alerts')[0]['scan_name'] == 'Short term breakouts'
+
+
+# Reads
+
+def test_health_reports_dependencies(client):
+    resp = client.get('/health')
+
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body['status'] == 'healthy'
+    assert set(body['dependencies']) == {'storage', 'discord', 'notion'}
+    assert body['fallbacks']['spooled_alerts'] == 0
+
+
+def test_health_is_503_while_draining(client, server):
+    server.lifecycle.begin_drain()
+
+    resp = client.get('/health')
+
+    assert resp.status_code == 503
+    assert resp.get_json()['status'] == 'draining'
+
+
+def test_recent_alerts_newest_first_with_etag(client, supabase):
+    for name in ('first', 'second', 'third'):
+        supabase.insert('chartink_alerts', {'scan_name': name, 'stocks': ['A'], 'trigger_prices': [1.0]})
+        time.sleep(0.002)
+
+    resp = client.get('/alerts/recent?limit=2')
+
+    assert resp.status_code == 200
+    assert [a['scan_name'] for a in resp.get_json()['alerts']] == ['third', 'second']
+    again = client.get('/alerts/recent?limit=2', headers={'If-None-Match': resp.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_recent_alerts_filters_to_the_hot_window_first(client, supabase):
+    client.get('/alerts/recent?limit=5')
+
+    selects = supabase.requests_to('/rest/v1/chartink_alerts', 'GET')
+    assert any(key == 'created_at' and value.startswith('gte.') for key, value in selects[0].query)
+
+
+def test_alert_stats_roll_up_stored_alerts(client):
+    payload = {**CHARTINK_PAYLOAD, 'scan_name': 'Stats scan'}
+    client.post('/webhook/chartink', json=payload)
+    client.post('/webhook/chartink', json=payload)
+
+    stats = client.get('/alerts/stats?scan_name=Stats scan').get_json()['stats']
+
+    assert stats[0]['alert_count'] == 2
+    assert stats[0]['distinct_symbols'] == 3
+    assert stats[0]['max_trigger_price'] == 541.8
+
+
+def test_alert_stats_include_what_other_workers_flushed(client, server, supabase, monkeypatch):
+    from alert_stats import AlertAggregator
+    monkeypatch.setattr(server, 'alert_stats', AlertAggregator(
+        server.STATS_INTERVAL_MINUTES, server.STATS_RETENTION_BUCKETS, server.MARKET_TIMEZONE))
+    bucket = server.alert_stats.bucket_start(datetime.now(server.MARKET_TIMEZONE))
+    supabase.insert('chartink_alert_stats', {
+        'scan_name': 'Shared scan', 'bucket_start': bucket.isoformat(), 'alert_count': 3,
+        'symbol_counts': {'ASTEC': 3}, 'price_count': 3, 'price_sum': 1625.4,
+        'min_trigger_price': 541.8, 'max_trigger_price': 541.8,
+    })
+
+    stats = client.get('/alerts/stats?scan_name=Shared scan').get_json()['stats']
+
+    assert stats[0]['alert_count'] == 3
+    assert stats[0]['top_symbols'] == [['ASTEC', 3]]
+
+
+def test_metrics_exposition(client):
+    client.get('/health')
+
+    text = client.get('/metrics').get_data(as_text=True)
+
+    assert 'webhook_circuit_state{dependency="storage"} 0' in text
+    assert 'webhook_concurrency_limit{pool="requests"}' in text
+
+
+# Work claims
+
+def test_claim_ack_nack_round_trip(client, supabase, consumer_headers):
+    for _ in range(3):
+        client.post('/webhook/chartink', json=CHARTINK_PAYLOAD)
+
+    def post(path, body):
+        return client.post(path, json=body, headers=consumer_headers).get_json()
+
+    claim = post('/alerts/claim', {'consumer': 'bot-1', 'batch_size': 2})
+    ids = [a['id'] for a in claim['alerts']]
+    assert claim['count'] == 2
+
+    assert post('/alerts/ack', {'consumer': 'bot-1', 'ids': [ids[0]]})['acked'] == [ids[0]]
+    nack = post('/alerts/nack', {'consumer': 'bot-1', 'ids': [ids[1], 999]})
+    assert nack['nacked'] == [ids[1]] and nack['not_held'] == [999]
+
+    statuses = {row['id']: row['processing_status'] for row in supabase.rows('chartink_alerts')}
+    assert statuses[ids[0]] == 'processed' and statuses[ids[1]] == 'new'
+    other = post('/alerts/claim', {'consumer': 'bot-2', 'batch_size': 10})
+    assert sorted(a['id'] for a in other['alerts']) == sorted(set(statuses) - {ids[0]})
+
+
+def test_expired_leases_stop_redelivering_after_max_attempts(client, server, supabase, consumer_headers,
+                                                             monkeypatch):
+    monkeypatch.setattr(server, 'CLAIM_MAX_ATTEMPTS', 3)
+    client.post('/webhook/chartink', json=CHARTINK_PAYLOAD)
+
+    def claim():
+        return client.post('/alerts/claim', json={'consumer': 'crashy'}, headers=consumer_headers).get_json()
+
+    for attempt in range(1, 4):
+        assert [alert['attempts'] for alert in claim()['alerts']] == [attempt]
+        supabase.expire_leases()  # the consumer died without acking
+
+    assert claim()['count'] == 0
+    assert [row['processing_status'] for row in supabase.rows('chartink_alerts')] == ['failed']
+
+
+def test_claim_validates_the_request(client, consumer_headers):
+    assert client.post('/alerts/claim', json={}, headers=consumer_headers).status_code == 400
+    assert client.post('/alerts/ack', json={'consumer': 'bot', 'ids': []}, headers=consumer_headers).status_code == 400
+    assert client.post('/alerts/nack', json={'consumer': 'bot', 'ids': 'x'}, headers=consumer_headers).status_code == 400
+
+
+def test_claims_need_a_consumer_or_admin_token(client, server, supabase, admin_headers, monkeypatch):
+    client.post('/webhook/chartink', json=CHARTINK_PAYLOAD)
+    body = {'consumer': 'bot', 'ids': [1]}
+
+    for path in ('/alerts/claim', '/alerts/ack', '/alerts/nack'):
+        assert client.post(path, json=body).status_code == 401
+        assert client.post(path, json=body, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.post('/alerts/claim', json=body, headers={'Authorization': 'Bearer old-consumer-token'}).status_code == 200
+    assert client.post('/alerts/ack', json=body, headers=admin_headers).get_json()['acked'] == [1]
+
+    monkeypatch.setattr(server, 'CLAIM_API_TOKENS', ())
+    monkeypatch.setattr(server, 'ADMIN_TOKEN', None)
+    assert client.post('/alerts/claim', json=body).status_code == 403
+
+
+# TradingView relay
+
+def test_tradingview_relays_to_the_strategy_channel(client, discord):
+    resp = client.post('/webhook/tradingview', data=json.dumps({
+        'strategy': 'INDEX_FUTURES_MANAGER', 'content': 'NIFTY long', 'passphrase': 'hunter2'}))
+
+    assert resp.status_code == 200
+    assert resp.get_json()['discord_status'] == 204
+    assert discord.messages('INDEX_FUTURES_MANAGER') == [{'content': 'NIFTY long'}]
+
+
+def test_tradingview_plain_text_goes_to_cio(client, discord):
+    assert client.post('/webhook/tradingview', data='BUY NIFTY').status_code == 200
+    assert discord.messages('CIO') == [{'content': 'BUY NIFTY'}]
+
+
+def test_tradingview_never_forwards_the_passphrase(client, discord):
+    client.post('/webhook/tradingview', data=json.dumps({'strategy': 'CIO', 'passphrase': 'hunter2'}))
+
+    assert 'hunter2' not in json.dumps(discord.messages('CIO'))
+
+
+def test_tradingview_unknown_strategy(client, discord):
+    resp = client.post('/webhook/tradingview', data=json.dumps({'strategy': 'NOPE', 'content': 'x'}))
+
+    assert resp.status_code == 400
+    assert 'CIO' in resp.get_json()['available_strategies']
+
+
+def test_tradingview_fans_out_by_routing_rules(client, server, discord, monkeypatch):
+    monkeypatch.setattr(server, '_routing_rules', {'tradingview': {'CIO': ['AUDIT', 'BUILDER_DATA']}})
+
+    resp = client.post('/webhook/tradingview', data=json.dumps({'strategy': 'CIO', 'content': 'fan out'}))
+
+    assert [d['target'] for d in resp.get_json()['deliveries']] == ['CIO', 'AUDIT', 'BUILDER_DATA']
+    assert all(discord.messages(name) == [{'content': 'fan out'}] for name in ('CIO', 'AUDIT', 'BUILDER_DATA'))
+
+
+def test_tradingview_wildcard_extras_do_not_stand_in_for_the_strategy(client, server, discord, monkeypatch):
+    monkeypatch.setattr(server, '_routing_rules', {'tradingview': {'*': ['AUDIT']}})
+
+    resp = client.post('/webhook/tradingview', data=json.dumps({'strategy': 'NOPE', 'content': 'x'}))
+
+    assert resp.status_code == 400
+    assert discord.messages('AUDIT') == []
+
+
+def test_routing_rules_only_take_numbers_as_throttle_windows(server, monkeypatch):
+    monkeypatch.setenv('ROUTING_RULES', json.dumps({
+        'tradingview': {'CIO': 5, 'AUDIT': ['BUILDER_DATA', 7]},
+        'chartink_throttle': {'Short term breakouts': 120, 'Other': 'AUDIT'},
+    }))
+
+    rules = server._load_routing_rules()
+
+    assert rules['tradingview'] == {'AUDIT': ['BUILDER_DATA']}
+    assert rules['chartink_throttle'] == {'SHORT TERM BREAKOUTS': 120}
+
+
+def test_chartink_digest_labels_the_candle_that_closed(server):
+    received = datetime(2026, 1, 5, 9, 25, 4, tzinfo=server.MARKET_TIMEZONE)
+
+    assert server._candle_label(received) == '09:20'
+    assert server._candle_label(received.replace(minute=29)) == '09:20'
+
+
+def test_tradingview_test_lists_strategies(client):
+    body = client.get('/webhook/tradingview/test').get_json()
+
+    assert body['status'] == 'ready'
+    assert body['strategies_with_webhooks'] == 5
+
+
+# Notion bridge
+
+def test_notion_update_is_posted_to_builder_infra(client, discord):
+    resp = client.post('/webhook/notion', json=notion_page(builders=()))
+
+    assert resp.status_code == 200
+    assert resp.get_json()['routed_to'] == 'BUILDER_INFRA'
+    content = discord.messages('BUILDER_INFRA')[0]['content']
+    assert 'Needs Re-Plan' in content and 'Webhook load tests' in content
+
+
+def test_notion_single_builder_routes_to_that_builder(client, discord):
+    resp = client.post('/webhook/notion', json=notion_page(builders=('Builder Data',)))
+
+    assert resp.get_json()['routed_to'] == 'BUILDER_DATA'
+    assert len(discord.messages('BUILDER_DATA')) == 1
+
+
+def test_notion_parent_title_is_fetched(client, discord, notion):
+    notion.add_page('parent-route-1', 'Original roadmap item')
+
+    client.post('/webhook/notion', json=notion_page(parent_id='parent-route-1'))
+
+    assert 'Original roadmap item' in discord.messages('BUILDER_INFRA')[0]['content']
+    fetch = notion.requests_to('/v1/pages/parent-route-1')[0]
+    assert fetch.headers['authorization'] == f'Bearer {NOTION_TOKEN}'
+
+
+def test_notion_rejects_invalid_json(client):
+    assert client.post('/webhook/notion', data='{not json').status_code == 400
+
+
+def test_notion_test_route_posts_a_sample(client, discord):
+    body = client.get('/webhook/notion/test').get_json()
+
+    assert body['success'] is True
+    assert 'Citadel webhook bridge' in discord.messages('BUILDER_INFRA')[0]['content']
+
+
+# Admin
+
+def test_admin_routes_require_the_token(client):
+    assert client.get('/admin/dead-letters').status_code == 401
+    assert client.get('/admin/profile?seconds=0.1').status_code == 401
+
+
+def test_dead_letter_discard_and_replay(client, server, supabase, admin_headers):
+    supabase.faults.configure(error_rate=1.0, error_status=500)
+    client.post('/webhook/chartink', json=CHARTINK_PAYLOAD)
+    supabase.faults.reset()
+    client.post('/webhook/chartink', json={'scan_name': 'bad'})
+    good, bad = client.get('/admin/dead-letters', headers=admin_headers).get_json()['entries']
+
+    discard = client.post(f"/admin/dead-letters/{bad['id']}/discard", headers=admin_headers)
+    assert discard.status_code == 200
+    replay = client.post('/admin/dead-letters/replay', json={}, headers=admin_headers)
+    assert replay.status_code == 202 and replay.get_json()['replaying'] == 1
+
+    job = wait_until(lambda: (lambda j: j if not j['running'] else None)(
+        client.get('/admin/dead-letters/replay', headers=admin_headers).get_json()))
+    assert job['summary']['succeeded'] == 1
+    assert len(supabase.rows('chartink_alerts')) == 1
+    assert client.get(f"/admin/dead-letters/{good['id']}", headers=admin_headers).get_json()['status'] == 'replayed'
+
+
+def test_dead_letters_never_keep_webhook_secrets(client, server, supabase, admin_headers, monkeypatch):
+    import webhook_auth
+    monkeypatch.setattr(server, 'authenticator', webhook_auth.WebhookAuthenticator(
+        lambda: {}, static_keys={'chartink': ['s3cret'], 'tradingview': ['hunter2']}, refresh_seconds=300))
+    supabase.faults.configure(error_rate=1.0, error_status=500)
+    client.post('/webhook/chartink?token=s3cret&source=test', json=CHARTINK_PAYLOAD)
+    supabase.faults.reset()
+    client.post('/webhook/tradingview', data=json.dumps({'strategy': 'NOPE', 'passphrase': 'hunter2'}))
+
+    listing = client.get('/admin/dead-letters?payload=1', headers=admin_headers).get_json()
+    assert 's3cret' not in json.dumps(listing) and 'hunter2' not in json.dumps(listing)
+    with open(server.dead_letters.data_path) as f:
+        stored = f.read()
+    assert 's3cret' not in stored and 'hunter2' not in stored
+    chartink = listing['entries'][0]
+    assert chartink['path'] == '/webhook/chartink?source=test'
+
+    # Replays are authenticated by the admin token, not the stripped secret
+    replay = client.post('/admin/dead-letters/replay', json={'ids': [chartink['id']]}, headers=admin_headers)
+    assert replay.status_code == 202
+    assert wait_until(lambda: supabase.rows('chartink_alerts'))
+
+
+def test_rate_limited_chartink_alerts_are_dead_lettered(client, server, supabase, admin_headers, monkeypatch):
+    import rate_limit
+    monkeypatch.setattr(server, 'rate_limiter', rate_limit.RateLimiter(
+        rate_limit.parse_rules({'/webhook/chartink': {'scan': '1/min'}, '/webhook/tradingview': {'strategy': '1/min'}})))
+    client.post('/webhook/chartink', json=CHARTINK_PAYLOAD)
+    client.post('/webhook/tradingview', data=json.dumps({'strategy': 'CIO'}))
+
+    assert client.post('/webhook/chartink', json=CHARTINK_PAYLOAD).status_code == 429
+    assert client.post('/webhook/tradingview', data=json.dumps({'strategy': 'CIO'})).status_code == 429
+
+    entries = client.get('/admin/dead-letters', headers=admin_headers).get_json()['entries']
+    assert [(e['route'], e['status_code']) for e in entries] == [('/webhook/chartink', 429)]
+    client.post('/admin/dead-letters/replay', json={'ids': [entries[0]['id']]}, headers=admin_headers)
+    assert wait_until(lambda: len(supabase.rows('chartink_alerts')) == 2)
+
+
+def test_admin_profile_samples_threads(client, admin_headers):
+    resp = client.get('/admin/profile?seconds=0.2&interval_ms=5', headers=admin_headers)
+
+    assert resp.status_code == 200
+    assert int(resp.headers['X-Profile-Samples']) > 0
+
+
+def test_admin_request_profiles(client, admin_headers):
+    armed = client.post('/admin/profile/requests', json={'route': '/health', 'count': 1}, headers=admin_headers)
+    assert armed.status_code == 200
+    client.get('/health')
+
+    results = client.get('/admin/profile/requests', headers=admin_headers).get_json()['results']
+    assert results and results[-1]['route'] == '/health'
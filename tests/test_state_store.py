@@ -0,0 +1,117 @@
+"""
+RedisStateStore against the RESP stand-in: counters, the GCRA bucket, queues
+and connection handling
+"""
+
+import time
+import threading
+
+import pytest
+
+from conftest import wait_until
+from simulation import ERROR, REFUSE
+from state_store import RedisStateStore, RespError
+
+
+@pytest.fixture
+def store(resp_server):
+    resp_server.reset()
+    return RedisStateStore(resp_server.url, key_prefix='test:', timeout=0.5)
+
+
+# incr
+
+def test_incr_sets_ttl_once_so_the_window_does_not_slide(store, resp_server):
+    assert store.incr('hits', ttl=60) == 1
+    first = resp_server.ttl('test:hits')
+    assert 59 < first <= 60
+
+    assert store.incr('hits', 2, ttl=60) == 3
+    assert resp_server.ttl('test:hits') <= first
+    assert store.get('hits') == '3'
+
+
+def test_incr_without_ttl_never_expires(store, resp_server):
+    assert store.incr('total') == 1
+    assert resp_server.ttl('test:total') is None
+
+
+def test_incr_by_a_negative_amount_still_expires(store, resp_server):
+    assert store.incr('budget', -5, ttl=30) == -5
+    assert resp_server.ttl('test:budget') is not None
+
+
+def test_concurrent_incr_counts_every_call_and_keeps_the_ttl(store, resp_server):
+    def worker():
+        for _ in range(25):
+            store.incr('shared', ttl=60)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store.get('shared') == '200'
+    assert resp_server.ttl('test:shared') is not None
+
+
+def test_counter_back_at_its_first_value_keeps_its_expiry(store, resp_server):
+    store.incr('window', ttl=1)
+    time.sleep(0.3)
+    store.incr('window', -1, ttl=1)
+    assert store.incr('window', ttl=1) == 1
+    assert resp_server.ttl('test:window') < 0.75
+
+
+# take_token
+
+def test_take_token_allows_the_burst_then_reports_the_wait(store):
+    assert [store.take_token('bucket', rate=1.0, burst=3) for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = store.take_token('bucket', rate=1.0, burst=3)
+    assert 0.9 < wait <= 1.0
+
+
+def test_take_token_buckets_are_independent(store):
+    assert store.take_token('a', rate=1.0, burst=1) == 0.0
+    assert store.take_token('a', rate=1.0, burst=1) > 0
+    assert store.take_token('b', rate=1.0, burst=1) == 0.0
+
+
+# Queues
+
+def test_pop_returns_items_in_order_and_trims_the_queue(store):
+    for value in ('one', 'two', 'three'):
+        store.push('q', value)
+
+    assert store.pop('q', 2) == ['one', 'two']
+    assert store.queue_length('q') == 1
+    assert store.pop('q', 5) == ['three']
+    assert store.pop('q') == []
+
+
+# Connections
+
+def test_error_reply_discards_the_connection(store, resp_server):
+    store.set('k', 'v')
+    assert resp_server.connections == 1
+
+    with resp_server.faults.down(ERROR):
+        try:
+            store.get('k')
+        except RespError:
+            # Closed by the store, not by the connection being garbage collected
+            assert wait_until(lambda: resp_server.closed == 1, timeout=1.0)
+        else:
+            pytest.fail('error reply not raised')
+    assert store.get('k') == 'v'
+    assert resp_server.connections == 2
+
+
+def test_dropped_connection_is_reported_and_replaced(store, resp_server):
+    store.set('k', 'v')
+    with resp_server.faults.down(REFUSE):
+        with pytest.raises((OSError, ConnectionError)):
+            store.get('k')
+        assert store.ping() is False
+    assert store.get('k') == 'v'
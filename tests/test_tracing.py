@@ -0,0 +1,145 @@
+"""
+Tracing: traceparent parsing and propagation, sampling, the file exporter and
+request traces through the app
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import tracing
+from tracing import NOOP_SPAN, FileExporter, Tracer, parse_traceparent
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT_ID = '00f067aa0ba902b7'
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+@pytest.fixture
+def exporter():
+    return ListExporter()
+
+
+@pytest.fixture
+def tracer(exporter):
+    return Tracer(exporter, sample_rate=1.0)
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(f'00-{TRACE_ID}-{PARENT_ID}-01') == (TRACE_ID, PARENT_ID, True)
+    assert parse_traceparent(f' 00-{TRACE_ID}-{PARENT_ID}-00 ') == (TRACE_ID, PARENT_ID, False)
+    for bad in (None, '', 'garbage', f'00-{TRACE_ID}-{PARENT_ID}', f'00-{TRACE_ID[:-1]}-{PARENT_ID}-01',
+                f'00-{"z" * 32}-{PARENT_ID}-01', f'00-{TRACE_ID}-{PARENT_ID}-zz'):
+        assert parse_traceparent(bad) is None
+
+
+def test_incoming_traceparent_continues_the_trace(tracer, exporter):
+    with tracer.start_trace('GET /x', f'00-{TRACE_ID}-{PARENT_ID}-01') as root:
+        assert root.traceparent == f'00-{TRACE_ID}-{root.span_id}-01'
+        with tracing.span('child') as child:
+            assert tracing.inject() == child.traceparent
+        assert tracing.current_span() is root
+    assert tracing.current_span() is NOOP_SPAN
+    tracer.flush()
+
+    by_name = {span.name: span for span in exporter.spans}
+    assert by_name['GET /x'].parent_id == PARENT_ID
+    assert by_name['child'].parent_id == root.span_id
+    assert {span.trace_id for span in exporter.spans} == {TRACE_ID}
+
+
+def test_unsampled_parent_and_disabled_tracer_give_noop_spans(tracer):
+    assert tracer.start_trace('x', f'00-{TRACE_ID}-{PARENT_ID}-00') is NOOP_SPAN
+    assert Tracer(None).start_trace('x') is NOOP_SPAN
+    assert tracing.span('orphan') is NOOP_SPAN
+    assert tracing.inject() is None
+
+
+def test_sampling_is_decided_by_trace_id(exporter):
+    assert Tracer(exporter, sample_rate=0.0).start_trace('x') is NOOP_SPAN
+    sampler = Tracer(exporter, sample_rate=0.5)
+    assert sampler._sampled('7fffffff' + '0' * 24)
+    assert not sampler._sampled('80000000' + '0' * 24)
+    # A sampled parent overrides the local rate
+    assert Tracer(exporter, sample_rate=0.0).start_trace('x', f'00-{TRACE_ID}-{PARENT_ID}-01') is not NOOP_SPAN
+
+
+def test_wrap_carries_the_trace_and_request_id_into_threads(tracer, exporter):
+    seen = {}
+
+    def work():
+        seen['request_id'] = tracing.get_request_id()
+        with tracing.span('in-thread') as span:
+            seen['trace_id'] = span.trace_id
+
+    tracing.set_request_id('req-1')
+    try:
+        with tracer.start_trace('root') as root, ThreadPoolExecutor(1) as pool:
+            pool.submit(tracing.wrap(work)).result()
+    finally:
+        tracing.set_request_id(None)
+
+    assert seen == {'request_id': 'req-1', 'trace_id': root.trace_id}
+    assert tracing.wrap(work) is work  # nothing to carry outside a trace
+
+
+def test_span_records_the_exception(tracer, exporter):
+    with pytest.raises(ValueError):
+        with tracer.start_trace('root'):
+            raise ValueError('boom')
+    tracer.flush()
+
+    assert exporter.spans[0].error == 'ValueError: boom'
+
+
+def test_file_exporter_writes_one_json_line_per_span(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    tracer = Tracer(FileExporter(str(path)), sample_rate=1.0, batch_size=2)
+    with tracer.start_trace('root', attributes={'route': '/x'}):
+        for i in range(3):
+            with tracing.span('step', {'i': i}):
+                pass
+    tracer.flush()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line['name'] for line in lines] == ['step', 'step', 'step', 'root']
+    assert [line['attributes'] for line in lines] == [{'i': 0}, {'i': 1}, {'i': 2}, {'route': '/x'}]
+    assert all(line['duration_ms'] >= 0 and line['trace_id'] == lines[-1]['trace_id'] for line in lines)
+
+
+def test_export_failures_and_a_full_queue_count_as_dropped():
+    class Failing:
+        def export(self, spans):
+            raise OSError('collector down')
+
+    tracer = Tracer(Failing(), sample_rate=1.0, max_queue=2)
+    for _ in range(3):
+        tracer.start_trace('x').end()
+    assert tracer.dropped == 1
+    tracer.flush()
+    assert tracer.dropped == 3
+
+
+def test_request_trace_follows_the_caller_into_delivery_threads(client, server, exporter, monkeypatch):
+    monkeypatch.setattr(server, 'tracer', Tracer(exporter, sample_rate=1.0))
+    monkeypatch.setattr(server, '_routing_rules', {'tradingview': {'CIO': ['AUDIT']}})
+
+    resp = client.post('/webhook/tradingview', data=json.dumps({'strategy': 'CIO', 'content': 'x'}),
+                       headers={'traceparent': f'00-{TRACE_ID}-{PARENT_ID}-01'})
+    server.tracer.flush()
+
+    assert resp.headers['traceparent'].startswith(f'00-{TRACE_ID}-')
+    assert resp.headers['X-Request-ID'] == TRACE_ID
+    posts = [span for span in exporter.spans if span.name == 'discord.post']
+    assert len(posts) == 2
+    assert {span.trace_id for span in exporter.spans} == {TRACE_ID}
+    span_ids = {span.span_id for span in exporter.spans}
+    assert all(span.parent_id in span_ids for span in posts)  # not orphaned by the thread hop
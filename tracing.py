@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Lightweight request tracing, OpenTelemetry-compatible on the wire
+Spans carry W3C trace/span ids, propagate through contextvars (and, via
+wrap()/inject(), into thread pools and queued work), and are exported in
+batches as OTLP/HTTP JSON or as one JSON line per span to a local file.
+
+    TRACE_EXPORTER=none|file|otlp   (default none: tracing fully off)
+    TRACE_SAMPLE_RATE=0.1           fraction of new traces kept
+    TRACE_FILE=/tmp/traces.jsonl    for the file exporter
+    OTLP_ENDPOINT=http://collector:4318
+
+When tracing is off, or a request was not sampled, span() returns a shared
+no-op object after a single contextvar read, so instrumented code costs
+next to nothing.
+
+    with tracing.span('discord.post', {'target': label}) as s:
+        ...
+        s.set('http.status_code', resp.status_code)
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+import contextvars
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = 'chartink-webhook'
+
+_current = contextvars.ContextVar('current_span', default=None)
+_request_id = contextvars.ContextVar('request_id', default=None)
+
+
+class Span:
+    """One timed operation. Ended spans are handed to the exporter."""
+
+    __slots__ = ('tracer', 'name', 'trace_id', 'span_id', 'parent_id', 'start_ns', 'end_ns',
+                 'attributes', 'error', '_token')
+
+    def __init__(self, tracer: 'Tracer', name: str, trace_id: str, parent_id: Optional[str],
+                 attributes: Optional[Dict] = None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.error = None
+        self._token = None
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error) -> None:
+        self.error = str(error)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def __enter__(self) -> 'Span':
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc is not None and self.error is None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.end()
+        return False
+
+    def end(self) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                _current.set(None)  # ended from a different context
+            self._token = None
+        self.tracer.export(self)
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_id,
+            'name': self.name,
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano': self.end_ns,
+            'duration_ms': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class _NoopSpan:
+    """Returned whenever nothing is being traced"""
+
+    __slots__ = ()
+    trace_id = None
+    span_id = None
+    traceparent = None
+
+    def set(self, key, value):
+        pass
+
+    def record_error(self, error):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace_id, parent_span_id, sampled) from a W3C traceparent header, or None"""
+    if not header:
+        return None
+    parts = header.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+class FileExporter:
+    """One JSON line per span"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, 'a') as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + '\n')
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class OTLPExporter:
+    """OTLP/HTTP JSON to a collector's /v1/traces"""
+
+    def __init__(self, endpoint: str, timeout: float = 5):
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self.timeout = timeout
+
+    def export(self, spans: List[Span]) -> None:
+        import requests
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                'traceId': span.trace_id,
+                'spanId': span.span_id,
+                'name': span.name,
+                'kind': 2 if span.parent_id is None else 1,  # SERVER for roots, INTERNAL otherwise
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns),
+                'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in span.attributes.items()],
+                'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+            }
+            if span.parent_id:
+                otlp_span['parentSpanId'] = span.parent_id
+            otlp_spans.append(otlp_span)
+        body = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+            'scopeSpans': [{'scope': {'name': 'tracing'}, 'spans': otlp_spans}],
+        }]}
+        resp = requests.post(self.url, json=body, timeout=self.timeout)
+        resp.raise_for_status()
+
+
+class Tracer:
+    """Sampler plus batching exporter. Disabled tracers only hand out no-op spans."""
+
+    def __init__(self, exporter=None, sample_rate: float = 0.1, batch_size: int = 256,
+                 flush_seconds: float = 2.0, max_queue: int = 10000):
+        self.exporter = exporter
+        self.enabled = exporter is not None
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self.dropped = 0
+
+    @classmethod
+    def from_env(cls) -> 'Tracer':
+        kind = os.getenv('TRACE_EXPORTER', 'none').lower()
+        sample_rate = float(os.getenv('TRACE_SAMPLE_RATE', 0.1))
+        if kind == 'file':
+            import tempfile
+            exporter = FileExporter(os.getenv('TRACE_FILE', os.path.join(tempfile.gettempdir(), 'traces.jsonl')))
+        elif kind == 'otlp':
+            exporter = OTLPExporter(os.getenv('OTLP_ENDPOINT', 'http://localhost:4318'))
+        elif kind == 'none':
+            exporter = None
+        else:
+            raise ValueError(f"Unknown TRACE_EXPORTER: {kind}")
+        return cls(exporter, sample_rate)
+
+    def _sampled(self, trace_id: str) -> bool:
+        # Deterministic on the trace id so every service keeps the same traces
+        return int(trace_id[:8], 16) < self.sample_rate * 0x100000000
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None,
+                    attributes: Optional[Dict] = None):
+        """
+        Root span for a request or background job (child of traceparent when
+        given). Sampled by trace id unless the parent already decided.
+        Returns NOOP_SPAN when not traced.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = parse_traceparent(traceparent)
+        if parent:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+            sampled = self._sampled(trace_id)
+        if not sampled:
+            return NOOP_SPAN
+        return Span(self, name, trace_id, parent_id, attributes)
+
+    def export(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._export_loop, name='trace-exporter', daemon=True)
+                    self._worker.start()
+
+    def _export_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def _export_batch(self, batch: List[Span]) -> None:
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            logger.warning(f"Trace export failed ({len(batch)} spans dropped): {e}")
+
+    def flush(self) -> None:
+        """Export everything queued so far (e.g. before shutdown)"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._export_batch(batch)
+
+
+def current_span():
+    return _current.get() or NOOP_SPAN
+
+
+def span(name: str, attributes: Optional[Dict] = None):
+    """Child of the current span, or NOOP_SPAN if this request is not traced"""
+    parent = _current.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.tracer, name, parent.trace_id, parent.span_id, attributes)
+
+
+def set_request_id(request_id: Optional[str]) -> None:
+    _request_id.set(request_id)
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def inject() -> Optional[str]:
+    """traceparent of the current span, to store alongside queued work"""
+    parent = _current.get()
+    return parent.traceparent if parent is not None else None
+
+
+def wrap(fn: Callable) -> Callable:
+    """Run fn in the caller's trace context and request id, e.g. when submitting to an executor"""
+    if _current.get() is None and _request_id.get() is None:
+        return fn
+    context = contextvars.copy_context()
+    # A Context can only be entered by one thread at a time, so each call gets its own copy
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
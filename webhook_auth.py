@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Inbound webhook authentication, checked before the body is parsed
+- shared-secret tokens (ChartInk ?token=, TradingView ?token= or a
+  "passphrase" field found in the raw body) compared with
+  hmac.compare_digest against every accepted key of the source
+- HMAC-SHA256 body signatures (Notion's X-Notion-Signature: sha256=<hex>),
+  computed from pre-keyed HMAC objects so a check is one copy() and one
+  update() over the raw body
+
+Keys come from the controls table (webhook_secret of the CHARTINK,
+TRADINGVIEW and NOTION rows) plus environment variables, are cached per
+worker as bytes, and are refreshed in the background, so the request path
+never waits on the database after the first load.
+"""
+
+import re
+import hmac
+import time
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ('chartink', 'tradingview', 'notion')
+
+# Rejection reasons (metric label values)
+MISSING = 'missing'
+INVALID = 'invalid'
+UNCONFIGURED = 'unconfigured'
+
+# "passphrase": "..." anywhere in a raw JSON body; no JSON parse needed
+_PASSPHRASE_RE = re.compile(rb'"passphrase"\s*:\s*"([^"\\]{1,256})"')
+_PASSPHRASE_TEXT_RE = re.compile(r'("passphrase"\s*:\s*")[^"\\]*(")')
+
+
+def extract_passphrase(body: bytes) -> Optional[bytes]:
+    match = _PASSPHRASE_RE.search(body)
+    return match.group(1) if match else None
+
+
+def redact_passphrase(text: str) -> str:
+    """For logging raw TradingView bodies"""
+    return _PASSPHRASE_TEXT_RE.sub(r'\1***\2', text)
+
+
+def _as_bytes(value: Union[str, bytes]) -> bytes:
+    return value if isinstance(value, bytes) else value.encode()
+
+
+class SourceKeys:
+    """Accepted secrets of one source, pre-encoded and pre-keyed"""
+
+    __slots__ = ('tokens', 'macs')
+
+    def __init__(self, secrets: List[str]):
+        self.tokens: Tuple[bytes, ...] = tuple(secret.encode() for secret in secrets)
+        self.macs = tuple(hmac.new(token, digestmod=hashlib.sha256) for token in self.tokens)
+
+
+def split_secrets(value: Optional[str]) -> List[str]:
+    """Comma-separated secrets (several while rotating)"""
+    return [secret.strip() for secret in (value or '').split(',') if secret.strip()]
+
+
+class WebhookAuthenticator:
+    """
+    Per-source secrets from `loader` (source -> secrets) merged with
+    `static_keys`. Sources without any key are let through unless
+    `required` is set.
+    """
+
+    def __init__(self, loader: Callable[[], Dict[str, List[str]]],
+                 static_keys: Optional[Dict[str, List[str]]] = None,
+                 refresh_seconds: float = 300, required: bool = False):
+        self.loader = loader
+        self.static_keys = {source: list(secrets) for source, secrets in (static_keys or {}).items()}
+        self.refresh_seconds = refresh_seconds
+        self.required = required
+        self._keys: Dict[str, SourceKeys] = self._build({})
+        self._loaded = {}  # last successful loader result
+        self._loaded_at: Optional[float] = None
+        self._refresh_lock = threading.Lock()
+
+    def _build(self, loaded: Dict[str, List[str]]) -> Dict[str, SourceKeys]:
+        keys = {}
+        for source in set(self.static_keys) | set(loaded):
+            secrets = self.static_keys.get(source, []) + loaded.get(source, [])
+            if secrets:
+                keys[source] = SourceKeys(secrets)
+        return keys
+
+    def refresh(self) -> None:
+        try:
+            self._loaded = self.loader()
+        except Exception as e:
+            logger.warning(f"Failed to load webhook secrets, keeping the previous ones: {e}")
+        self._keys = self._build(self._loaded)
+        self._loaded_at = time.monotonic()
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def keys(self, source: str) -> Optional[SourceKeys]:
+        if self._loaded_at is None:
+            with self._refresh_lock:
+                if self._loaded_at is None:
+                    self.refresh()
+        elif time.monotonic() - self._loaded_at > self.refresh_seconds and self._refresh_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh_in_background, name='webhook-auth-refresh', daemon=True).start()
+        return self._keys.get(source)
+
+    def configured_sources(self) -> List[str]:
+        return sorted(self._keys)
+
+    def check_token(self, source: str, presented: Optional[Union[str, bytes]]) -> Optional[str]:
+        """None if accepted, else the rejection reason"""
+        keys = self.keys(source)
+        if keys is None:
+            return UNCONFIGURED if self.required else None
+        if not presented:
+            return MISSING
+        presented = _as_bytes(presented)
+        matched = False
+        for token in keys.tokens:  # no early exit, so timing doesn't tell which key matched
+            matched |= hmac.compare_digest(token, presented)
+        return None if matched else INVALID
+
+    def check_signature(self, source: str, body: bytes, signature: Optional[str]) -> Optional[str]:
+        """None if `signature` ("sha256=<hex>" or "<hex>") is a valid HMAC of body"""
+        keys = self.keys(source)
+        if keys is None:
+            return UNCONFIGURED if self.required else None
+        if not signature:
+            return MISSING
+        presented = _as_bytes(signature.strip().lower())
+        if presented.startswith(b'sha256='):
+            presented = presented[7:]
+        matched = False
+        for base in keys.macs:
+            mac = base.copy()
+            mac.update(body)
+            matched |= hmac.compare_digest(mac.hexdigest().encode(), presented)
+        return None if matched else INVALID
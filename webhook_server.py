@@ -2,17 +2,42 @@
 """
 ChartInk Webhook Server
 Receives webhook alerts from ChartInk and stores them in Supabase
+(or directly in Postgres with STORAGE_BACKEND=postgres)
 """
 
 import os
 import json
+import atexit
+import hashlib
+import hmac
 import logging
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple
-from flask import Flask, request, jsonify
-from supabase import create_client, Client
+import threading
+import time
+from functools import wraps
+from concurrent.futures import CancelledError
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from typing import Callable, Dict, List, Optional, Tuple
+from flask import Flask, request, jsonify, g
 from dotenv import load_dotenv
 import requests as http_requests
+from state_store import create_state_store
+from alert_storage import create_storage
+from price_snapshot import PriceSnapshot
+from instruments import InstrumentMaster
+from alert_stats import AlertAggregator
+from resilience import CircuitBreaker, CircuitOpenError, LocalSpool, TRANSIENT_ERRORS, STATE_CODES, OPEN
+from metrics import metrics
+import tracing
+import http_cache
+import webhook_auth
+import rate_limit
+from profiler import SamplingProfiler, RequestProfiler
+from lifecycle import Lifecycle
+from concurrency import AIMDLimit, AdaptiveExecutor, AdaptiveGate
+from dead_letters import (
+    create_dead_letter_store, replay_entries, REPLAY_HEADER, ADMIN_HEADER, REPLAYED, FAILED, DISCARDED
+)
 
 # Load environment variables
 load_dotenv()
@@ -33,14 +58,433 @@ logger = logging.getLogger(__name__)
 # Initialize Flask app
 app = Flask(__name__)
 
-# Initialize Supabase client
+# Initialize storage (Supabase client by default, see alert_storage.py)
 SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'supabase')
+
+storage = create_storage()
+
+# Shared state (caches, dedup keys, queues). In-process by default; set
+# STATE_BACKEND=redis to share it across instances.
+state = create_state_store()
+
+# /alerts/recent reads this many hours back first (the hot partition when
+# chartink_alerts is partitioned, see create_table.sql)
+ALERTS_HOT_WINDOW_HOURS = float(os.getenv('ALERTS_HOT_WINDOW_HOURS', 48))
+
+# Drop identical ChartInk alerts (same scan, stocks and prices) seen within
+# this many seconds. 0 disables dedup.
+CHARTINK_DEDUP_SECONDS = float(os.getenv('CHARTINK_DEDUP_SECONDS', 0))
+
+# Last-traded-price snapshot used to fill prices for symbol-only ChartInk
+# alerts (see price_snapshot.py). Disabled unless PRICE_SNAPSHOT_FILE is set.
+PRICE_SNAPSHOT_FILE = os.getenv('PRICE_SNAPSHOT_FILE')
+PRICE_SNAPSHOT_REFRESH_SECONDS = float(os.getenv('PRICE_SNAPSHOT_REFRESH_SECONDS', 5))
+PRICE_SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv('PRICE_SNAPSHOT_MAX_AGE_SECONDS', 0))
+
+price_snapshot = PriceSnapshot(PRICE_SNAPSHOT_MAX_AGE_SECONDS)
+if PRICE_SNAPSHOT_FILE:
+    logger.info(f"Price snapshot loaded: {price_snapshot.load_file(PRICE_SNAPSHOT_FILE)} rows, {len(price_snapshot)} symbols")
+
+# Instrument master used to normalize and validate ChartInk symbols (see
+# instruments.py). Unknown symbols are flagged in the response by default;
+# INSTRUMENT_UNKNOWN_POLICY=drop removes them, =reject refuses the alert.
+INSTRUMENT_MASTER_FILE = os.getenv('INSTRUMENT_MASTER_FILE')
+INSTRUMENT_UNKNOWN_POLICY = os.getenv('INSTRUMENT_UNKNOWN_POLICY', 'flag').lower()
+
+instrument_master = InstrumentMaster(INSTRUMENT_MASTER_FILE) if INSTRUMENT_MASTER_FILE else None
+if instrument_master:
+    logger.info(f"Instrument master loaded: {len(instrument_master)} instruments")
+
+# Circuit breakers per dependency (see resilience.py). After
+# BREAKER_FAILURE_THRESHOLD consecutive timeouts/connection errors calls fail
+# fast for BREAKER_RECOVERY_SECONDS, then one probe is let through. Discord
+# and Notion calls use a timeout derived from their observed p99 latency.
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RECOVERY_SECONDS = float(os.getenv('BREAKER_RECOVERY_SECONDS', 30))
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv('SUPABASE_TIMEOUT_SECONDS', 5))
+DISCORD_TIMEOUT_SECONDS = 5
+NOTION_TIMEOUT_SECONDS = 1.5
+
+breakers = {
+    'storage': CircuitBreaker('storage', BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_SECONDS,
+                              max_timeout=SUPABASE_TIMEOUT_SECONDS),
+    'discord': CircuitBreaker('discord', BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_SECONDS,
+                              min_timeout=0.5, max_timeout=DISCORD_TIMEOUT_SECONDS),
+    'notion': CircuitBreaker('notion', BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_SECONDS,
+                             min_timeout=0.3, max_timeout=NOTION_TIMEOUT_SECONDS),
+}
+
+# ChartInk alerts that can't be stored while the database is down are
+# spooled here and inserted by the recovery loop once it is back.
+ALERT_SPOOL_FILE = os.getenv('ALERT_SPOOL_FILE', os.path.join(tempfile.gettempdir(), 'chartink_spool.jsonl'))
+alert_spool = LocalSpool(ALERT_SPOOL_FILE)
+
+# Request tracing (see tracing.py). Off unless TRACE_EXPORTER is file or
+# otlp; TRACE_SAMPLE_RATE picks the share of requests traced. Every request
+# gets an X-Request-ID (echoed back) that follows it into delivery threads
+# and the spool/retry queues.
+tracer = tracing.Tracer.from_env()
+
+
+@app.before_request
+def _start_request_trace():
+    rule = request.url_rule.rule if request.url_rule else request.path
+    root = tracer.start_trace(f"{request.method} {rule}", request.headers.get('traceparent'))
+    g.request_id = request.headers.get('X-Request-ID') or root.trace_id or os.urandom(8).hex()
+    tracing.set_request_id(g.request_id)
+    if root is not tracing.NOOP_SPAN:
+        root.set('request.id', g.request_id)
+        root.set('http.content_length', request.content_length or 0)
+        g.trace_span = root.__enter__()
+
+
+@app.after_request
+def _finish_request_trace(response):
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    root = g.get('trace_span')
+    if root is not None:
+        root.set('http.status_code', response.status_code)
+        response.headers['traceparent'] = root.traceparent
+    return response
+
+
+@app.teardown_request
+def _end_request_trace(exc):
+    root = g.pop('trace_span', None)
+    if root is not None:
+        if exc is not None:
+            root.record_error(exc)
+        root.end()
+
+
+# ============================================
+# HTTP Caching for Polled Endpoints
+# ============================================
+# /alerts/recent, /health and /webhook/tradingview/test are polled by
+# dashboards. Responses carry an ETag and "Cache-Control: no-cache", so
+# clients revalidate with If-None-Match and get an empty 304 when nothing
+# changed. Identical requests within HTTP_MICROCACHE_SECONDS share one
+# rendered response (concurrent misses wait for a single query), and bodies
+# of HTTP_COMPRESS_MIN_BYTES or more are sent gzip/brotli encoded.
+#
+# With STATE_BACKEND=redis every insert, claim, ack and nack replaces a
+# shared alerts version token, so /alerts/recent answers a matching
+# If-None-Match without any database query. With per-worker memory state a
+# worker can't see another worker's inserts, so the ETag is taken from the
+# (micro-cached) body instead and only the transfer is saved.
+
+HTTP_MICROCACHE_SECONDS = float(os.getenv('HTTP_MICROCACHE_SECONDS', 1))
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv('HTTP_COMPRESS_MIN_BYTES', 1024))
+_ALERTS_VERSION_KEY = 'chartink:alerts:version'
+_SHARED_STATE = os.getenv('STATE_BACKEND', 'memory').lower() == 'redis'
+
+response_cache = http_cache.MicroCache(HTTP_MICROCACHE_SECONDS)
+
+metrics.describe('http_cache_requests_total', 'Cached endpoint requests by route and result')
+
+
+def bump_alerts_version() -> None:
+    """Invalidate ETags of alert listings after the alerts table changed"""
+    if not _SHARED_STATE:
+        return
+    try:
+        state.set(_ALERTS_VERSION_KEY, os.urandom(8).hex())
+    except Exception as e:
+        logger.warning(f"Failed to bump alerts version: {e}")
+
+
+def _alerts_version() -> Optional[str]:
+    """Current alerts version token, or None if it can't be trusted"""
+    if not _SHARED_STATE:
+        return None
+    try:
+        version = state.get(_ALERTS_VERSION_KEY)
+        if version is None:
+            # First use, or the state store was flushed
+            state.add_if_absent(_ALERTS_VERSION_KEY, os.urandom(8).hex())
+            version = state.get(_ALERTS_VERSION_KEY)
+        return version
+    except Exception as e:
+        logger.warning(f"State store unavailable for alerts version: {e}")
+        return None
+
+
+def _controls_version() -> Optional[str]:
+    """When this worker's controls snapshot was fetched, while it is fresh"""
+    if _cache_timestamp is None or not _webhook_cache or time.time() - _cache_timestamp > CACHE_TTL_SECONDS:
+        return None  # the view will refresh it
+    return str(_cache_timestamp)
+
+
+def _not_modified(etag: str):
+    return '', 304, {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+
+
+def http_cached(version: Optional[Callable[[], Optional[str]]] = None):
+    """
+    ETag, micro-cache and compress a GET view. `version` returns a token that
+    changes whenever the view's output would, or None when unknown.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            route = request.path
+            key = (route, request.query_string)
+            if_none_match = request.headers.get('If-None-Match')
+            token = version() if version else None
+            etag = http_cache.etag_for(key, token) if token is not None else None
+            if etag and http_cache.etag_matches(if_none_match, etag):
+                metrics.inc('http_cache_requests_total', {'route': route, 'result': 'not_modified'})
+                return _not_modified(etag)
+
+            def render():
+                response = app.make_response(view(*args, **kwargs))
+                body = response.get_data()
+                headers = {name: response.headers[name] for name in ('Retry-After',) if name in response.headers}
+                return http_cache.CachedResponse(response.status_code, body, response.content_type,
+                                                 etag or http_cache.etag_for(body), headers)
+
+            cached, outcome = response_cache.get_or_compute((key, token), render,
+                                                            cacheable=lambda r: r.status == 200)
+            if cached.status == 200 and http_cache.etag_matches(if_none_match, cached.etag):
+                metrics.inc('http_cache_requests_total', {'route': route, 'result': 'not_modified'})
+                return _not_modified(cached.etag)
+            metrics.inc('http_cache_requests_total', {'route': route, 'result': outcome})
+
+            encoding = http_cache.negotiate_encoding(request.headers.get('Accept-Encoding'),
+                                                     len(cached.body), HTTP_COMPRESS_MIN_BYTES)
+            response = app.response_class(cached.encoded(encoding), status=cached.status,
+                                          content_type=cached.content_type)
+            response.headers.update(cached.headers)
+            response.headers['Vary'] = 'Accept-Encoding'
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            if cached.status == 200:
+                response.headers['ETag'] = cached.etag
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+# ============================================
+# Webhook Authentication
+# ============================================
+# Webhook POSTs are authenticated before their body is parsed (see
+# webhook_auth.py), so scanners and junk traffic get a 401 without JSON
+# parsing, storage or Discord work, and are not dead-lettered:
+#   ChartInk     ?token=<secret> on the webhook URL
+#   TradingView  ?token=<secret>, or "passphrase": "<secret>" in the alert body
+#   Notion       X-Notion-Signature: sha256=<HMAC-SHA256 of the body>
+# Secrets come from controls.webhook_secret (rows CHARTINK, TRADINGVIEW,
+# NOTION) and/or the env vars below, comma-separated while rotating. A source
+# with no secret is accepted unless WEBHOOK_AUTH_REQUIRED is set.
+
+WEBHOOK_AUTH_ROUTES = {'/webhook/chartink': 'chartink', '/webhook/tradingview': 'tradingview',
+                       '/webhook/notion': 'notion'}
+WEBHOOK_AUTH_REQUIRED = os.getenv('WEBHOOK_AUTH_REQUIRED', 'false').lower() in ('1', 'true', 'yes')
+AUTH_KEYS_REFRESH_SECONDS = float(os.getenv('AUTH_KEYS_REFRESH_SECONDS', 300))
+NOTION_SIGNATURE_HEADER = 'X-Notion-Signature'
+_AUTH_REJECTED = ('{"error": "Unauthorized"}\n', 401, {'Content-Type': 'application/json'})
+
+
+def _load_webhook_secrets() -> Dict[str, List[str]]:
+    secrets = {}
+    for row in breakers['storage'].call(storage.webhook_secrets):
+        source = (row.get('strategy') or '').lower()
+        if source in webhook_auth.SOURCES:
+            secrets[source] = webhook_auth.split_secrets(row.get('webhook_secret'))
+    return secrets
+
+
+authenticator = webhook_auth.WebhookAuthenticator(
+    _load_webhook_secrets,
+    static_keys={
+        'chartink': webhook_auth.split_secrets(os.getenv('CHARTINK_WEBHOOK_TOKEN')),
+        'tradingview': webhook_auth.split_secrets(os.getenv('TRADINGVIEW_PASSPHRASE')),
+        'notion': webhook_auth.split_secrets(os.getenv('NOTION_WEBHOOK_SECRET')),
+    },
+    refresh_seconds=AUTH_KEYS_REFRESH_SECONDS,
+    required=WEBHOOK_AUTH_REQUIRED,
+)
+
+metrics.describe('auth_rejected_total', 'Webhook requests rejected before parsing, by route and reason')
+
+
+@app.before_request
+def _authenticate_webhook():
+    source = WEBHOOK_AUTH_ROUTES.get(request.path)
+    if source is None or request.method != 'POST':
+        return None
+    if request.headers.get(REPLAY_HEADER) and _is_admin():
+        return None  # dead-letter replay, authenticated by the admin token
+
+    if source == 'notion':
+        reason = authenticator.check_signature(source, request.get_data(cache=True),
+                                               request.headers.get(NOTION_SIGNATURE_HEADER))
+    else:
+        token = request.args.get('token')
+        if token is None and source == 'tradingview':
+            token = webhook_auth.extract_passphrase(request.get_data(cache=True))
+        reason = authenticator.check_token(source, token)
+    if reason is None:
+        return None
+
+    g.auth_rejected = True
+    metrics.inc('auth_rejected_total', {'route': request.path, 'reason': reason})
+    return _AUTH_REJECTED
+
+
+# ============================================
+# Rate Limiting
+# ============================================
+# Token buckets per route and key (see rate_limit.py), checked right after
+# authentication: a TradingView alert stuck in a loop gets 429 + Retry-After
+# before any parsing, storage or Discord call, and other strategies keep
+# their own budget. Keys are the client IP (last hop of
+# RATE_LIMIT_IP_HEADER, else the socket address), the TradingView
+# "strategy"/"agent" field and the ChartInk "scan_name", read from the raw
+# body. By default only TradingView strategies are limited: ChartInk and
+# Notion post from a handful of egress IPs and never retry, so a 429 there
+# loses the alert. RATE_LIMITS (JSON, same shape as DEFAULT_RATE_LIMITS)
+# overrides the defaults; '{}' turns limiting off. ChartInk requests refused
+# by a configured limit are dead-lettered so they can be replayed.
+# RATE_LIMIT_SHARED=true keeps the buckets in the state store so all
+# workers/instances share them.
+
+DEFAULT_RATE_LIMITS = {
+    '/webhook/tradingview': {'strategy': '60/min'},
+}
+RATE_LIMITS = json.loads(os.getenv('RATE_LIMITS')) if os.getenv('RATE_LIMITS') else DEFAULT_RATE_LIMITS
+RATE_LIMIT_SHARED = os.getenv('RATE_LIMIT_SHARED', 'false').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_IP_HEADER = os.getenv('RATE_LIMIT_IP_HEADER', 'X-Forwarded-For')
+
+rate_limiter = rate_limit.RateLimiter(
+    rate_limit.parse_rules(RATE_LIMITS),
+    rate_limit.SharedBuckets(state) if RATE_LIMIT_SHARED else rate_limit.LocalBuckets(),
+)
+
+metrics.describe('rate_limited_total', 'Webhook requests refused with 429, by route and limit')
+
+
+def _client_ip() -> str:
+    forwarded = request.headers.get(RATE_LIMIT_IP_HEADER) if RATE_LIMIT_IP_HEADER else None
+    if forwarded:
+        return forwarded.rsplit(',', 1)[-1].strip()  # appended by our own proxy, not the client
+    return request.remote_addr or 'unknown'
+
+
+def _rate_limit_keys(dimensions: set) -> Dict[str, Optional[str]]:
+    values = {}
+    if 'ip' in dimensions:
+        values['ip'] = _client_ip()
+    if 'strategy' in dimensions:
+        values['strategy'] = (rate_limit.json_string_field(request.get_data(cache=True), 'strategy', 'agent')
+                              or 'CIO').upper()
+    if 'scan' in dimensions:
+        values['scan'] = rate_limit.json_string_field(request.get_data(cache=True), 'scan_name')
+    return values
+
+
+@app.before_request
+def _rate_limit_webhook():
+    if request.method != 'POST':
+        return None
+    limits = rate_limiter.limits(request.path)
+    if not limits or request.headers.get(REPLAY_HEADER) and _is_admin():
+        return None
+
+    hit = rate_limiter.check(request.path, _rate_limit_keys({limit.dimension for limit in limits}))
+    if hit is None:
+        return None
+    limit, wait = hit
+    g.rate_limited = True
+    metrics.inc('rate_limited_total', {'route': request.path, 'limit': limit.dimension})
+    retry_after = str(int(wait) + 1)
+    return jsonify({'error': 'Rate limit exceeded', 'limit': limit.dimension, 'rate': limit.spec,
+                    'retry_after': retry_after}), 429, {'Retry-After': retry_after}
+
+
+# ============================================
+# Adaptive Concurrency
+# ============================================
+# Webhook handlers and Discord deliveries spend nearly all their time waiting
+# on Supabase and Discord, so instead of a fixed thread count each has an
+# AIMD limit (see concurrency.py) re-decided every second: it grows while
+# work queues for a slot at steady latency (jumping to the Little's-law
+# estimate when that is higher), and backs off when latency climbs well
+# above its baseline or calls come back overloaded (5xx, Discord 429s and
+# timeouts). gunicorn runs GUNICORN_THREADS threads per worker, the ceiling;
+# the request limit decides how many of them handle webhooks at once.
+# Current limits and every change are exported at /metrics.
+
+REQUEST_CONCURRENCY_MIN = int(os.getenv('REQUEST_CONCURRENCY_MIN', 2))
+REQUEST_CONCURRENCY_MAX = int(os.getenv('REQUEST_CONCURRENCY_MAX', os.getenv('GUNICORN_THREADS', 16)))
+REQUEST_QUEUE_TIMEOUT_SECONDS = float(os.getenv('REQUEST_QUEUE_TIMEOUT_SECONDS', 10))
+
+
+def _log_concurrency_change(limit: AIMDLimit, decision: str, reason: str) -> None:
+    metrics.inc('concurrency_adjustments_total', {'pool': limit.name, 'direction': decision})
+    logger.info(f"Concurrency {limit.name} {decision} to {limit.limit}: {reason}")
+
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    raise ValueError("Missing Supabase configuration in environment variables")
+request_limit = AIMDLimit('requests', min(4, REQUEST_CONCURRENCY_MAX), REQUEST_CONCURRENCY_MIN,
+                          REQUEST_CONCURRENCY_MAX, on_adjust=_log_concurrency_change)
+request_gate = AdaptiveGate(request_limit)
+
+
+@app.before_request
+def _admit_webhook():
+    if request.method != 'POST' or request.path not in WEBHOOK_AUTH_ROUTES:
+        return None
+    permit = request_gate.acquire(REQUEST_QUEUE_TIMEOUT_SECONDS)
+    if permit is None:
+        metrics.inc('concurrency_rejected_total', {'pool': request_limit.name})
+        return jsonify({'error': 'Server busy'}), 503, {'Retry-After': '1'}
+    g.concurrency_permit = permit
+    return None
+
+
+@app.after_request
+def _mark_webhook_outcome(response):
+    permit = g.get('concurrency_permit')
+    if permit is not None and response.status_code >= 500:
+        permit.overloaded = True
+    return response
+
+
+@app.teardown_request
+def _release_webhook_slot(exc):
+    permit = g.pop('concurrency_permit', None)
+    if permit is not None:
+        if exc is not None:
+            permit.overloaded = True
+        request_gate.release(permit)
+
+
+def _concurrency_metrics():
+    for limit, gate in ((request_limit, request_gate), (delivery_limit, _delivery_pool.gate)):
+        labels = {'pool': limit.name}
+        snapshot = limit.snapshot()
+        yield 'concurrency_limit', labels, snapshot['limit']
+        yield 'concurrency_in_flight', labels, gate.in_flight
+        yield 'concurrency_waiting', labels, gate.waiting
+        for key in ('latency', 'queue_delay', 'little_estimate'):
+            if snapshot[key] is not None:
+                yield f'concurrency_{key}', labels, snapshot[key]
+
+
+metrics.describe('concurrency_adjustments_total', 'Adaptive concurrency limit changes by pool and direction')
+metrics.describe('concurrency_rejected_total', 'Webhook requests refused after waiting too long for a slot')
+metrics.describe('concurrency_limit', 'Current adaptive concurrency limit')
+metrics.describe('concurrency_in_flight', 'Work currently holding a slot')
+metrics.describe('concurrency_waiting', 'Work waiting for a slot')
+metrics.describe('concurrency_latency', 'Median seconds per unit of work in the last window')
+metrics.describe('concurrency_queue_delay', 'Mean seconds waited for a slot in the last window')
+metrics.describe('concurrency_little_estimate', "Arrival rate x latency: concurrency needed to keep up")
+metrics.register_collector(_concurrency_metrics)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 class ChartInkWebhookProcessor:
     """Process ChartInk webhook payloads and store in database"""
@@ -113,6 +557,44 @@ class ChartInkWebhookProcessor:
             'max_trigger_price': max(prices)
         }
     
+    @staticmethod
+    def normalize_symbols(stocks: List[str], prices: List[float]) -> Tuple[List[str], List[float], List[str]]:
+        """
+        Map symbols to their instrument master spelling (RELIANCE.NS -> RELIANCE).
+        Returns (stocks, prices, unknown_symbols); with the drop policy unknown
+        symbols are removed together with their prices.
+        """
+        normalized, kept_prices, unknown = [], [], []
+        for i, symbol in enumerate(stocks):
+            instrument = instrument_master.lookup(symbol)
+            if instrument is None:
+                unknown.append(symbol)
+                if INSTRUMENT_UNKNOWN_POLICY == 'drop':
+                    continue
+            normalized.append(instrument.symbol if instrument else symbol)
+            if i < len(prices):
+                kept_prices.append(prices[i])
+        return normalized, kept_prices, unknown
+    
+    @staticmethod
+    def fill_missing_prices(stocks: List[str]) -> List[float]:
+        """
+        Look up last traded prices for a symbol-only alert from the local
+        snapshot. Returns [] unless every symbol has a price.
+        """
+        if not PRICE_SNAPSHOT_FILE:
+            return []
+        # Tail the file even while it is empty or missing (feed not started yet)
+        price_snapshot.start_refresh(PRICE_SNAPSHOT_REFRESH_SECONDS)
+        if not len(price_snapshot):
+            return []
+        prices = price_snapshot.lookup(stocks)
+        missing = [stock for stock, price in zip(stocks, prices) if price is None]
+        if missing:
+            logger.warning(f"No snapshot price for {len(missing)} symbols: {missing[:10]}")
+            return []
+        return prices
+    
     @staticmethod
     def validate_webhook_payload(payload: Dict) -> Tuple[bool, str]:
         """Validate incoming webhook payload"""
@@ -127,6 +609,20 @@ class ChartInkWebhookProcessor:
             
         return True, "Valid payload"
     
+    @staticmethod
+    def after_store(alert_data: Dict) -> None:
+        """Side effects of a stored alert: wake claimers, update stats, publish to Discord"""
+        notify_new_alerts()
+        try:
+            record_alert_stats(alert_data)
+        except Exception as e:
+            logger.error(f"Failed to update alert stats: {e}")
+        if CHARTINK_DISCORD_ENABLED:
+            try:
+                publish_chartink_alert(alert_data)
+            except Exception as e:
+                logger.error(f"Failed to queue ChartInk alert for Discord: {e}")
+
     @classmethod
     def process_webhook(cls, payload: Dict) -> Dict:
         """
@@ -140,7 +636,8 @@ class ChartInkWebhookProcessor:
         """
         try:
             # Validate payload
-            is_valid, message = cls.validate_webhook_payload(payload)
+            with tracing.span('chartink.validate'):
+                is_valid, message = cls.validate_webhook_payload(payload)
             if not is_valid:
                 return {'success': False, 'error': message}
             
@@ -168,9 +665,26 @@ class ChartInkWebhookProcessor:
                 
                 if not stocks:
                     return {'success': False, 'error': 'No valid stocks found in payload'}
-                
-                if len(stocks) != len(prices):
-                    return {'success': False, 'error': 'Mismatch between stocks and prices count'}
+            
+            # Normalize and validate symbols against the instrument master
+            unknown_symbols = []
+            if instrument_master:
+                with tracing.span('chartink.normalize_symbols', {'symbols': len(stocks)}):
+                    stocks, prices, unknown_symbols = cls.normalize_symbols(stocks, prices)
+                if unknown_symbols:
+                    logger.warning(f"Unknown symbols in {payload['scan_name']}: {unknown_symbols[:20]}")
+                    if INSTRUMENT_UNKNOWN_POLICY == 'reject':
+                        return {'success': False, 'error': f'Unknown symbols: {unknown_symbols}'}
+                    if not stocks:
+                        return {'success': False, 'error': 'No valid stocks found in payload'}
+            
+            if stocks and not prices:
+                # New ChartInk format: symbols only, fill from the price snapshot
+                with tracing.span('chartink.fill_prices', {'symbols': len(stocks)}):
+                    prices = cls.fill_missing_prices(stocks)
+            
+            if len(stocks) != len(prices):
+                return {'success': False, 'error': 'Mismatch between stocks and prices count'}
             
             # Calculate metrics
             total_stocks = len(stocks)
@@ -191,22 +705,52 @@ class ChartInkWebhookProcessor:
                 'source_platform': 'ChartInk'
             }
             
-            # Insert into Supabase
-            result = supabase.table('chartink_alerts').insert(alert_data).execute()
+            dedup_key = None
+            if CHARTINK_DEDUP_SECONDS > 0:
+                fingerprint = json.dumps([payload['scan_name'], stocks, prices])
+                dedup_key = 'chartink:dedup:' + hashlib.sha1(fingerprint.encode()).hexdigest()
+                if not state.add_if_absent(dedup_key, '1', ttl=CHARTINK_DEDUP_SECONDS):
+                    logger.info(f"Duplicate alert ignored: {payload['scan_name']} with {total_stocks} stocks")
+                    return {'success': True, 'message': 'Duplicate alert ignored', 'duplicate': True}
+
+            # Insert into the database; spool locally if it is unreachable
+            try:
+                with tracing.span('storage.insert', {'backend': STORAGE_BACKEND, 'stocks': total_stocks}):
+                    row = breakers['storage'].call(storage.insert_alert, alert_data)
+            except (CircuitOpenError, *TRANSIENT_ERRORS) as e:
+                logger.warning(f"Storage unavailable, spooling alert {payload['scan_name']}: {e}")
+                spool_alert(alert_data)
+                return {
+                    'success': True,
+                    'spooled': True,
+                    'message': 'Storage unavailable, alert spooled for retry',
+                    'data': {'total_stocks': total_stocks, 'avg_price': price_metrics['avg_trigger_price']}
+                }
+            except Exception:
+                if dedup_key:
+                    state.delete(dedup_key)  # let the sender's retry through
+                raise
             
-            if result.data:
+            if row:
                 logger.info(f"Successfully stored alert: {payload['scan_name']} with {total_stocks} stocks")
-                return {
+                with tracing.span('chartink.after_store'):
+                    cls.after_store(alert_data)
+                response = {
                     'success': True,
                     'message': 'Alert stored successfully',
                     'data': {
-                        'id': result.data[0]['id'],
+                        'id': row['id'],
                         'total_stocks': total_stocks,
                         'avg_price': price_metrics['avg_trigger_price']
                     }
                 }
+                if unknown_symbols:
+                    response['data']['unknown_symbols'] = unknown_symbols
+                return response
             else:
-                logger.error(f"Failed to insert data: {result}")
+                logger.error(f"Failed to insert data: {alert_data['scan_name']}")
+                if dedup_key:
+                    state.delete(dedup_key)
                 return {'success': False, 'error': 'Database insertion failed'}
                 
         except Exception as e:
@@ -222,15 +766,19 @@ def chartink_webhook():
         if not request.is_json:
             return jsonify({'error': 'Content-Type must be application/json'}), 400
         
-        payload = request.get_json()
+        with tracing.span('parse_json', {'bytes': request.content_length or 0}):
+            payload = request.get_json()
         if not payload:
             return jsonify({'error': 'Empty payload'}), 400
         
         logger.info(f"Received webhook: {json.dumps(payload, indent=2)}")
         
         # Process webhook
+        start_recovery()
         result = ChartInkWebhookProcessor.process_webhook(payload)
         
+        if result.get('spooled'):
+            return jsonify(result), 202
         if result['success']:
             return jsonify(result), 200
         else:
@@ -242,16 +790,28 @@ def chartink_webhook():
 
 # Health check endpoint
 @app.route('/health', methods=['GET'])
+@http_cached()
 def health_check():
     """Health check endpoint"""
+    dependencies = {name: breaker.snapshot() for name, breaker in breakers.items()}
+    if lifecycle.draining:
+        # Shutting down: take this instance out of the load balancer
+        return jsonify({
+            'status': 'draining',
+            'timestamp': datetime.now().isoformat(),
+            'dependencies': dependencies,
+            'fallbacks': fallback_depths()
+        }), 503
     try:
-        # Test database connection
-        result = supabase.table('chartink_alerts').select('id').limit(1).execute()
+        # Test database connection (fails fast while the storage circuit is open)
+        breakers['storage'].call(storage.ping)
         
         return jsonify({
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
-            'database': 'connected'
+            'database': 'connected',
+            'dependencies': dependencies,
+            'fallbacks': fallback_depths()
         }), 200
         
     except Exception as e:
@@ -259,9 +819,17 @@ def health_check():
         return jsonify({
             'status': 'unhealthy',
             'timestamp': datetime.now().isoformat(),
-            'error': str(e)
+            'error': str(e),
+            'dependencies': dependencies,
+            'fallbacks': fallback_depths()
         }), 500
 
+# Prometheus metrics for this worker
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition of this worker's counters and gauges"""
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 # Test endpoint for manual testing
 @app.route('/test', methods=['POST'])
 def test_webhook():
@@ -278,24 +846,28 @@ def test_webhook():
 
 # Get recent alerts endpoint
 @app.route('/alerts/recent', methods=['GET'])
+@http_cached(_alerts_version)
 def get_recent_alerts():
     """Get recent alerts from database"""
     try:
         limit = request.args.get('limit', 10, type=int)
         limit = min(limit, 100)  # Cap at 100
         
-        result = supabase.table('chartink_alerts')\
-            .select('*')\
-            .order('created_at', desc=True)\
-            .limit(limit)\
-            .execute()
+        # Look in the hot window first so a partitioned table only scans its
+        # newest partition; reach further back only if that wasn't enough
+        since = (datetime.now(MARKET_TIMEZONE) - timedelta(hours=ALERTS_HOT_WINDOW_HOURS)).isoformat()
+        alerts = breakers['storage'].call(storage.recent_alerts, limit, since)
+        if len(alerts) < limit:
+            alerts += breakers['storage'].call(storage.recent_alerts, limit - len(alerts), None, since)
         
         return jsonify({
             'success': True,
-            'count': len(result.data),
-            'alerts': result.data
+            'count': len(alerts),
+            'alerts': alerts
         }), 200
         
+    except CircuitOpenError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(int(e.retry_after) + 1)}
     except Exception as e:
         logger.error(f"Error fetching recent alerts: {e}")
         return jsonify({'error': str(e)}), 500
@@ -307,10 +879,51 @@ def get_recent_alerts():
 # Dynamically routes to Discord webhooks based on strategy in controls table
 # Payload should contain "strategy" field (e.g., "INDEX_FUTURES_MANAGER", "trade_ai")
 
-# Cache for webhook lookups (refreshed on miss)
+# Cache for webhook lookups (refreshed on miss). The local dict is this
+# worker's copy of the snapshot kept in the shared state store, so N instances
+# refresh controls once per TTL between them instead of once each.
 _webhook_cache = {}
 _cache_timestamp = None
 CACHE_TTL_SECONDS = 300  # 5 minutes
+_CONTROLS_CACHE_KEY = 'controls:discord_webhooks'
+_CONTROLS_REFRESH_LOCK = 'controls:refresh_lock'
+
+
+def _refresh_webhook_cache(now: float) -> None:
+    """Load the controls snapshot from shared state, or from Supabase if none is fresh"""
+    global _webhook_cache, _cache_timestamp
+
+    try:
+        shared = state.get(_CONTROLS_CACHE_KEY)
+        if shared:
+            snapshot = json.loads(shared)
+            _webhook_cache = snapshot['webhooks']
+            _cache_timestamp = snapshot['fetched_at']
+            tracing.current_span().set('source', 'state')
+            return
+        if _webhook_cache and not state.add_if_absent(_CONTROLS_REFRESH_LOCK, str(os.getpid()), ttl=10):
+            return  # another instance is refreshing; keep serving the stale copy
+    except Exception as e:
+        logger.warning(f"State store unavailable for controls cache: {e}")
+
+    try:
+        tracing.current_span().set('source', 'storage')
+        rows = breakers['storage'].call(storage.discord_webhooks)
+        _webhook_cache = {row['strategy'].upper(): row['discord_webhook_url'] for row in rows}
+        _cache_timestamp = now
+        logger.info(f"Webhook cache refreshed: {len(_webhook_cache)} strategies")
+    except Exception as e:
+        logger.error(f"Failed to refresh webhook cache: {e}")
+        # Continue with stale cache if available
+        return
+
+    try:
+        snapshot = json.dumps({'fetched_at': now, 'webhooks': _webhook_cache})
+        state.set(_CONTROLS_CACHE_KEY, snapshot, ttl=CACHE_TTL_SECONDS)
+        state.delete(_CONTROLS_REFRESH_LOCK)
+    except Exception as e:
+        logger.warning(f"Failed to share controls cache: {e}")
+
 
 def get_webhook_for_strategy(strategy: str) -> Optional[str]:
     """
@@ -320,25 +933,14 @@ def get_webhook_for_strategy(strategy: str) -> Optional[str]:
     - Case-insensitive: "index_futures_manager"
     - Partial match for _ai suffix: "trade_ai" matches strategies containing "TRADE" or "LONG" or "SHORT"
     """
-    global _webhook_cache, _cache_timestamp
     import time
 
     now = time.time()
 
     # Refresh cache if stale
     if _cache_timestamp is None or (now - _cache_timestamp) > CACHE_TTL_SECONDS:
-        try:
-            result = supabase.table('controls')\
-                .select('strategy, discord_webhook_url')\
-                .not_.is_('discord_webhook_url', 'null')\
-                .execute()
-
-            _webhook_cache = {row['strategy'].upper(): row['discord_webhook_url'] for row in result.data}
-            _cache_timestamp = now
-            logger.info(f"Webhook cache refreshed: {len(_webhook_cache)} strategies")
-        except Exception as e:
-            logger.error(f"Failed to refresh webhook cache: {e}")
-            # Continue with stale cache if available
+        with tracing.span('controls.refresh', {'strategy': strategy}):
+            _refresh_webhook_cache(now)
 
     strategy_upper = strategy.upper().replace("-", "_")
 
@@ -370,6 +972,188 @@ def get_webhook_for_strategy(strategy: str) -> Optional[str]:
 
     return None
 
+# Fan-out routing rules: one alert can reach several Discord channels.
+# Rules map a strategy to extra destinations, each either a strategy name
+# from the controls table or a raw Discord webhook URL. "*" applies to every
+# strategy. Loaded once from ROUTING_RULES (inline JSON) or ROUTING_RULES_FILE:
+#   {"tradingview": {"INDEX_FUTURES_MANAGER": ["CIO", "AUDIT"], "*": ["AUDIT"]}}
+ROUTING_RULES_FILE = os.getenv(
+    'ROUTING_RULES_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'routing_rules.json')
+)
+# Concurrent Discord posts adapt between DELIVERY_MIN_WORKERS and
+# DELIVERY_MAX_WORKERS (see "Adaptive Concurrency" below)
+DELIVERY_MIN_WORKERS = int(os.getenv('DELIVERY_MIN_WORKERS', 2))
+DELIVERY_MAX_WORKERS = int(os.getenv('DELIVERY_MAX_WORKERS', 16))
+
+delivery_limit = AIMDLimit('delivery', min(8, DELIVERY_MAX_WORKERS), DELIVERY_MIN_WORKERS, DELIVERY_MAX_WORKERS,
+                           on_adjust=_log_concurrency_change)
+_delivery_pool = AdaptiveExecutor(delivery_limit, thread_name_prefix='discord-delivery')
+
+
+def _load_routing_rules() -> Dict[str, Dict[str, List[str]]]:
+    """Load fan-out rules, normalizing strategy keys like get_webhook_for_strategy does"""
+    try:
+        raw = os.getenv('ROUTING_RULES')
+        if raw:
+            rules = json.loads(raw)
+        elif os.path.exists(ROUTING_RULES_FILE):
+            with open(ROUTING_RULES_FILE) as f:
+                rules = json.load(f)
+        else:
+            return {}
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to load routing rules: {e}")
+        return {}
+
+    if not isinstance(rules, dict):
+        logger.error("Routing rules must be a JSON object")
+        return {}
+
+    normalized = {}
+    for section, mapping in rules.items():
+        if not isinstance(mapping, dict):
+            continue
+        normalized[section] = {}
+        for key, targets in mapping.items():
+            key = key.upper().replace("-", "_")
+            if section == 'chartink_throttle':
+                if isinstance(targets, (int, float)) and not isinstance(targets, bool):
+                    normalized[section][key] = targets
+                else:
+                    logger.warning(f"Ignoring routing rule {section}.{key}: expected a window in seconds")
+                continue
+            if isinstance(targets, str):
+                targets = [targets]
+            if not isinstance(targets, list):
+                logger.warning(f"Ignoring routing rule {section}.{key}: expected a destination or a list of them")
+                continue
+            normalized[section][key] = [t for t in targets if isinstance(t, str) and t]
+    logger.info(f"Routing rules loaded: { {k: len(v) for k, v in normalized.items()} }")
+    return normalized
+
+
+_routing_rules = _load_routing_rules()
+
+
+def resolve_destinations(section: str, strategy: str, include_self: bool = True) -> List[Tuple[str, str]]:
+    """
+    Resolve every Discord destination for a strategy as (label, webhook_url).
+    The strategy's own channel comes first (unless include_self is False),
+    followed by the routing-rule extras. Destinations sharing a webhook URL
+    are only posted once.
+    """
+    rules = _routing_rules.get(section, {})
+    strategy_upper = strategy.upper().replace("-", "_")
+    targets = ([strategy] if include_self else []) + rules.get(strategy_upper, []) + rules.get('*', [])
+
+    destinations = []
+    seen_urls = set()
+    for target in targets:
+        if target.startswith('https://') or target.startswith('http://'):
+            label, url = 'custom_webhook', target
+        else:
+            label, url = target.upper().replace("-", "_"), get_webhook_for_strategy(target)
+        if not url or url in seen_urls:
+            continue
+        seen_urls.add(url)
+        destinations.append((label, url))
+    return destinations
+
+
+def _discord_webhook_id(webhook_url: str) -> str:
+    """The non-secret id part of .../api/webhooks/<id>/<token>, for logs and spans"""
+    if '/webhooks/' not in webhook_url:
+        return webhook_url.split('://')[-1].split('/')[0]
+    return webhook_url.split('/webhooks/')[1].split('/')[0]
+
+
+def _send_to_discord(webhook_url: str, discord_payload: Dict, attempt: int = 1) -> Tuple[Dict, Optional[float]]:
+    """
+    POST one message through the Discord breaker. Returns (result, retry_after);
+    retry_after is set when the failure is worth retrying later (Discord
+    unreachable or 5xx, rate limited, circuit open).
+    """
+    breaker = breakers['discord']
+    timeout = breaker.timeout()
+    with tracing.span('discord.post', {'webhook_id': _discord_webhook_id(webhook_url), 'attempt': attempt,
+                                       'timeout': timeout}) as post_span:
+        try:
+            resp = breaker.call(
+                http_requests.post, webhook_url, json=discord_payload, timeout=timeout,
+                failure_if=lambda r: r.status_code >= 500,
+            )
+        except CircuitOpenError as e:
+            post_span.record_error(e)
+            return {'error': str(e)}, e.retry_after
+        except TRANSIENT_ERRORS as e:
+            post_span.record_error(e)
+            return {'error': str(e)}, 1.0
+        except Exception as e:
+            post_span.record_error(e)
+            return {'error': str(e)}, None
+        post_span.set('http.status_code', resp.status_code)
+
+    result = {'discord_status': resp.status_code}
+    if resp.status_code >= 400:
+        result['discord_response'] = resp.text[:500]
+    if resp.status_code == 429:
+        try:
+            return result, float(resp.json().get('retry_after', 1))
+        except ValueError:
+            return result, 1.0
+    if resp.status_code >= 500:
+        return result, 1.0
+    return result, None
+
+
+def _post_to_discord(webhook_url: str, discord_payload: Dict) -> Dict:
+    """
+    POST one message to one Discord webhook. Never raises. If Discord is down
+    or rate limiting, the message is queued for the recovery loop and the
+    result carries queued=True instead of an error.
+    """
+    result, retry_after = _send_to_discord(webhook_url, discord_payload)
+    if retry_after is None:
+        return result
+    try:
+        queue_discord_message(webhook_url, discord_payload, retry_after)
+    except Exception as e:
+        logger.error(f"Failed to queue Discord message: {e}")
+        return result if 'error' in result else {**result, 'error': f"Discord status {result['discord_status']}"}
+    return {'queued': True, 'reason': result.get('error') or f"Discord status {result['discord_status']}"}
+
+
+def _delivery_overloaded(result: Dict) -> bool:
+    # Queued means Discord rate limited us, timed out or returned 5xx
+    return bool(result.get('queued'))
+
+
+def deliver_to_discord(destinations: List[Tuple[str, str]], discord_payload: Dict) -> List[Dict]:
+    """
+    Deliver a message to every destination concurrently so total latency is
+    close to the slowest single post. Returns per-destination status in the
+    same order as destinations.
+    """
+    if len(destinations) == 1:
+        label, url = destinations[0]
+        return [{'target': label, **_delivery_pool.call(_post_to_discord, url, discord_payload,
+                                                        overloaded_if=_delivery_overloaded)}]
+
+    futures = [
+        (label, _delivery_pool.submit(tracing.wrap(_post_to_discord), url, discord_payload,
+                                      overloaded_if=_delivery_overloaded))
+        for label, url in destinations
+    ]
+    results = []
+    for label, future in futures:
+        try:
+            results.append({'target': label, **future.result()})
+        except CancelledError:  # not started before shutdown; the drain queued it
+            results.append({'target': label, 'queued': True, 'reason': 'shutting down'})
+    return results
+
+
 def get_available_strategies() -> List[str]:
     """Return list of strategies that have webhooks configured"""
     global _webhook_cache
@@ -380,21 +1164,32 @@ def get_available_strategies() -> List[str]:
 @app.route("/webhook/tradingview", methods=["POST"])
 def tradingview_webhook():
     try:
-        body = request.get_data(as_text=True).strip()
-        logger.info(f"TradingView webhook received: {body[:300]}")
+        with tracing.span('read_body'):
+            body = request.get_data(as_text=True).strip()
+        logger.info(f"TradingView webhook received: {webhook_auth.redact_passphrase(body)[:300]}")
         if not body:
             return jsonify({"error": "Empty body"}), 400
-        try:
-            payload = json.loads(body)
-        except json.JSONDecodeError:
-            # Plain text — send to default (CIO channel)
-            payload = {"content": body, "strategy": "CIO"}
+        with tracing.span('parse_json', {'bytes': len(body)}) as parse_span:
+            try:
+                payload = json.loads(body)
+            except json.JSONDecodeError:
+                # Plain text — send to default (CIO channel)
+                payload = {"content": body, "strategy": "CIO"}
+                parse_span.set('plain_text', True)
+        if isinstance(payload, dict):
+            payload.pop("passphrase", None)  # never relay the secret to Discord
 
         # Route by "strategy" or "agent" field in payload
         strategy = payload.get("strategy") or payload.get("agent") or "CIO"
-        webhook_url = get_webhook_for_strategy(strategy)
+        with tracing.span('resolve_destinations', {'strategy': strategy}) as route_span:
+            # The strategy needs a channel of its own; "*" extras alone don't count
+            if get_webhook_for_strategy(strategy):
+                destinations = resolve_destinations("tradingview", strategy)
+            else:
+                destinations = []
+            route_span.set('destinations', len(destinations))
 
-        if not webhook_url:
+        if not destinations:
             available = get_available_strategies()
             logger.warning(f"No webhook for strategy '{strategy}'. Available: {available[:20]}...")
             return jsonify({
@@ -409,14 +1204,24 @@ def tradingview_webhook():
         if payload.get("username"):
             discord_payload["username"] = payload["username"]
 
-        resp = http_requests.post(webhook_url, json=discord_payload, timeout=5)
-        logger.info(f"Discord response for strategy '{strategy}': {resp.status_code}")
-        return jsonify({"success": True, "strategy": strategy, "discord_status": resp.status_code}), 200
+        deliveries = deliver_to_discord(destinations, discord_payload)
+        logger.info(f"Discord responses for strategy '{strategy}': {deliveries}")
+
+        if all('error' in d for d in deliveries):
+            return jsonify({"success": False, "strategy": strategy, "deliveries": deliveries}), 502
+
+        return jsonify({
+            "success": True,
+            "strategy": strategy,
+            "discord_status": deliveries[0].get('discord_status'),  # the strategy's own channel comes first
+            "deliveries": deliveries
+        }), 200
     except Exception as e:
         logger.error(f"TradingView webhook error: {e}")
         return jsonify({"error": str(e)}), 500
 
 @app.route("/webhook/tradingview/test", methods=["GET"])
+@http_cached(_controls_version)
 def tradingview_test():
     """Test endpoint showing available strategies"""
     available = get_available_strategies()
@@ -428,6 +1233,936 @@ def tradingview_test():
     }), 200
 
 
+# ============================================
+# ChartInk -> Discord Bridge (per-scan throttled digests)
+# ============================================
+# Optionally publishes accepted ChartInk alerts to Discord. Scans are mapped
+# to channels in the "chartink" section of the routing rules (same format as
+# the tradingview section, keyed by scan_name). To stay under Discord rate
+# limits at market open, alerts for a destination are held for a throttle
+# window and then posted as one digest ("12 scans fired on 09:20 candle").
+# Per-scan windows go in the "chartink_throttle" section: {"SCAN NAME": 120}.
+
+CHARTINK_DISCORD_ENABLED = os.getenv('CHARTINK_DISCORD_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+CHARTINK_DIGEST_WINDOW_SECONDS = float(os.getenv('CHARTINK_DIGEST_WINDOW_SECONDS', 60))
+CHARTINK_CANDLE_MINUTES = int(os.getenv('CHARTINK_CANDLE_MINUTES', 5))
+MARKET_TIMEZONE = ZoneInfo(os.getenv('MARKET_TIMEZONE', 'Asia/Kolkata'))
+
+
+def _candle_label(ts: datetime) -> str:
+    """
+    Start of the candle an alert received at ts fired on. ChartInk scans run
+    when a candle closes, so on 5m candles anything received 09:25-09:29 is
+    for the 09:20 candle.
+    """
+    ts -= timedelta(minutes=CHARTINK_CANDLE_MINUTES)
+    minute = (ts.minute // CHARTINK_CANDLE_MINUTES) * CHARTINK_CANDLE_MINUTES
+    return ts.replace(minute=minute).strftime('%H:%M')
+
+
+def _format_stock_list(stocks: List[str], prices: List[float], limit: int = 15) -> str:
+    items = [f"{s}@{p}" for s, p in zip(stocks, prices)] if prices else list(stocks)
+    text = ', '.join(items[:limit])
+    if len(items) > limit:
+        text += f" +{len(items) - limit} more"
+    return text
+
+
+def _format_chartink_digest(alerts: List[Dict]) -> str:
+    """Compose one Discord message for a throttled batch of ChartInk alerts."""
+    if len(alerts) == 1:
+        alert = alerts[0]
+        lines = [
+            f"\U0001f4c8 **{alert['scan_name']}** ({_candle_label(alert['received_at'])} candle)",
+            f"{len(alert['stocks'])} stocks: {_format_stock_list(alert['stocks'], alert['trigger_prices'])}",
+        ]
+    else:
+        by_candle = {}
+        for alert in alerts:
+            by_candle.setdefault(_candle_label(alert['received_at']), []).append(alert)
+        lines = []
+        for candle, candle_alerts in by_candle.items():
+            if lines:
+                lines.append("")
+            lines.append(f"\U0001f4ca **{len(candle_alerts)} scans fired on {candle} candle**")
+            for alert in candle_alerts:
+                stock_list = _format_stock_list(alert['stocks'], alert['trigger_prices'], limit=8)
+                lines.append(f"\u2022 **{alert['scan_name']}** \u2014 {len(alert['stocks'])} stocks: {stock_list}")
+
+    message = '\n'.join(lines)
+    if len(message) > 1950:
+        message = message[:1935].rstrip() + '\n\u2026 [truncated]'
+    return message
+
+
+class ChartInkDigestBuffer:
+    """
+    Collapse bursts of ChartInk alerts into one Discord message per destination.
+    The first alert for a destination opens a throttle window; everything that
+    arrives before it closes goes out in the same digest.
+
+    Pending alerts are queued in the shared state store and the window is a
+    store key, so with several instances exactly one of them owns each window
+    and posts the digest for alerts received by all of them.
+    """
+
+    def __init__(self, store, window_seconds: float):
+        self.store = store
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._timers = {}  # webhook_url -> (label, timer) for windows this worker owns
+
+    @staticmethod
+    def _queue_key(webhook_url: str) -> str:
+        return 'chartink:digest:' + hashlib.sha1(webhook_url.encode()).hexdigest()[:16]
+
+    def add(self, label: str, webhook_url: str, alert: Dict, window_seconds: Optional[float] = None) -> None:
+        window = self.window_seconds if window_seconds is None else window_seconds
+        if window <= 0:
+            deliver_to_discord([(label, webhook_url)], {'content': _format_chartink_digest([alert]), 'username': 'ChartInk'})
+            return
+        queue_key = self._queue_key(webhook_url)
+        self.store.push(queue_key, json.dumps({**alert, 'received_at': alert['received_at'].isoformat()}))
+        if self.store.add_if_absent(queue_key + ':window', '1', ttl=window):
+            timer = threading.Timer(window, self.flush, args=(label, webhook_url))
+            timer.daemon = True
+            with self._lock:
+                self._timers[webhook_url] = (label, timer)
+            timer.start()
+
+    def flush(self, label: str, webhook_url: str) -> Optional[List[Dict]]:
+        with self._lock:
+            owned = self._timers.pop(webhook_url, None)
+        if owned:
+            owned[1].cancel()  # no-op when called from the timer itself
+
+        queue_key = self._queue_key(webhook_url)
+        self.store.delete(queue_key + ':window')
+        alerts = []
+        while True:
+            batch = self.store.pop(queue_key, 500)
+            if not batch:
+                break
+            for raw in batch:
+                alert = json.loads(raw)
+                alert['received_at'] = datetime.fromisoformat(alert['received_at'])
+                alerts.append(alert)
+        if not alerts:
+            return None
+
+        message = _format_chartink_digest(alerts)
+        # The digest joins the trace of its first alert; the rest are listed
+        traced = [a['traceparent'] for a in alerts if a.get('traceparent')]
+        with tracer.start_trace('chartink.digest', traced[0] if traced else None, {'alerts': len(alerts)}) as digest_span:
+            digest_span.set('linked_traces', ','.join(t.split('-')[1] for t in traced[1:20]))
+            deliveries = deliver_to_discord([(label, webhook_url)], {'content': message, 'username': 'ChartInk'})
+        logger.info(f"ChartInk digest -> {label}: {len(alerts)} alerts, {deliveries}")
+        return deliveries
+
+    def flush_all(self) -> None:
+        """Flush every window this worker owns (e.g. before shutdown)"""
+        with self._lock:
+            owned = [(label, url) for url, (label, _) in self._timers.items()]
+        for label, webhook_url in owned:
+            self.flush(label, webhook_url)
+
+
+_chartink_digest = ChartInkDigestBuffer(state, CHARTINK_DIGEST_WINDOW_SECONDS)
+
+
+def publish_chartink_alert(alert_data: Dict) -> int:
+    """
+    Queue an accepted ChartInk alert for its mapped Discord channels.
+    Returns the number of destinations it was queued for.
+    """
+    scan_name = alert_data['scan_name']
+    destinations = resolve_destinations('chartink', scan_name, include_self=False)
+    if not destinations:
+        return 0
+
+    scan_key = scan_name.upper().replace("-", "_")
+    window = _routing_rules.get('chartink_throttle', {}).get(scan_key)
+    alert = {
+        'scan_name': scan_name,
+        'stocks': alert_data['stocks'],
+        'trigger_prices': alert_data['trigger_prices'],
+        'received_at': datetime.now(MARKET_TIMEZONE),
+        'traceparent': tracing.inject(),
+    }
+    for label, webhook_url in destinations:
+        _chartink_digest.add(label, webhook_url, alert, window)
+    return len(destinations)
+
+
+# ============================================
+# ChartInk Alert Stats (incremental rollups)
+# ============================================
+# Per-scan, per-interval rollups are updated in memory as alerts are stored
+# and flushed as deltas to chartink_alert_stats (see create_table.sql) by a
+# background thread, which then reloads the totals every worker has flushed.
+# /alerts/stats serves those from memory, so workers agree to within one
+# STATS_FLUSH_SECONDS; the summary table is the cross-worker source of truth.
+
+STATS_INTERVAL_MINUTES = int(os.getenv('STATS_INTERVAL_MINUTES', 1440))
+STATS_RETENTION_BUCKETS = int(os.getenv('STATS_RETENTION_BUCKETS', 7))
+STATS_FLUSH_SECONDS = float(os.getenv('STATS_FLUSH_SECONDS', 60))
+
+alert_stats = AlertAggregator(STATS_INTERVAL_MINUTES, STATS_RETENTION_BUCKETS, MARKET_TIMEZONE)
+
+
+def _load_alert_stats() -> List[Dict]:
+    cutoff = alert_stats.bucket_start(datetime.now(MARKET_TIMEZONE)) - alert_stats.interval * (STATS_RETENTION_BUCKETS - 1)
+    return storage.load_alert_stats(cutoff.isoformat())
+
+
+def record_alert_stats(alert_data: Dict) -> None:
+    """Fold a stored alert into the rollups, starting the flusher on first use"""
+    alert_stats.start_flusher(storage.merge_alert_stats, STATS_FLUSH_SECONDS, _load_alert_stats)
+    alert_stats.record(alert_data['scan_name'], alert_data['stocks'], alert_data['trigger_prices'])
+
+
+@app.route('/alerts/stats', methods=['GET'])
+def get_alert_stats():
+    """Per-scan rollups (alert count, distinct symbols, price stats) from memory"""
+    if alert_stats.loaded_at is None:
+        # First read in this worker: load what the others flushed rather than answer empty
+        try:
+            alert_stats.load(breakers['storage'].call(_load_alert_stats))
+        except Exception as e:
+            logger.warning(f"Could not load alert stats: {e}")
+    alert_stats.start_flusher(storage.merge_alert_stats, STATS_FLUSH_SECONDS, _load_alert_stats)
+    scan_name = request.args.get('scan_name')
+    top = min(request.args.get('top', 10, type=int), 100)
+    stats = alert_stats.snapshot(scan_name, top)
+    return jsonify({
+        'success': True,
+        'interval_minutes': STATS_INTERVAL_MINUTES,
+        'count': len(stats),
+        'stats': stats
+    }), 200
+
+
+# ============================================
+# Work Claims for Downstream Consumers
+# ============================================
+# Trading bots lease batches of processing_status='new' alerts instead of
+# polling the table and racing each other. Claims use FOR UPDATE SKIP LOCKED
+# with a visibility timeout (see claim_chartink_alerts in create_table.sql);
+# unacked leases expire and are redelivered. A claim with wait_seconds
+# long-polls: it sleeps until the ingest path stores a new alert (on this or,
+# through the shared state counter, any other instance) instead of having
+# consumers hammer an empty table.
+# Claims, acks and nacks change lease state, so they need a consumer token
+# from CLAIM_API_TOKENS (comma-separated while rotating) or ADMIN_TOKEN, sent
+# as Authorization: Bearer <token>. With neither set the API is disabled.
+
+CLAIM_API_TOKENS = tuple(token.encode() for token in webhook_auth.split_secrets(os.getenv('CLAIM_API_TOKENS')))
+CLAIM_MAX_BATCH = 100
+CLAIM_MAX_LEASE_SECONDS = 3600
+CLAIM_MAX_WAIT_SECONDS = 25  # stay under gunicorn's 30s worker timeout
+CLAIM_MAX_WAITERS = int(os.getenv('CLAIM_MAX_WAITERS', 2))  # per worker, so long polls can't take every thread
+CLAIM_MAX_ATTEMPTS = int(os.getenv('CLAIM_MAX_ATTEMPTS', 5))
+_ALERT_SEQ_KEY = 'chartink:alerts:seq'
+
+_new_alerts = threading.Condition()
+_claim_waiters = threading.BoundedSemaphore(CLAIM_MAX_WAITERS)
+
+
+def notify_new_alerts() -> None:
+    """Wake long-polling claimers after an insert"""
+    bump_alerts_version()
+    try:
+        state.incr(_ALERT_SEQ_KEY)
+    except Exception as e:
+        logger.warning(f"Failed to publish new-alert signal: {e}")
+    with _new_alerts:
+        _new_alerts.notify_all()
+
+
+def _wait_for_new_alerts(timeout: float) -> bool:
+    """Block until a new alert is stored anywhere or timeout passes"""
+    deadline = time.monotonic() + timeout
+    try:
+        seen = state.get(_ALERT_SEQ_KEY)
+    except Exception:
+        seen = None
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or lifecycle.draining:
+            return False
+        with _new_alerts:
+            if _new_alerts.wait(min(remaining, 0.5)):
+                return True
+        try:
+            if state.get(_ALERT_SEQ_KEY) != seen:
+                return True
+        except Exception:
+            pass
+
+
+def _claim_denied():
+    """Error response for callers without a consumer or admin token, or None"""
+    if not CLAIM_API_TOKENS and not ADMIN_TOKEN:
+        return jsonify({'success': False, 'error': 'Claim API disabled (CLAIM_API_TOKENS not set)'}), 403
+    if _is_admin():
+        return None
+    auth = request.headers.get('Authorization', '')
+    supplied = auth[7:].encode() if auth.startswith('Bearer ') else b''
+    matched = False
+    for token in CLAIM_API_TOKENS:  # no early exit, like webhook_auth
+        matched |= hmac.compare_digest(token, supplied)
+    return None if matched else (jsonify({'success': False, 'error': 'Unauthorized'}), 401)
+
+
+def _parse_claim_request() -> Tuple[Dict, str]:
+    body = request.get_json(silent=True) or {}
+    consumer = body.get('consumer')
+    if not consumer or not isinstance(consumer, str):
+        raise ValueError("consumer is required")
+    return body, consumer
+
+
+def _parse_ids(body: Dict) -> List[int]:
+    ids = body.get('ids')
+    if not isinstance(ids, list) or not ids:
+        raise ValueError("ids must be a non-empty list")
+    return [int(i) for i in ids]
+
+
+@app.route('/alerts/claim', methods=['POST'])
+def claim_alerts():
+    """Lease a batch of new alerts to a consumer, optionally long-polling for work"""
+    denied = _claim_denied()
+    if denied:
+        return denied
+    try:
+        body, consumer = _parse_claim_request()
+        batch_size = max(1, min(int(body.get('batch_size', 10)), CLAIM_MAX_BATCH))
+        lease_seconds = max(1, min(int(body.get('lease_seconds', 60)), CLAIM_MAX_LEASE_SECONDS))
+        wait_seconds = max(0.0, min(float(body.get('wait_seconds', 0)), CLAIM_MAX_WAIT_SECONDS))
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        alerts = breakers['storage'].call(storage.claim_alerts, consumer, batch_size, lease_seconds, CLAIM_MAX_ATTEMPTS)
+        if not alerts and wait_seconds > 0 and _claim_waiters.acquire(blocking=False):
+            try:
+                deadline = time.monotonic() + wait_seconds
+                while not alerts:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not _wait_for_new_alerts(remaining):
+                        break
+                    alerts = breakers['storage'].call(storage.claim_alerts, consumer, batch_size, lease_seconds, CLAIM_MAX_ATTEMPTS)
+            finally:
+                _claim_waiters.release()
+
+        if alerts:
+            bump_alerts_version()
+        return jsonify({
+            'success': True,
+            'consumer': consumer,
+            'count': len(alerts),
+            'lease_seconds': lease_seconds,
+            'alerts': alerts
+        }), 200
+    except CircuitOpenError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503, {'Retry-After': str(int(e.retry_after) + 1)}
+    except Exception as e:
+        logger.error(f"Error claiming alerts for {consumer}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/alerts/ack', methods=['POST'])
+def ack_alerts():
+    """Mark leased alerts processed"""
+    denied = _claim_denied()
+    if denied:
+        return denied
+    try:
+        body, consumer = _parse_claim_request()
+        ids = _parse_ids(body)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        acked = breakers['storage'].call(storage.ack_alerts, consumer, ids)
+        if acked:
+            bump_alerts_version()
+        return jsonify({'success': True, 'acked': acked, 'not_held': sorted(set(ids) - set(acked))}), 200
+    except CircuitOpenError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503, {'Retry-After': str(int(e.retry_after) + 1)}
+    except Exception as e:
+        logger.error(f"Error acking alerts for {consumer}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/alerts/nack', methods=['POST'])
+def nack_alerts():
+    """Release leased alerts for redelivery, optionally after a delay"""
+    denied = _claim_denied()
+    if denied:
+        return denied
+    try:
+        body, consumer = _parse_claim_request()
+        ids = _parse_ids(body)
+        delay_seconds = max(0, min(int(body.get('delay_seconds', 0)), CLAIM_MAX_LEASE_SECONDS))
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        nacked = breakers['storage'].call(storage.nack_alerts, consumer, ids, delay_seconds, CLAIM_MAX_ATTEMPTS)
+        if nacked:
+            bump_alerts_version()
+        return jsonify({'success': True, 'nacked': nacked, 'not_held': sorted(set(ids) - set(nacked))}), 200
+    except CircuitOpenError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503, {'Retry-After': str(int(e.retry_after) + 1)}
+    except Exception as e:
+        logger.error(f"Error nacking alerts for {consumer}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ============================================
+# Fallbacks and Recovery
+# ============================================
+# When a breaker is open or a dependency times out, work is parked instead of
+# failing the request: ChartInk alerts go to the local spool file and Discord
+# messages to the shared "discord:retry" queue. A background loop (started
+# lazily, once per worker) replays both once the dependency recovers.
+# Breaker state, timeouts and backlog depths are exposed at /health and
+# /metrics.
+
+RECOVERY_INTERVAL_SECONDS = float(os.getenv('RECOVERY_INTERVAL_SECONDS', 5))
+DISCORD_MAX_ATTEMPTS = int(os.getenv('DISCORD_MAX_ATTEMPTS', 5))
+_DISCORD_RETRY_KEY = 'discord:retry'
+
+_recovery_thread = None
+_recovery_lock = threading.Lock()
+
+
+def spool_alert(alert_data: Dict) -> None:
+    alert_spool.append({
+        'alert': alert_data,
+        'spooled_at': time.time(),
+        'request_id': tracing.get_request_id(),
+        'traceparent': tracing.inject(),
+    })
+    metrics.inc('fallback_total', {'dependency': 'storage', 'action': 'spooled'})
+    start_recovery()
+
+
+def queue_discord_message(webhook_url: str, discord_payload: Dict, retry_after: float = 1.0,
+                          attempts: int = 0) -> None:
+    state.push(_DISCORD_RETRY_KEY, json.dumps({
+        'url': webhook_url,
+        'payload': discord_payload,
+        'attempts': attempts,
+        'not_before': time.time() + retry_after,
+        'request_id': tracing.get_request_id(),
+        'traceparent': tracing.inject(),
+    }))
+    metrics.inc('fallback_total', {'dependency': 'discord', 'action': 'queued'})
+    start_recovery()
+
+
+def _replay_spooled_alert(record: Dict) -> bool:
+    alert_data = record['alert']
+    tracing.set_request_id(record.get('request_id'))
+    with tracer.start_trace('chartink.spool_replay', record.get('traceparent')):
+        with tracing.span('storage.insert', {'backend': STORAGE_BACKEND}):
+            row = breakers['storage'].call(storage.insert_alert, alert_data)
+        if not row:
+            raise ValueError(f"Storage returned no row for spooled alert {alert_data.get('scan_name')}")
+        ChartInkWebhookProcessor.after_store(alert_data)
+    metrics.inc('fallback_replayed_total', {'dependency': 'storage'})
+    return True
+
+
+def _reject_spooled_alert(record: Dict, error: Exception) -> None:
+    """A spooled alert storage refused for good; it was moved to the .rejected file"""
+    metrics.inc('fallback_total', {'dependency': 'storage', 'action': 'rejected'})
+
+
+def _replay_discord_queue(deadline: Optional[float] = None) -> int:
+    """
+    Retry queued Discord messages that are due. Returns messages delivered.
+    Messages still unsent at deadline (time.monotonic()) are put back.
+    """
+    now = time.time()
+    delivered = 0
+    deferred = []
+    for raw in state.pop(_DISCORD_RETRY_KEY, 100):
+        message = json.loads(raw)
+        if (message['not_before'] > now or breakers['discord'].state == OPEN
+                or deadline is not None and time.monotonic() >= deadline):
+            deferred.append(raw)
+            continue
+        tracing.set_request_id(message.get('request_id'))
+        with tracer.start_trace('discord.retry', message.get('traceparent')):
+            result, retry_after = _send_to_discord(message['url'], message['payload'], message['attempts'] + 2)
+        if retry_after is None:
+            if 'error' in result or result['discord_status'] >= 400:
+                logger.error(f"Dropping queued Discord message: {result}")
+            else:
+                delivered += 1
+                metrics.inc('fallback_replayed_total', {'dependency': 'discord'})
+        elif message['attempts'] + 1 >= DISCORD_MAX_ATTEMPTS:
+            logger.error(f"Giving up on Discord message after {DISCORD_MAX_ATTEMPTS} attempts: {result}")
+            metrics.inc('fallback_dropped_total', {'dependency': 'discord'})
+        else:
+            message['attempts'] += 1
+            message['not_before'] = now + max(retry_after, 2 ** message['attempts'])
+            deferred.append(json.dumps(message))
+    for raw in deferred:
+        state.push(_DISCORD_RETRY_KEY, raw)
+    return delivered
+
+
+def _recovery_loop() -> None:
+    while not lifecycle.wait_for_drain(RECOVERY_INTERVAL_SECONDS):  # the drain steps take over
+        try:
+            if breakers['storage'].state != OPEN and alert_spool.count():
+                done, remaining = alert_spool.drain(_replay_spooled_alert, on_reject=_reject_spooled_alert)
+                if done:
+                    logger.info(f"Replayed {done} spooled alerts, {remaining} left")
+        except Exception as e:
+            logger.error(f"Alert spool replay failed: {e}")
+        try:
+            delivered = _replay_discord_queue()
+            if delivered:
+                logger.info(f"Delivered {delivered} queued Discord messages")
+        except Exception as e:
+            logger.error(f"Discord queue replay failed: {e}")
+
+
+def start_recovery() -> None:
+    """Start the replay loop once per worker process"""
+    global _recovery_thread
+    if _recovery_thread is not None:
+        return
+    with _recovery_lock:
+        if _recovery_thread is not None:
+            return
+        _recovery_thread = threading.Thread(target=_recovery_loop, name='fallback-recovery', daemon=True)
+        _recovery_thread.start()
+
+
+def fallback_depths() -> Dict[str, Optional[int]]:
+    try:
+        queued = state.queue_length(_DISCORD_RETRY_KEY)
+    except Exception:
+        queued = None
+    return {'spooled_alerts': alert_spool.count(), 'queued_discord_messages': queued}
+
+
+def _resilience_metrics():
+    for name, breaker in breakers.items():
+        snapshot = breaker.snapshot()
+        labels = {'dependency': name}
+        yield 'circuit_state', labels, STATE_CODES[snapshot['state']]
+        yield 'circuit_rejected_calls', labels, snapshot['rejected']
+        yield 'dependency_timeout_seconds', labels, snapshot['timeout_seconds']
+        if snapshot['p99_seconds'] is not None:
+            yield 'dependency_latency_p99_seconds', labels, snapshot['p99_seconds']
+    for name, depth in fallback_depths().items():
+        if depth is not None:
+            yield name, {}, depth
+
+
+metrics.describe('circuit_state', 'Circuit breaker state (0 closed, 1 half-open, 2 open)')
+metrics.describe('circuit_rejected_calls', 'Calls failed fast by an open circuit')
+metrics.describe('dependency_timeout_seconds', 'Current adaptive timeout per dependency')
+metrics.describe('dependency_latency_p99_seconds', 'Observed p99 call latency per dependency')
+metrics.describe('fallback_total', 'Work parked because a dependency was unavailable')
+metrics.describe('fallback_replayed_total', 'Parked work replayed after recovery')
+metrics.describe('fallback_dropped_total', 'Parked work dropped after too many attempts')
+metrics.describe('spooled_alerts', 'ChartInk alerts waiting in the local spool')
+metrics.describe('queued_discord_messages', 'Discord messages waiting in the retry queue')
+metrics.register_collector(_resilience_metrics)
+
+
+# ============================================
+# Graceful Shutdown and Resume
+# ============================================
+# On SIGTERM (see gunicorn.conf.py) the worker stops taking new work:
+# /health answers 503 "draining", claim long polls return and the recovery
+# loop stops. gunicorn closes the listener and finishes in-flight requests,
+# then the drain steps below run within SHUTDOWN_DRAIN_SECONDS of the
+# signal: spooled alerts are stored first (publishing them may open new
+# digests), then open ChartInk digests are posted, in-flight deliveries
+# finish (or, if they have not started in time, go to the retry queue), due
+# Discord retries are sent and alert stats are flushed. Whatever
+# is still pending and would die with the process (stats deltas, and the
+# Discord retry queue when state is per-worker) goes to SHUTDOWN_SPOOL_FILE;
+# spooled alerts stay in ALERT_SPOOL_FILE. The next worker to boot resumes
+# both, so keep the two files on a volume that survives the deploy.
+
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv('SHUTDOWN_DRAIN_SECONDS', 25))
+SHUTDOWN_SPOOL_FILE = os.getenv('SHUTDOWN_SPOOL_FILE', os.path.join(tempfile.gettempdir(), 'chartink_shutdown.jsonl'))
+shutdown_spool = LocalSpool(SHUTDOWN_SPOOL_FILE)
+lifecycle = Lifecycle(SHUTDOWN_DRAIN_SECONDS)
+
+
+def _drain_chartink_digests(deadline: float) -> str:
+    _chartink_digest.flush_all()  # failed posts land in the Discord retry queue
+    return 'flushed'
+
+
+def _drain_discord_queue(deadline: float) -> str:
+    delivered = 0
+    # Keep one Discord timeout in hand for the steps after this one
+    while time.monotonic() < deadline - DISCORD_TIMEOUT_SECONDS and state.queue_length(_DISCORD_RETRY_KEY):
+        sent = _replay_discord_queue(deadline - DISCORD_TIMEOUT_SECONDS)
+        if not sent:
+            break
+        delivered += sent
+    if _SHARED_STATE:
+        return f"{delivered} delivered, the rest stay in the shared queue"
+    persisted = 0
+    while True:
+        batch = state.pop(_DISCORD_RETRY_KEY, 500)
+        if not batch:
+            break
+        for raw in batch:
+            shutdown_spool.append({'kind': 'discord', 'message': json.loads(raw)})
+        persisted += len(batch)
+    return f"{delivered} delivered, {persisted} persisted"
+
+
+def _drain_delivery_pool(deadline: float) -> str:
+    # Keep a second for the Discord queue step to persist what this one queues
+    unsent = _delivery_pool.shutdown(timeout=max(0.0, deadline - 1 - time.monotonic()))
+    for _, (webhook_url, discord_payload), _ in unsent:
+        queue_discord_message(webhook_url, discord_payload, retry_after=0)
+    return f"{len(unsent)} queued, {_delivery_pool.pending()} still sending"
+
+
+def _drain_alert_spool(deadline: float) -> str:
+    if breakers['storage'].state == OPEN or not alert_spool.count():
+        return f"{alert_spool.count()} kept"
+
+    # Leave time for the Discord steps after this one to post what it
+    # publishes, but at most half of what is left
+    stop_at = max(deadline - 2 * DISCORD_TIMEOUT_SECONDS - 1, (time.monotonic() + deadline) / 2)
+
+    def replay_until_deadline(record: Dict) -> bool:
+        return time.monotonic() < stop_at and _replay_spooled_alert(record)
+
+    done, remaining = alert_spool.drain(replay_until_deadline, on_reject=_reject_spooled_alert)
+    return f"{done} stored, {remaining} kept"
+
+
+def _drain_alert_stats(deadline: float) -> str:
+    flushed = alert_stats.flush(lambda deltas: breakers['storage'].call(storage.merge_alert_stats, deltas))
+    deltas = alert_stats.drain_deltas()  # left behind by a failed flush
+    if deltas:
+        shutdown_spool.append({'kind': 'stats', 'deltas': deltas})
+    return f"{flushed} flushed, {len(deltas)} persisted"
+
+
+def _drain_traces(deadline: float) -> str:
+    tracer.flush()
+    return 'flushed'
+
+
+lifecycle.on_drain('alert_spool', _drain_alert_spool, order=10)
+lifecycle.on_drain('chartink_digests', _drain_chartink_digests, order=20)
+lifecycle.on_drain('delivery_pool', _drain_delivery_pool, order=30)
+lifecycle.on_drain('discord_queue', _drain_discord_queue, order=40)
+lifecycle.on_drain('alert_stats', _drain_alert_stats, order=50)
+lifecycle.on_drain('traces', _drain_traces, order=90)
+atexit.register(lifecycle.drain)  # outside gunicorn (python webhook_server.py)
+
+
+def _resume_record(record: Dict) -> bool:
+    if record['kind'] == 'discord':
+        state.push(_DISCORD_RETRY_KEY, json.dumps(record['message']))
+    elif record['kind'] == 'stats':
+        alert_stats.restore(record['deltas'])
+        alert_stats.start_flusher(storage.merge_alert_stats, STATS_FLUSH_SECONDS, _load_alert_stats)
+    return True
+
+
+def resume_after_restart() -> None:
+    """Pick up work persisted by a previous worker's shutdown"""
+    try:
+        resumed, _ = shutdown_spool.drain(_resume_record)
+        if resumed:
+            logger.info(f"Resumed {resumed} records from {SHUTDOWN_SPOOL_FILE}")
+        if resumed or alert_spool.count():
+            start_recovery()
+    except Exception as e:
+        logger.error(f"Failed to resume from shutdown spool: {e}")
+
+
+resume_after_restart()
+
+
+# ============================================
+# Dead Letters and Admin API
+# ============================================
+# Any ChartInk, TradingView or Notion request answered with an error status
+# is kept in the dead-letter store (see dead_letters.py) with its raw body,
+# path, headers and error. Entries can be listed and bulk-replayed through
+# the same route, here or with the dead_letters.py CLI. Admin endpoints need
+# ADMIN_TOKEN (Authorization: Bearer <token> or X-Admin-Token) and are
+# disabled when it is unset.
+
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+DEAD_LETTER_ROUTES = ('/webhook/chartink', '/webhook/tradingview', '/webhook/notion')
+DEAD_LETTER_RATE_LIMITED_ROUTES = ('/webhook/chartink',)  # senders that never retry a 429
+DEAD_LETTER_MAX_REPLAY = 1000
+
+dead_letters = create_dead_letter_store()
+metrics.describe('dead_letters_total', 'Webhook requests kept in the dead-letter store')
+_replay_job = {'running': False, 'summary': None}
+_replay_job_lock = threading.Lock()
+
+
+def _is_admin() -> bool:
+    if not ADMIN_TOKEN:
+        return False
+    auth = request.headers.get('Authorization', '')
+    supplied = auth[7:] if auth.startswith('Bearer ') else request.headers.get(ADMIN_HEADER, '')
+    return hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+
+
+def _admin_denied():
+    """Error response for non-admin callers, or None"""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin API disabled (ADMIN_TOKEN not set)'}), 403
+    if not _is_admin():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
+
+@app.after_request
+def _dead_letter_failures(response):
+    """Keep failed webhook requests; mark replayed ones with their new outcome"""
+    if request.method != 'POST' or request.path not in DEAD_LETTER_ROUTES:
+        return response
+    if g.get('auth_rejected'):  # not worth keeping
+        return response
+    if g.get('rate_limited') and request.path not in DEAD_LETTER_RATE_LIMITED_ROUTES:
+        return response
+    replay_id = request.headers.get(REPLAY_HEADER)
+    if response.status_code < 400 and not replay_id:
+        return response
+
+    body = response.get_json(silent=True) if response.is_json else None
+    error = (body or {}).get('error') or response.status
+    try:
+        if replay_id and _is_admin():
+            if response.status_code < 300:
+                dead_letters.mark(int(replay_id), REPLAYED, response.status_code)
+            else:
+                dead_letters.mark(int(replay_id), FAILED, response.status_code, str(error))
+        elif response.status_code >= 400:
+            entry_id = dead_letters.record(
+                request.path, request.full_path.rstrip('?'), request.get_data(as_text=True),
+                str(error), response.status_code, dict(request.headers),
+            )
+            metrics.inc('dead_letters_total', {'route': request.path})
+            logger.warning(f"Dead-lettered {request.path} request as #{entry_id}: {error}")
+    except Exception as e:
+        logger.error(f"Failed to write dead letter for {request.path}: {e}")
+    return response
+
+
+def _replay_in_process(entry: Dict) -> Tuple[int, str]:
+    """Send a dead letter back through its route, exactly as the original request"""
+    headers = {**entry.get('headers', {}), REPLAY_HEADER: str(entry['id']), ADMIN_HEADER: ADMIN_TOKEN}
+    resp = app.test_client().post(entry['path'], data=entry['body'].encode(), headers=headers)
+    return resp.status_code, resp.get_data(as_text=True)
+
+
+def _dead_letter_filters(args: Dict) -> Dict:
+    def epoch(value):
+        if value in (None, ''):
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value).timestamp()
+
+    ids = args.get('ids')
+    return {
+        'route': args.get('route'),
+        'status': args.get('status'),
+        'since': epoch(args.get('since')),
+        'until': epoch(args.get('until')),
+        'error_contains': args.get('error'),
+        'ids': [int(i) for i in ids] if ids else None,
+    }
+
+
+@app.route('/admin/dead-letters', methods=['GET'])
+def list_dead_letters():
+    """Filter dead letters by route, status, time window (since/until) and error text"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    try:
+        filters = _dead_letter_filters(request.args)
+        limit = min(request.args.get('limit', 100, type=int), DEAD_LETTER_MAX_REPLAY)
+        entries = dead_letters.list(**filters, limit=limit,
+                                    with_payload=request.args.get('payload', '').lower() in ('1', 'true'))
+    except (KeyError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid filter: {e}'}), 400
+    return jsonify({'success': True, 'count': len(entries), 'entries': entries}), 200
+
+
+@app.route('/admin/dead-letters/<int:entry_id>', methods=['GET'])
+def get_dead_letter(entry_id):
+    denied = _admin_denied()
+    if denied:
+        return denied
+    entry = dead_letters.get(entry_id)
+    if not entry:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(entry), 200
+
+
+@app.route('/admin/dead-letters/<int:entry_id>/discard', methods=['POST'])
+def discard_dead_letter(entry_id):
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if not dead_letters.get(entry_id):
+        return jsonify({'error': 'Not found'}), 404
+    dead_letters.mark(entry_id, DISCARDED)
+    return jsonify({'success': True, 'id': entry_id}), 200
+
+
+@app.route('/admin/dead-letters/replay', methods=['GET', 'POST'])
+def replay_dead_letters():
+    """
+    POST starts a background replay of matching entries (default: pending
+    and failed) at `rate` requests/second with `workers` in parallel.
+    GET returns the state of the last replay in this worker.
+    """
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if request.method == 'GET':
+        return jsonify({'success': True, **_replay_job}), 200
+
+    body = request.get_json(silent=True) or {}
+    try:
+        filters = _dead_letter_filters(body)
+        if not filters['status'] and not filters['ids']:
+            filters['status'] = 'pending,failed'
+        limit = max(1, min(int(body.get('limit', 100)), DEAD_LETTER_MAX_REPLAY))
+        rate = max(0.1, min(float(body.get('rate', 5)), 50))
+        workers = max(1, min(int(body.get('workers', 4)), DELIVERY_MAX_WORKERS))
+        entries = dead_letters.list(**filters, limit=limit, with_payload=True)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid request: {e}'}), 400
+    if not entries:
+        return jsonify({'success': True, 'replaying': 0}), 200
+
+    with _replay_job_lock:
+        if _replay_job['running']:
+            return jsonify({'success': False, 'error': 'A replay is already running'}), 409
+        _replay_job.update(running=True, summary=None, started_at=datetime.now().isoformat(), count=len(entries))
+
+    def run():
+        try:
+            summary = replay_entries(dead_letters, entries, _replay_in_process, rate, workers)
+            logger.info(f"Dead-letter replay finished: {summary['succeeded']} ok, {summary['failed']} failed")
+        except Exception as e:
+            logger.error(f"Dead-letter replay failed: {e}")
+            summary = {'error': str(e)}
+        _replay_job.update(running=False, summary=summary)
+
+    threading.Thread(target=run, name='dead-letter-replay-job', daemon=True).start()
+    return jsonify({
+        'success': True,
+        'replaying': len(entries),
+        'first_id': entries[0]['id'],
+        'last_id': entries[-1]['id'],
+        'estimated_seconds': round(len(entries) / rate, 1)
+    }), 202
+
+
+# ============================================
+# Profiling (admin)
+# ============================================
+# GET /admin/profile samples every thread of the worker that serves it for
+# `seconds` and returns collapsed stacks or a speedscope profile. POST
+# /admin/profile/requests arms cProfile for the next `count` requests to a
+# route in this worker; reports are read back with GET. Each gunicorn worker
+# profiles only itself (the response says which pid).
+
+PROFILE_MAX_SECONDS = 25  # stay under gunicorn's 30s worker timeout
+
+request_profiler = RequestProfiler()
+
+
+@app.before_request
+def _start_request_profile():
+    profile = request_profiler.start(request.path)
+    if profile is not None:
+        g.request_profile = (profile, time.perf_counter())
+
+
+@app.teardown_request
+def _finish_request_profile(exc):
+    started = g.pop('request_profile', None)
+    if started is not None:
+        profile, start = started
+        request_profiler.finish(profile, request.path, (time.perf_counter() - start) * 1000, g.get('request_id'))
+
+
+@app.route('/admin/profile', methods=['GET'])
+def sample_profile():
+    """Sample all threads: ?seconds=10&interval_ms=5&format=collapsed|speedscope&idle=0"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    try:
+        seconds = max(0.1, min(float(request.args.get('seconds', 10)), PROFILE_MAX_SECONDS))
+        interval = max(1.0, float(request.args.get('interval_ms', 5))) / 1000
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    output = request.args.get('format', 'collapsed')
+    include_idle = request.args.get('idle', '').lower() in ('1', 'true')
+
+    try:
+        profile = SamplingProfiler(interval, include_idle).run(seconds)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    headers = {
+        'X-Profile-Pid': str(os.getpid()),
+        'X-Profile-Samples': str(profile.sample_count),
+        'X-Profile-Seconds': f"{profile.duration:.2f}",
+    }
+    if output == 'speedscope':
+        return jsonify(profile.speedscope(f"pid {os.getpid()}")), 200, headers
+    return profile.collapsed(), 200, {**headers, 'Content-Type': 'text/plain; charset=utf-8'}
+
+
+@app.route('/admin/profile/requests', methods=['GET', 'POST'])
+def profile_requests():
+    """POST {"route": "/webhook/chartink", "count": 1} arms cProfile; GET returns reports"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        route = body.get('route')
+        if not route or not isinstance(route, str):
+            return jsonify({'error': 'route is required'}), 400
+        count = max(1, min(int(body.get('count', 1)), 10))
+        request_profiler.arm(route, count)
+        return jsonify({'success': True, 'pid': os.getpid(), 'armed': request_profiler.armed()}), 200
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'armed': request_profiler.armed(),
+        'results': list(request_profiler.results)
+    }), 200
+
+
 # ============================================
 # Notion -> Discord Bridge (Citadel Roadmap automations)
 # ============================================
@@ -482,8 +2217,8 @@ def _extract_notion_property(props, name, ptype):
     return None
 
 
-_notion_page_cache = {}
 _NOTION_CACHE_TTL = 600
+NOTION_API_URL = os.getenv('NOTION_API_URL', 'https://api.notion.com')  # overridable for simulation/
 
 
 def _fetch_notion_page_title(page_id):
@@ -493,26 +2228,34 @@ def _fetch_notion_page_title(page_id):
     if not page_id:
         return None, None
 
-    import time
-    now = time.time()
-    cached = _notion_page_cache.get(page_id)
-    if cached and (now - cached[0]) < _NOTION_CACHE_TTL:
-        return cached[1], cached[2]
+    cache_key = f"notion:page:{page_id}"
+    try:
+        cached = state.get(cache_key)
+        if cached:
+            title, url = json.loads(cached)
+            return title, url
+    except Exception as e:
+        logger.warning(f"State store unavailable for Notion cache: {e}")
 
     fallback_url = f"https://www.notion.so/{page_id.replace('-', '')}"
     token = os.getenv('NOTION_TOKEN')
     if not token:
         return None, fallback_url
 
+    breaker = breakers['notion']
     try:
-        resp = http_requests.get(
-            f"https://api.notion.com/v1/pages/{page_id}",
-            headers={
-                'Authorization': f"Bearer {token}",
-                'Notion-Version': '2022-06-28',
-            },
-            timeout=1.5,
-        )
+        with tracing.span('notion.fetch_page', {'timeout': breaker.timeout()}) as fetch_span:
+            resp = breaker.call(
+                http_requests.get,
+                f"{NOTION_API_URL}/v1/pages/{page_id}",
+                headers={
+                    'Authorization': f"Bearer {token}",
+                    'Notion-Version': '2022-06-28',
+                },
+                timeout=breaker.timeout(),
+                failure_if=lambda r: r.status_code >= 500,
+            )
+            fetch_span.set('http.status_code', resp.status_code)
         if resp.status_code != 200:
             return None, fallback_url
         data = resp.json()
@@ -524,7 +2267,10 @@ def _fetch_notion_page_title(page_id):
                 if arr:
                     title = arr[0].get('plain_text')
                 break
-        _notion_page_cache[page_id] = (now, title, url)
+        try:
+            state.set(cache_key, json.dumps([title, url]), ttl=_NOTION_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to cache Notion page {page_id}: {e}")
         return title, url
     except Exception as e:
         logger.warning(f"_fetch_notion_page_title failed for {page_id}: {e}")
@@ -643,11 +2389,13 @@ def notion_webhook():
     controls.discord_webhook_url).
     """
     try:
-        body = request.get_data(as_text=True).strip()
+        with tracing.span('read_body'):
+            body = request.get_data(as_text=True).strip()
         if not body:
             return jsonify({'error': 'Empty body'}), 400
         try:
-            payload = json.loads(body)
+            with tracing.span('parse_json', {'bytes': len(body)}):
+                payload = json.loads(body)
         except json.JSONDecodeError as e:
             logger.error(f"Notion webhook: invalid JSON: {e}")
             return jsonify({'error': 'Invalid JSON'}), 400
@@ -665,7 +2413,8 @@ def notion_webhook():
             logger.warning("Notion webhook: no properties found in payload")
             props = {}
 
-        message, summary = _build_notion_discord_message(page, props)
+        with tracing.span('notion.build_message'):
+            message, summary = _build_notion_discord_message(page, props)
 
         # Route by Builders Involved:
         #   0 builders -> BUILDER_INFRA
@@ -690,27 +2439,34 @@ def notion_webhook():
             return jsonify({'error': f'{target_strategy} webhook not configured'}), 500
 
         discord_payload = {'content': message, 'username': 'Citadel'}
-        resp = http_requests.post(webhook_url, json=discord_payload, timeout=5)
+        delivery = _post_to_discord(webhook_url, discord_payload)
         logger.info(
-            f"Notion -> Discord {target_strategy}: status={resp.status_code} "
+            f"Notion -> Discord {target_strategy}: {delivery} "
             f"plan_status={summary['plan_status']} item={summary['item']} "
             f"builders={builders}"
         )
 
-        if resp.status_code >= 400:
-            logger.error(f"Discord rejected Notion bridge message: {resp.text[:200]}")
+        if delivery.get('queued'):
+            return jsonify({
+                'success': True,
+                'routed_to': target_strategy,
+                'queued': True,
+                'summary': summary,
+            }), 202
+
+        if 'error' in delivery or delivery['discord_status'] >= 400:
+            logger.error(f"Discord rejected Notion bridge message: {delivery}")
             return jsonify({
                 'success': False,
                 'routed_to': target_strategy,
-                'discord_status': resp.status_code,
-                'discord_response': resp.text[:500],
+                **delivery,
                 'summary': summary,
             }), 502
 
         return jsonify({
             'success': True,
             'routed_to': target_strategy,
-            'discord_status': resp.status_code,
+            'discord_status': delivery['discord_status'],
             'summary': summary,
         }), 200
 
@@ -756,6 +2512,7 @@ def notion_test():
 
 if __name__ == '__main__':
     logger.info("Starting ChartInk Webhook Server...")
+    logger.info(f"Storage backend: {STORAGE_BACKEND}")
     logger.info(f"Supabase URL: {SUPABASE_URL}")
     
     # Get port from environment variable for Digital Ocean App Platform